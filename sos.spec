@@ -42,6 +42,7 @@ rm -rf ${RPM_BUILD_ROOT}
 %files -f %{name}.lang
 %defattr(-,root,root,-)
 %{_sbindir}/sosreport
+%{_sbindir}/sos-orchestrator
 %{_datadir}/%{name}
 %{python_sitelib}/*
 %{_mandir}/man1/*
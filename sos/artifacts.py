@@ -0,0 +1,208 @@
+"""
+Facts about the system that several plugins need. A plugin that provides an
+artifact collects it once and publishes it on the ArtifactBus, plugins that
+consume it read it back from the bus instead of deriving it again
+"""
+## artifacts.py
+## share collected facts between plugins
+
+### This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+from __future__ import with_statement
+
+import os
+import threading
+
+from sos.utilities import sosGetCommandOutput
+from sos.processes import Snapshot
+
+
+class ArtifactException(Exception):
+    pass
+
+
+def parse_lsmod(content):
+    """Returns the names of the modules listed in the output of lsmod"""
+    modules = []
+    for line in content.splitlines():
+        fields = line.split()
+        if fields and fields[0] != "Module":
+            modules.append(fields[0])
+    return modules
+
+
+def parse_mounts(content):
+    """Returns a (device, mount point, type, options) tuple for each line of
+    /proc/mounts"""
+    mounts = []
+    for line in content.splitlines():
+        fields = line.split()
+        if len(fields) >= 4:
+            mounts.append(tuple(fields[:4]))
+    return mounts
+
+
+def parse_partitions(content):
+    """Returns the device node of every entry in /proc/partitions"""
+    partitions = []
+    for line in content.splitlines():
+        fields = line.split()
+        if len(fields) == 4 and fields[0] != "major":
+            partitions.append("/dev/" + fields[3])
+    return partitions
+
+
+def block_holders(sysfs="/sys/block"):
+    """Returns a dictionary mapping the name of every block device and
+    partition to the names of the devices holding it, such as the dm and md
+    devices built on top of it"""
+    holders = {}
+    try:
+        disks = os.listdir(sysfs)
+    except OSError:
+        return holders
+    for disk in disks:
+        paths = [(disk, os.path.join(sysfs, disk))]
+        try:
+            paths.extend((entry, os.path.join(sysfs, disk, entry))
+                         for entry in os.listdir(os.path.join(sysfs, disk))
+                         if entry.startswith(disk))
+        except OSError:
+            pass
+        for name, path in paths:
+            try:
+                holders[name] = sorted(os.listdir(os.path.join(path, "holders")))
+            except OSError:
+                holders[name] = []
+    return holders
+
+
+def dm_slaves(holders):
+    """Returns the set of devices in a block_holders() map that are held by
+    a device-mapper device, such as the paths of a multipath device"""
+    return set(name for name, held_by in holders.iteritems()
+               if [holder for holder in held_by if holder.startswith("dm-")])
+
+
+class Artifact(object):
+    """Describes how an artifact is obtained: from the output of command,
+    from the content of the file at path or by calling function. parse turns
+    that raw content into the value plugins see."""
+
+    def __init__(self, name, command=None, path=None, parse=None, function=None,
+                 watched=False):
+        self.name = name
+        self.command = command
+        self.path = path
+        self.function = function
+        self.parse = parse or (lambda content: content)
+        # a watched function is passed the watchdog of the collection
+        self.watched = watched
+
+    def read(self, watchdog=None):
+        """Returns the raw content of the artifact without archiving it"""
+        if self.function:
+            if self.watched:
+                return self.function(watchdog)
+            return self.function()
+        if self.command:
+            status, output, runtime = sosGetCommandOutput(self.command)
+            if status != 0:
+                return ""
+            return output
+        try:
+            fp = open(self.path)
+            try:
+                return fp.read()
+            finally:
+                fp.close()
+        except IOError:
+            return ""
+
+
+def process_snapshot(watchdog=None):
+    """The process table, without looking at open files on the mounts
+    watchdog found hung"""
+    return Snapshot(is_hung=watchdog and watchdog.is_hung or None)
+
+
+artifacts = {}
+
+def register_artifact(artifact):
+    artifacts[artifact.name] = artifact
+
+register_artifact(Artifact("lsmod", command="/sbin/lsmod", parse=parse_lsmod))
+register_artifact(Artifact("ip_addr", command="/sbin/ip -o addr"))
+register_artifact(Artifact("mounts", path="/proc/mounts", parse=parse_mounts))
+register_artifact(Artifact("partitions", path="/proc/partitions",
+                           parse=parse_partitions))
+register_artifact(Artifact("block_holders", function=block_holders))
+register_artifact(Artifact("processes", function=process_snapshot, watched=True))
+
+
+class ArtifactBus(object):
+    """Holds the value of every artifact that has been published or
+    produced so far. An artifact that no plugin published by the time it is
+    asked for is produced by the bus itself, once, without being added to the
+    archive."""
+
+    def __init__(self, registry=None, watchdog=None):
+        if registry is None:
+            registry = artifacts
+        self.registry = registry
+        self.watchdog = watchdog
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def artifact(self, name):
+        try:
+            return self.registry[name]
+        except KeyError:
+            raise ArtifactException("unknown artifact: %s" % name)
+
+    def publish(self, name, content):
+        """Parses content with the artifact's parser and stores the result"""
+        value = self.artifact(name).parse(content)
+        with self.lock:
+            self.values[name] = value
+        return value
+
+    def get(self, name):
+        with self.lock:
+            if name not in self.values:
+                artifact = self.artifact(name)
+                self.values[name] = artifact.parse(artifact.read(self.watchdog))
+            return self.values[name]
+
+    def __contains__(self, name):
+        return name in self.values
+
+
+def plugin_dependencies(plugins):
+    """Takes a list of (name, plugin) tuples and returns a dictionary mapping
+    the name of every plugin to the names of the loaded plugins providing an
+    artifact it consumes."""
+    providers = {}
+    for plugname, plug in plugins:
+        for artifact in plug.provides:
+            providers.setdefault(artifact, []).append(plugname)
+
+    depends = {}
+    for plugname, plug in plugins:
+        depends[plugname] = set()
+        for artifact in plug.consumes:
+            depends[plugname].update(providers.get(artifact, ()))
+        depends[plugname].discard(plugname)
+    return depends
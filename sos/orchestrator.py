@@ -0,0 +1,347 @@
+"""
+Run sosreport on several targets at once and merge the results into a single
+archive with one subtree per target
+"""
+## orchestrator.py
+## collect sosreports from many targets concurrently
+
+### This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+# pylint: disable-msg = W0702
+# pylint: disable-msg = W0703
+
+from __future__ import with_statement
+
+import os
+import re
+import sys
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import logging
+from optparse import OptionParser
+from time import time, strftime, mktime
+
+from sos import _sos as _
+from sos.utilities import sosGetCommandOutput, checksum, parallel_map
+from sos.utilities import TarFileArchive
+
+# the name of the finished report is the only thing we need from the output
+# of a remote run
+ARCHIVE_RE = re.compile(r"(\S*sosreport-\S+\.(?:tar(?:\.\w+)?|zip))\s*$", re.MULTILINE)
+
+
+class TransportException(Exception):
+    pass
+
+
+class Transport(object):
+    """The base class for the ways a target can be reached. Subclasses must
+    implement run(), which executes a command on the target, and fetch(),
+    which copies a file from the target to a local path."""
+
+    name = "unset"
+
+    def __init__(self, target):
+        self.target = target
+
+    def sosreport_command(self, tmp_dir, args):
+        return " ".join(["sosreport", "--batch", "-z", "gzip",
+                         "--tmp-dir", tmp_dir] + list(args))
+
+    def run(self, command, timeout):
+        raise NotImplementedError
+
+    def fetch(self, path, dest, timeout=None):
+        raise NotImplementedError
+
+    def remove(self, path):
+        pass
+
+
+class LocalTransport(Transport):
+    """Runs commands directly on this host. The target is only used as a
+    label, which makes this transport a stand-in for testing the
+    orchestration without any remote hosts."""
+
+    name = "local"
+
+    def run(self, command, timeout):
+        return sosGetCommandOutput(command, timeout)
+
+    def fetch(self, path, dest, timeout=None):
+        shutil.copyfile(path, dest)
+
+    def remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+class SysrootTransport(LocalTransport):
+    """Runs sosreport inside the sysroot given as target with chroot. The
+    report is read back from the sysroot's temporary directory."""
+
+    name = "sysroot"
+
+    def sosreport_command(self, tmp_dir, args):
+        return "/usr/sbin/chroot %s %s" % (self.target,
+                super(SysrootTransport, self).sosreport_command(tmp_dir, args))
+
+    def _host_path(self, path):
+        return os.path.join(self.target, path.lstrip(os.sep))
+
+    def fetch(self, path, dest, timeout=None):
+        super(SysrootTransport, self).fetch(self._host_path(path), dest, timeout)
+
+    def remove(self, path):
+        super(SysrootTransport, self).remove(self._host_path(path))
+
+
+class SSHTransport(Transport):
+    """Runs sosreport over ssh in batch mode, so the target must accept key
+    based authentication, and copies the report back with scp. Remote
+    commands run under timeout(1), so that they are stopped on the target
+    as well when they run out of time."""
+
+    name = "ssh"
+
+    ssh_options = "-o BatchMode=yes -o ConnectTimeout=10"
+
+    def run(self, command, timeout):
+        # the local ssh is given a little longer to see the remote end stop
+        return sosGetCommandOutput("/usr/bin/ssh %s %s 'timeout -k 10 %d %s'"
+                % (self.ssh_options, self.target, timeout, command), timeout + 30)
+
+    def fetch(self, path, dest, timeout=None):
+        status, output, runtime = sosGetCommandOutput("/usr/bin/scp %s %s:%s %s"
+                % (self.ssh_options, self.target, path, dest), timeout)
+        if status != 0:
+            raise TransportException("unable to copy %s from %s: %s"
+                    % (path, self.target, output))
+
+    def remove(self, path):
+        self.run("rm -f %s %s.*" % (path, path), 60)
+
+
+transports = {
+    LocalTransport.name: LocalTransport,
+    SysrootTransport.name: SysrootTransport,
+    SSHTransport.name: SSHTransport,
+}
+
+
+class TargetResult(object):
+    """The outcome of running sosreport on one target"""
+
+    def __init__(self, target):
+        self.target = target
+        self.status = None
+        self.error = None
+        self.archive = None
+        self.local_archive = None
+        self.start = None
+        self.runtime = None
+
+    def ok(self):
+        return self.local_archive is not None
+
+
+class Orchestrator(object):
+    """Collects sosreports from a list of targets through a transport. At
+    most parallel targets are collected at once and each of them is given
+    timeout seconds to finish."""
+
+    def __init__(self, targets, transport=LocalTransport, parallel=None,
+                 timeout=1800, tmp_dir=None, remote_tmp_dir="/var/tmp",
+                 sos_args=()):
+        self.targets = list(targets)
+        self.transport = transport
+        self.parallel = parallel or len(self.targets)
+        self.timeout = timeout
+        self.tmp_dir = tmp_dir or tempfile.gettempdir()
+        self.remote_tmp_dir = remote_tmp_dir
+        self.sos_args = sos_args
+        self.log = logging.getLogger('sos')
+
+    def collect_one(self, target):
+        result = TargetResult(target)
+        transport = self.transport(target)
+        result.start = time()
+        # running and fetching the report share one budget
+        deadline = result.start + self.timeout
+
+        def _remaining():
+            remaining = int(deadline - time())
+            if remaining <= 0:
+                raise TransportException("%s did not finish within %ds"
+                        % (target, self.timeout))
+            return remaining
+
+        try:
+            command = transport.sosreport_command(self.remote_tmp_dir, self.sos_args)
+            result.status, output, junk = transport.run(command, _remaining())
+            match = ARCHIVE_RE.search(output)
+            if result.status != 0 or not match:
+                raise TransportException("sosreport failed on %s (%s): %s"
+                        % (target, result.status, output[-512:]))
+            result.archive = match.group(1)
+            local = os.path.join(self.tmp_dir, "%s-%s" %
+                    (re.sub(r"[^\w.-]", "_", target), os.path.basename(result.archive)))
+            transport.fetch(result.archive, local, _remaining())
+            transport.remove(result.archive)
+            result.local_archive = local
+        except Exception, e:
+            result.error = str(e)
+            self.log.error(result.error)
+        result.runtime = time() - result.start
+        return result
+
+    def collect(self):
+        """Collect from every target and return a list of TargetResult
+        objects in the order of targets."""
+        return parallel_map(self.collect_one, self.targets, self.parallel)
+
+    def _add_members(self, archive, target, path):
+        """Copy every member of the report at path into archive below a
+        directory named after target, keeping their metadata and streaming
+        their content."""
+        subtree = re.sub(r"[^\w.-]", "_", target)
+
+        def _rename(name):
+            # drop the report's own top directory
+            parts = name.rstrip("/").split("/", 1)
+            return os.path.join(subtree, parts[1:] and parts[1] or "").rstrip("/")
+
+        if zipfile.is_zipfile(path):
+            zf = zipfile.ZipFile(path)
+            try:
+                for info in zf.infolist():
+                    tar_info = tarfile.TarInfo(_rename(info.filename))
+                    tar_info.mtime = mktime(info.date_time + (0, 0, -1))
+                    tar_info.mode = (info.external_attr >> 16) & 07777 or 0644
+                    if info.filename.endswith("/"):
+                        tar_info.type = tarfile.DIRTYPE
+                        archive.add_member(tar_info)
+                        continue
+                    tar_info.size = info.file_size
+                    fileobj = zf.open(info)
+                    try:
+                        archive.add_member(tar_info, fileobj)
+                    finally:
+                        fileobj.close()
+            finally:
+                zf.close()
+            return
+
+        tf = tarfile.open(path)
+        try:
+            for member in tf:
+                member.name = _rename(member.name)
+                if member.islnk():
+                    member.linkname = _rename(member.linkname)
+                if member.isfile():
+                    archive.add_member(member, tf.extractfile(member))
+                else:
+                    archive.add_member(member)
+        finally:
+            tf.close()
+
+    def manifest(self, results):
+        lines = []
+        for result in results:
+            if result.ok():
+                lines.append("%s\tok\t%.1fs\t%s\t%s" % (result.target,
+                    result.runtime, os.path.basename(result.archive),
+                    checksum(result.local_archive)))
+            else:
+                lines.append("%s\tfailed\t%.1fs\t%s" % (result.target,
+                    result.runtime, result.error))
+        return "\n".join(lines) + "\n"
+
+    def merge(self, results, name, method="auto"):
+        """Merge the reports of every successful target into one archive,
+        compress it with method and return the name of the result."""
+        archive = TarFileArchive(os.path.join(self.tmp_dir, name))
+        for result in results:
+            if not result.ok():
+                continue
+            try:
+                self._add_members(archive, result.target, result.local_archive)
+            except Exception, e:
+                result.error = "unable to merge %s: %s" % (result.local_archive, e)
+                result.local_archive = None
+                self.log.error(result.error)
+        archive.add_string(self.manifest(results), "manifest.txt")
+        for result in results:
+            if result.local_archive:
+                os.unlink(result.local_archive)
+        return archive.compress(method)
+
+
+def parse_options(args):
+    parser = OptionParser(usage="%prog [options] TARGET [TARGET ...] [-- SOSREPORT_OPTIONS]")
+    parser.add_option("-t", "--transport", dest="transport", default="ssh",
+                      help="how targets are reached [%s] (default=ssh)"
+                            % ", ".join(sorted(transports.keys())))
+    parser.add_option("-j", "--parallel", dest="parallel", type="int",
+                      help="number of targets to collect at once (default=all)")
+    parser.add_option("--timeout", dest="timeout", type="int", default=1800,
+                      help="seconds each target is given to finish (default=1800)")
+    parser.add_option("--tmp-dir", dest="tmp_dir", default=tempfile.gettempdir(),
+                      help="local directory for the merged archive")
+    parser.add_option("--remote-tmp-dir", dest="remote_tmp_dir", default="/var/tmp",
+                      help="directory on the targets for their reports")
+    parser.add_option("--name", dest="name", default="cluster",
+                      help="name used in the merged archive's file name")
+    parser.add_option("-z", "--compression-type", dest="compression_type",
+                      default="auto",
+                      help="compression of the merged archive [auto, gzip, bzip2, xz] (default=auto)")
+
+    if "--" in args:
+        index = args.index("--")
+        args, sos_args = args[:index], args[index + 1:]
+    else:
+        sos_args = []
+    opts, targets = parser.parse_args(args)
+    if not targets:
+        parser.error(_("no targets specified"))
+    if opts.transport not in transports:
+        parser.error(_("unknown transport: %s") % opts.transport)
+    return opts, targets, sos_args
+
+
+def main(args):
+    """The orchestrator entry point"""
+    logging.getLogger('sos').addHandler(logging.StreamHandler(sys.stderr))
+    opts, targets, sos_args = parse_options(args)
+
+    orchestrator = Orchestrator(targets, transports[opts.transport],
+            parallel=opts.parallel, timeout=opts.timeout, tmp_dir=opts.tmp_dir,
+            remote_tmp_dir=opts.remote_tmp_dir, sos_args=sos_args)
+    results = orchestrator.collect()
+    final_filename = orchestrator.merge(results, "sosreport-%s-%s" %
+            (opts.name, strftime("%Y%m%d%H%M%S")), opts.compression_type)
+
+    for result in results:
+        if result.ok():
+            print "  %-30s ok (%.1fs)" % (result.target, result.runtime)
+        else:
+            print "  %-30s failed: %s" % (result.target, result.error)
+    print
+    print _("The merged sosreport has been saved in:\n  %s") % final_filename
+    return final_filename
@@ -25,14 +25,21 @@
 # pylint: disable-msg = W0613
 from __future__ import with_statement
 
-from sos.utilities import sosGetCommandOutput, import_module, grep, fileobj, tail
+from sos.utilities import sosGetCommandOutput, run_command, import_module, grep, fileobj, tail
+from sos.utilities import parallel_map, pseudo_file_paths, read_pseudo_files
+from sos.utilities import aggregate_pseudo_files, get_hash_name, DigestReader
+from sos.utilities import PSEUDO_AGGREGATE_DIR
+from sos.utilities import ThrottledFile
+from sos.artifacts import ArtifactBus
 from sos import _sos as _
 import inspect
+import hashlib
 import os
 import sys
 import string
 import glob
 import re
+import fnmatch
 import traceback
 import shutil
 from stat import *
@@ -94,6 +101,39 @@ class PluginException(Exception):
     pass
 
 
+class ScrubRule(object):
+    """A substitution that is applied to the content of every collected file
+    whose source path matches the shell glob pathspec, before the content is
+    written to the archive. regexp can be a regexp string or a compiled re
+    object. The number of replacements made is accumulated in count.
+    """
+
+    def __init__(self, pathspec, regexp, subst):
+        self.pathspec = pathspec
+        if isinstance(regexp, basestring):
+            regexp = re.compile(regexp)
+        self.regexp = regexp
+        self.subst = subst
+        self.count = 0
+
+    def matches(self, path):
+        return fnmatch.fnmatch(path, self.pathspec)
+
+    def __str__(self):
+        return "%s in %s" % (self.regexp.pattern, self.pathspec)
+
+
+def scrub_content(content, rules):
+    '''Apply every rule in rules to content and return a tuple of the
+    scrubbed content and a list holding the number of replacements made by
+    each rule.'''
+    counts = []
+    for rule in rules:
+        content, replacements = rule.regexp.subn(rule.subst, content)
+        counts.append(replacements)
+    return content, counts
+
+
 class Plugin(object):
     """ This is the base class for sosreport plugins. Plugins should subclass
     this and set the class variables where applicable.
@@ -116,6 +156,12 @@ class Plugin(object):
     files is an iterable of the paths of files to check for before running this
     plugin. If any of these packages is found on the system, the default
     implementation of checkenabled will return True.
+
+    provides is an iterable of the names of the artifacts (see sos.artifacts)
+    this plugin publishes from setup() with provideArtifact().
+
+    consumes is an iterable of the names of the artifacts this plugin reads
+    with getArtifact(). Plugins providing them are set up before this one.
     """
 
     plugin_name = None
@@ -123,6 +169,11 @@ class Plugin(object):
     version = 'unversioned'
     packages = ()
     files = ()
+    provides = ()
+    consumes = ()
+    scrub_workers = 4
+    pseudo_read_timeout = 5
+    report_page_size = 1000
 
     def __init__(self, commons):
         if not getattr(self, "optionList", False):
@@ -138,8 +189,12 @@ class Plugin(object):
         self.cInfo = commons
         self.forbiddenPaths = []
         self.copyPaths = []
+        self.pseudoPaths = []
         self.copyStrings = []
+        self.stringSymlinks = {}
         self.collectProgs = []
+        self.scrubRules = []
+        self.scrubQueue = []
 
         self.must_exit = False
 
@@ -173,7 +228,9 @@ class Plugin(object):
         can be a regexp string or a compiled re object.  subst is a string to
         replace each occurance of regexp in the content of srcpath.
 
-        This function returns the number of replacements made.
+        This function returns the number of replacements made. Files that
+        are known in advance to need scrubbing should use addScrubRule()
+        instead, which avoids reading the file back out of the archive.
         '''
         try:
             path = self._get_dest_for_srcpath(srcpath)
@@ -189,6 +246,101 @@ class Plugin(object):
         except Exception, e:
             return 0
 
+    def addScrubRule(self, pathspec, regexp, subst):
+        '''Register a substitution to apply to collected files before they
+        are written to the archive. pathspec is a shell glob matched against
+        the source path of each file, regexp can be a regexp string or a
+        compiled re object and subst is the replacement string. Every file is
+        read once and all of the rules matching it are applied to it in the
+        order in which they were added. Must be called from setup().
+        '''
+        self.scrubRules.append(ScrubRule(pathspec, regexp, subst))
+
+    def _get_scrub_rules(self, srcpath):
+        return [rule for rule in self.scrubRules if rule.matches(srcpath)]
+
+    def _add_file_to_archive(self, srcpath, readpath, dest, record):
+        """Add readpath to the archive as dest, deferring the write if any
+        scrub rule applies to srcpath. The digest of the bytes stored is
+        kept in record, the entry of the file in the list of copied files."""
+        rules = self._get_scrub_rules(srcpath)
+        if rules:
+            self.scrubQueue.append((readpath, dest, rules, record))
+            return
+        algorithm = self._digest_algorithm()
+        fp = self._open_source(readpath)
+        try:
+            if algorithm:
+                fp = DigestReader(fp, algorithm)
+            self.archive.add_file(readpath, dest, fp)
+        finally:
+            fp.close()
+        if algorithm:
+            record['digest'] = fp.hexdigest()
+
+    def _digest_algorithm(self):
+        """Returns the algorithm the content of copied files is hashed with,
+        or None when the archive does not store the content as read"""
+        if getattr(self.cInfo['cmdlineopts'], 'obfuscate', False):
+            return None
+        return get_hash_name()
+
+    def _digest(self, content):
+        algorithm = self._digest_algorithm()
+        if algorithm:
+            return hashlib.new(algorithm, content).hexdigest()
+        return None
+
+    def _open_source(self, path):
+        """Opens the file path to copy it, its content being read within the
+        read bandwidth limit"""
+        fp = open(path, 'rb')
+        throttle = self.cInfo.get('throttle')
+        if throttle and throttle.reads.rate:
+            return ThrottledFile(fp, throttle.reads)
+        return fp
+
+    def _command_prefix(self):
+        throttle = self.cInfo.get('throttle')
+        if throttle:
+            return throttle.prefix
+        return None
+
+    def _scrub_queued_files(self):
+        """Read and scrub all files queued by _add_file_to_archive on a pool
+        of worker threads and write the results to the archive in the order
+        they were queued."""
+        def _scrub(job):
+            readpath, dest, rules, record = job
+            try:
+                fp = self._open_source(readpath)
+                try:
+                    return scrub_content(fp.read(), rules)
+                finally:
+                    fp.close()
+            except (IOError, OSError), e:
+                self.soslog.error("Unable to copy %s to %s: %s" % (readpath, dest, e))
+                return None
+
+        # bound the amount of scrubbed content held in memory at once
+        batch_size = self.scrub_workers * 4
+        while self.scrubQueue:
+            batch = self.scrubQueue[:batch_size]
+            del self.scrubQueue[:batch_size]
+            results = parallel_map(_scrub, batch, self.scrub_workers)
+            for (readpath, dest, rules, record), result in izip(batch, results):
+                if result is None:
+                    continue
+                content, counts = result
+                for rule, count in izip(rules, counts):
+                    rule.count += count
+                self.archive.add_string(content, dest)
+                record['digest'] = self._digest(content)
+
+        for rule in self.scrubRules:
+            self.soslog.debug("%s: %d replacements made for %s"
+                    % (self.name(), rule.count, rule))
+
     def doRegexFindAll(self, regex, fname):
         return regex_findall(regex, fname)
 
@@ -207,7 +359,13 @@ class Plugin(object):
                         link)
                     )
 
-        if os.path.isdir(link):
+        try:
+            stats = os.stat(link)
+        except OSError:
+            self.soslog.debug("link target %s does not exist" % link)
+            return
+
+        if S_ISDIR(stats.st_mode):
             self.soslog.debug("link %s is a directory, skipping..." % link)
             return
 
@@ -217,13 +375,14 @@ class Plugin(object):
             old, new = sub
             dest = srcpath.replace(old, new)
 
-        self.archive.add_file(link, dest=dest)
-
-        self.copiedFiles.append({
+        record = {
             'srcpath':srcpath,
             'dstpath':dest,
             'symlink':"yes",
-            'pointsto':link})
+            'pointsto':link,
+            'stat':stats}
+        self._add_file_to_archive(srcpath, link, dest, record)
+        self.copiedFiles.append(record)
 
     def copy_dir(self, srcpath, sub=None):
         for afile in os.listdir(srcpath):
@@ -255,7 +414,15 @@ class Plugin(object):
             self.soslog.debug("%s is in the forbidden path list" % srcpath)
             return ''
 
-        if not os.path.exists(srcpath):
+        if self._on_hung_mount(srcpath):
+            self.soslog.warning("%s is on a hung mount, not copying it" % srcpath)
+            return ''
+
+        # this is the only stat of the source, the result is kept with the
+        # list of copied files for the manifest
+        try:
+            stats = os.lstat(srcpath)
+        except OSError:
             self.soslog.debug("file or directory %s does not exist" % srcpath)
             return
 
@@ -266,11 +433,11 @@ class Plugin(object):
             old, new = sub
             dest = srcpath.replace(old, new)
 
-        if os.path.islink(srcpath):
+        if S_ISLNK(stats.st_mode):
             self.copy_symlink(srcpath, sub=sub)
             return
         else:
-            if os.path.isdir(srcpath):
+            if S_ISDIR(stats.st_mode):
                 self.copy_dir(srcpath, sub=sub)
                 return
 
@@ -278,12 +445,13 @@ class Plugin(object):
         self.soslog.debug("copying file %s to %s" % (srcpath,dest))
 
         try:
-            self.archive.add_file(srcpath, dest)
-
-            self.copiedFiles.append({
+            record = {
                 'srcpath':srcpath,
                 'dstpath':dest,
-                'symlink':"no"})
+                'symlink':"no",
+                'stat':stats}
+            self._add_file_to_archive(srcpath, srcpath, dest, record)
+            self.copiedFiles.append(record)
 
             if self.cInfo['cmdlineopts'].profiler:
                 time_passed = time() - start_time
@@ -392,6 +560,11 @@ class Plugin(object):
         for copyspec in copyspecs:
             self.addCopySpec(copyspec, sub)
 
+    def _on_hung_mount(self, path):
+        """Returns True if the watchdog found the mount holding path hung"""
+        watchdog = self.cInfo.get('watchdog')
+        return bool(watchdog) and watchdog.is_hung(path)
+
     def addCopySpec(self, copyspec, sub=None):
         """Add a file specification (can be file, dir,or shell glob) to be
         copied into the sosreport by this module.
@@ -399,17 +572,88 @@ class Plugin(object):
         if not (copyspec and len(copyspec)):
             # self.soslog.warning("invalid file path")
             return False
+        if self._on_hung_mount(copyspec):
+            self.soslog.warning("%s is on a hung mount, not copying it" % copyspec)
+            return False
         # Glob case handling is such that a valid non-glob is a reduced glob
         for filespec in glob.glob(copyspec):
             if filespec not in self.copyPaths:
                 self.copyPaths.append((filespec, sub))
 
+    def addPseudoCopySpec(self, copyspec, aggregate=False, sub=None):
+        """Add a file specification below /proc or /sys to be copied into the
+        sosreport. These pseudo files are read in bulk, without relying on the
+        size they report, and a file whose read blocks for more than
+        pseudo_read_timeout seconds is skipped. If aggregate is set, all files
+        matched by copyspec are stored in a single indexed file under
+        sos_pseudo (see sos.utilities.aggregate_pseudo_files) instead of one
+        archive member each.
+        """
+        if not (copyspec and len(copyspec)):
+            return False
+        self.pseudoPaths.append((copyspec, aggregate, sub))
+
+    def _collect_pseudo_files(self):
+        for copyspec, aggregate, sub in self.pseudoPaths:
+            found = [(path, stats) for path, stats in pseudo_file_paths(copyspec)
+                     if not self._path_in_path_list(path, self.forbiddenPaths)]
+            contents = read_pseudo_files([path for path, stats in found],
+                                         self.pseudo_read_timeout)
+            collected = []
+            aggregate_name = os.path.join(PSEUDO_AGGREGATE_DIR, self.name(),
+                                          mangle_command(copyspec))
+            for (path, stats), content in izip(found, contents):
+                if content is None:
+                    self.soslog.debug("unable to read %s" % path)
+                    continue
+                rules = self._get_scrub_rules(path)
+                if rules:
+                    content, counts = scrub_content(content, rules)
+                    for rule, count in izip(rules, counts):
+                        rule.count += count
+                dest = path
+                if sub:
+                    old, new = sub
+                    dest = path.replace(old, new)
+                record = {
+                    'srcpath':path,
+                    'dstpath':dest,
+                    'symlink':"no",
+                    'stat':stats,
+                    'size':len(content),
+                    'pseudo':True}
+                if aggregate:
+                    record['dstpath'] = aggregate_name
+                    collected.append((path, content))
+                else:
+                    self.archive.add_string(content, dest)
+                    record['digest'] = self._digest(content)
+                self.copiedFiles.append(record)
+            if aggregate:
+                self.archive.add_string(aggregate_pseudo_files(collected),
+                                        aggregate_name)
+
     def callExtProg(self, prog, timeout=300):
         """Execute a command independantly of the output gathering part of
-        sosreport.
+        sosreport. A command naming a path on a hung mount is not run and
+        fails with status 1 and no output.
         """
         # pylint: disable-msg = W0612
-        return sosGetCommandOutput(prog, timeout)
+        timeout = self._guard_command(prog, timeout)
+        if timeout is None:
+            return (1, "", 0)
+        return sosGetCommandOutput(prog, timeout, prefix=self._command_prefix())
+
+    def _guard_command(self, exe, timeout):
+        """Returns the timeout exe may run with given the mounts the
+        watchdog found hung, or None if it must not be run"""
+        watchdog = self.cInfo.get('watchdog')
+        if not watchdog:
+            return timeout
+        guarded = watchdog.guard(exe, timeout)
+        if guarded is None:
+            self.soslog.warning("not running '%s', it uses a hung mount" % exe)
+        return guarded
 
     def checkExtprog(self, prog):
         """Execute a command independently of the output gathering part of
@@ -420,9 +664,11 @@ class Plugin(object):
         return (status == 0)
 
 
-    def collectExtOutput(self, exe, suggest_filename=None, root_symlink=None, timeout=300):
-        """Run a program and collect the output"""
-        self.collectProgs.append( (exe, suggest_filename, root_symlink, timeout) )
+    def collectExtOutput(self, exe, suggest_filename=None, root_symlink=None, timeout=300, sizelimit=None):
+        """Run a program and collect the output. The program is stopped once
+        it has written sizelimit megabytes, or the --output-limit given on
+        the command line when sizelimit is not set."""
+        self.collectProgs.append( (exe, suggest_filename, root_symlink, timeout, sizelimit) )
 
     def fileGrep(self, regexp, *fnames):
         """Returns lines matched in fnames, where fnames can either be
@@ -451,19 +697,56 @@ class Plugin(object):
 
         return outfn
 
-    def addStringAsFile(self, content, filename):
+    def addStringAsFile(self, content, filename, root_symlink=None):
         """Add a string to the archive as a file named `filename`"""
         self.copyStrings.append((content, filename))
+        if root_symlink:
+            self.stringSymlinks[filename] = root_symlink
 
-    def collectOutputNow(self, exe, suggest_filename=None, root_symlink=False, timeout=300):
+    def collectOutputNow(self, exe, suggest_filename=None, root_symlink=False, timeout=300, sizelimit=None):
         """Execute a command and save the output to a file for inclusion in the
         report.
         """
-        if self.cInfo['cmdlineopts'].profiler:
-            start_time = time()
+        outfn, status, shout = self._collectOutput(exe, suggest_filename,
+                                                   root_symlink, timeout, sizelimit)
+        return outfn
 
-        # pylint: disable-msg = W0612
-        status, shout, runtime = sosGetCommandOutput(exe, timeout=timeout)
+    def _output_limit(self, sizelimit):
+        """Returns the output limit in bytes for a command collected with
+        sizelimit megabytes, falling back to the global --output-limit"""
+        if sizelimit is None:
+            sizelimit = self.cInfo['cmdlineopts'].output_limit
+        if not sizelimit:
+            return None
+        return int(sizelimit * 1024 * 1024)
+
+    def _record_runtime(self, exe):
+        """Returns True if the runtime of exe is worth keeping for later
+        runs. Plugins whose command lines change from one run to the next
+        return False for those."""
+        return True
+
+    def _collectOutput(self, exe, suggest_filename, root_symlink, timeout, sizelimit=None):
+        """Run exe, add its output to the archive and return a tuple of the
+        name it was stored under, the exit status and the output."""
+        timeout = self._guard_command(exe, timeout)
+        if timeout is None:
+            return None, None, ""
+
+        history = self.cInfo.get('history')
+        if history:
+            timeout = history.timeout(self.name(), exe, timeout)
+        result = run_command(exe, timeout=timeout,
+                             sizelimit=self._output_limit(sizelimit),
+                             prefix=self._command_prefix())
+        if history and self._record_runtime(exe):
+            history.record(self.name(), exe, result.wall)
+        status, shout = result.status, result.output
+        if result.timed_out:
+            self.soslog.warning("command '%s' timed out after %ds" % (exe, timeout))
+        if result.truncated:
+            self.soslog.warning("output of '%s' truncated after %d bytes"
+                                % (exe, self._output_limit(sizelimit)))
 
         if suggest_filename:
             outfn = self.makeCommandFilename(suggest_filename)
@@ -474,7 +757,7 @@ class Plugin(object):
             outfn_strip = outfn[len(self.cInfo['cmddir'])+1:]
             self.archive.add_string(shout, outfn)
             if root_symlink:
-                self.archive.add_link(outfn, root_symlink)
+                self._add_root_symlink(outfn, root_symlink, shout)
         else:
             self.soslog.debug("could not run command: %s" % exe)
             outfn = None
@@ -482,13 +765,53 @@ class Plugin(object):
 
         # save info for later
         self.executedCommands.append({'exe': exe, 'file':outfn_strip}) # save in our list
-        self.cInfo['xmlreport'].add_command(cmdline=exe,exitcode=status,f_stdout=outfn_strip,runtime=runtime)
+        self.cInfo['manifest'].add_command(cmdline=exe,exitcode=status,f_stdout=outfn_strip,
+                runtime=result.wall,cpu=result.cpu,maxrss=result.maxrss,
+                size=result.size,truncated=result.truncated)
 
         if self.cInfo['cmdlineopts'].profiler:
-            time_passed = time() - start_time
-            self.proflog.debug("output: %-75s time: %f" % (exe, time_passed))
+            self.proflog.debug("output: %-75s time: %f cpu: %s maxrss: %s"
+                    % (exe, result.wall, result.cpu, result.maxrss))
 
-        return outfn
+        return outfn, status, shout
+
+    def _add_root_symlink(self, path, link_name, content):
+        """Links link_name at the top of the archive to path, or stores
+        content under link_name as well in an archive without links"""
+        if self.archive.supports_links:
+            self.archive.add_link(path, link_name)
+        else:
+            self.archive.add_string(content, link_name)
+
+    def _artifact_bus(self):
+        if 'artifacts' not in self.cInfo:
+            self.cInfo['artifacts'] = ArtifactBus(watchdog=self.cInfo.get('watchdog'))
+        return self.cInfo['artifacts']
+
+    def provideArtifact(self, name, suggest_filename=None, root_symlink=None, timeout=300):
+        """Collect the artifact name for inclusion in the report and publish
+        its value for the plugins that consume it. The artifact should be
+        listed in the plugin's provides. Returns the published value.
+        """
+        bus = self._artifact_bus()
+        artifact = bus.artifact(name)
+        if artifact.command:
+            outfn, status, content = self._collectOutput(artifact.command,
+                    suggest_filename, root_symlink, timeout)
+            if status != 0:
+                content = ""
+        else:
+            self.addCopySpec(artifact.path)
+            content = artifact.read()
+        return bus.publish(name, content)
+
+    def getArtifact(self, name):
+        """Returns the value of the artifact name. The artifact should be
+        listed in the plugin's consumes so that the plugins providing it are
+        set up first; if none of them published it, it is produced on
+        demand.
+        """
+        return self._artifact_bus().get(name)
 
     # For adding warning messages regarding configuration sanity
     def addDiagnose(self, alertstring):
@@ -512,23 +835,38 @@ class Plugin(object):
 
     def copyStuff(self):
         """Collect the data for a plugin."""
+        self.collectFiles()
+        for prog in self.collectProgs:
+            self.collectCommand(prog)
+
+    def collectFiles(self):
+        """Copy the files and strings added in setup() to the archive."""
         for path, sub in self.copyPaths:
             self.doCopyFileOrDir(path, sub=sub)
 
-        for string, file_name in self.copyStrings:
-            try:
-                self.archive.add_string(string,
-                        os.path.join('sos_strings', self.name(), file_name))
-            except Exception, e:
-                self.soslog.debug("could not create %s, traceback follows: %s" % (file_name, e))
+        self._scrub_queued_files()
+        self._collect_pseudo_files()
 
-        for progs in izip(self.collectProgs):
-            prog, suggest_filename, root_symlink, timeout = progs[0]
-            # self.soslog.debug("collecting output of '%s'" % prog)
+        for index, (string, file_name) in enumerate(self.copyStrings):
             try:
-                self.collectOutputNow(prog, suggest_filename, root_symlink, timeout)
+                path = os.path.join('sos_strings', self.name(), file_name)
+                self.archive.add_string(string, path)
+                if file_name in self.stringSymlinks:
+                    self._add_root_symlink(path, self.stringSymlinks[file_name], string)
             except Exception, e:
-                self.soslog.debug("error collection output of '%s', traceback follows: %s" % (prog, e))
+                self.soslog.debug("could not create %s, traceback follows: %s" % (file_name, e))
+            # only the name is needed from now on, don't hold on to the content
+            self.copyStrings[index] = (None, file_name)
+
+    def collectCommand(self, progs):
+        """Run one of the commands added with collectExtOutput(). progs is
+        an entry of collectProgs."""
+        prog, suggest_filename, root_symlink, timeout, sizelimit = progs
+        # self.soslog.debug("collecting output of '%s'" % prog)
+        try:
+            self.collectOutputNow(prog, suggest_filename, root_symlink, timeout, sizelimit)
+        except Exception, e:
+            self.soslog.debug("error collection output of '%s', traceback follows: %s" % (prog, e))
 
     def exit_please(self):
         """ This function tells the plugin that it should exit ASAP"""
@@ -587,7 +925,9 @@ class Plugin(object):
 
     def postproc(self):
         """
-        perform any postprocessing. To be replaced by a plugin if desired
+        perform any postprocessing. To be replaced by a plugin if desired.
+        Substitutions in collected files are better registered with
+        addScrubRule() from setup().
         """
         pass
 
@@ -595,47 +935,102 @@ class Plugin(object):
         """ Present all information that was gathered in an html file that allows browsing
         the results.
         """
+        return "".join(self.report_fragments())
+
+    def report_fragments(self):
+        """Generator yielding the html fragments that make up this plugin's
+        section of the html report. Lists longer than report_page_size
+        entries are split and every page after the first is written to the
+        archive as a separate html file that is linked from the section.
+        """
         # make this prettier
-        html = '<hr/><a name="%s"></a>\n' % self.name()
+        yield '<hr/><a name="%s"></a>\n' % self.name()
 
         # Intro
-        html = html + "<h2> Plugin <em>" + self.name() + "</em></h2>\n"
+        yield "<h2> Plugin <em>" + self.name() + "</em></h2>\n"
 
         # Files
         if len(self.copiedFiles):
-            html = html + "<p>Files copied:<br><ul>\n"
-            for afile in self.copiedFiles:
-                html = html + '<li><a href="%s">%s</a>' % (afile['dstpath'], afile['srcpath'])
-                if (afile['symlink'] == "yes"):
-                    html = html + " (symlink to %s)" % afile['pointsto']
-                html = html + '</li>\n'
-            html = html + "</ul></p>\n"
+            for html in self._report_list("Files copied:", "files",
+                                          self._report_copied_files()):
+                yield html
 
         # Command Output
         if len(self.executedCommands):
-            html = html + "<p>Commands Executed:<br><ul>\n"
-            # convert file name to relative path from our root
-            for cmd in self.executedCommands:
-                if cmd["file"] and len(cmd["file"]):
-                    cmdOutRelPath = sosRelPath(self.cInfo['rptdir'], self.cInfo['cmddir'] + "/" + cmd['file'])
-                    html = html + '<li><a href="%s">%s</a></li>\n' % (cmdOutRelPath, cmd['exe'])
-                else:
-                    html = html + '<li>%s</li>\n' % (cmd['exe'])
-            html = html + "</ul></p>\n"
+            for html in self._report_list("Commands Executed:", "commands",
+                                          self._report_executed_commands()):
+                yield html
 
         # Alerts
         if len(self.alerts):
-            html = html + "<p>Alerts:<br><ul>\n"
+            yield "<p>Alerts:<br><ul>\n"
             for alert in self.alerts:
-                html = html + '<li>%s</li>\n' % alert
-            html = html + "</ul></p>\n"
+                yield '<li>%s</li>\n' % alert
+            yield "</ul></p>\n"
+
+        # Scrubbed content
+        if len(self.scrubRules):
+            yield "<p>Scrubbed:<br><ul>\n"
+            for rule in self.scrubRules:
+                yield '<li>%s: %d replacements</li>\n' % (rule, rule.count)
+            yield "</ul></p>\n"
 
         # Custom Text
         if (self.customText != ""):
-            html = html + "<p>Additional Information:<br>\n"
-            html = html + self.customText + "</p>\n"
-
-        return html
+            yield "<p>Additional Information:<br>\n"
+            yield self.customText + "</p>\n"
+
+    def _report_copied_files(self):
+        for afile in self.copiedFiles:
+            if (afile['symlink'] == "yes"):
+                yield '<li><a href="%s">%s</a> (symlink to %s)</li>\n' % (
+                        afile['dstpath'], afile['srcpath'], afile['pointsto'])
+            else:
+                yield '<li><a href="%s">%s</a></li>\n' % (afile['dstpath'], afile['srcpath'])
+
+    def _report_executed_commands(self):
+        # convert file name to relative path from our root
+        for cmd in self.executedCommands:
+            if cmd["file"] and len(cmd["file"]):
+                cmdOutRelPath = sosRelPath(self.cInfo['rptdir'], self.cInfo['cmddir'] + "/" + cmd['file'])
+                yield '<li><a href="%s">%s</a></li>\n' % (cmdOutRelPath, cmd['exe'])
+            else:
+                yield '<li>%s</li>\n' % (cmd['exe'])
+
+    def _report_page_name(self, kind, number):
+        return "%s_%s_%d.html" % (self.name(), kind, number)
+
+    def _add_report_page(self, title, kind, number, items):
+        page = ['<html><body><h2>Plugin <em>%s</em></h2>\n' % self.name(),
+                '<p>%s (page %d)<br><ul>\n' % (title, number)]
+        page.extend(items)
+        page.append('</ul></p></body></html>\n')
+        self.archive.add_string("".join(page), os.path.join(
+            self.cInfo['rptdir'], self._report_page_name(kind, number)))
+
+    def _report_list(self, title, kind, items):
+        """Yields a html list of items. Only the first report_page_size items
+        are yielded, the others are written to additional pages."""
+        yield "<p>%s<br><ul>\n" % title
+        page = []
+        pages = 1
+        for count, item in enumerate(items):
+            if count < self.report_page_size:
+                yield item
+                continue
+            page.append(item)
+            if len(page) == self.report_page_size:
+                pages += 1
+                self._add_report_page(title, kind, pages, page)
+                page = []
+        if page:
+            pages += 1
+            self._add_report_page(title, kind, pages, page)
+        yield "</ul>"
+        for number in range(2, pages + 1):
+            yield '<a href="%s">page %d</a>\n' % (
+                    self._report_page_name(kind, number), number)
+        yield "</p>\n"
 
 
 class RedHatPlugin(object):
@@ -8,7 +8,7 @@ from xml.etree import ElementTree
 from itertools import chain
 
 from sos.plugins import Plugin, IndependentPlugin, AS7Mixin
-from sos.utilities import DirTree, find, checksum
+from sos.utilities import DirTree, find, checksum_files
 
 class AS7(Plugin, IndependentPlugin, AS7Mixin):
     """JBoss related information
@@ -28,7 +28,6 @@ class AS7(Plugin, IndependentPlugin, AS7Mixin):
           ("pass", 'password for management console', '', None),
     ]
 
-    __MD5_CHUNK_SIZE=128
     __jbossHome=None
     __haveJava=False
     __twiddleCmd=None
@@ -52,18 +51,6 @@ class AS7(Plugin, IndependentPlugin, AS7Mixin):
         return True
 
 
-    def __getMd5(self, file):
-        """Returns the MD5 sum of the specified file."""
-
-        retVal = "?" * 32
-
-        try:
-            retVal = checksum(file, self.__MD5_CHUNK_SIZE)
-        except IOError, ioe:
-            self.__alert("ERROR: Unable to open %s for reading.  Error: %s" % (file,ioe))
-
-        return retVal
-
     def __getManifest(self, jarFile):
         """
         Given a jar file, this function will extract the Manifest and return it's contents
@@ -84,8 +71,11 @@ class AS7(Plugin, IndependentPlugin, AS7Mixin):
     def __getStdJarInfo(self):
         jar_info_list = []
 
-        for jarFile in find("*.jar", self.__jbossHome):
-            checksum = self.__getMd5(jarFile)
+        jar_files = list(find("*.jar", self.__jbossHome))
+        for jarFile, checksum in checksum_files(jar_files):
+            if checksum is None:
+                self.__alert("ERROR: Unable to open %s for reading." % jarFile)
+                checksum = "?" * 32
             manifest = self.__getManifest(jarFile)
             path = jarFile.replace(self.__jbossHome, 'JBOSSHOME')
             if manifest:
@@ -223,9 +213,10 @@ class AS7(Plugin, IndependentPlugin, AS7Mixin):
         tree = DirTree(self.__jbossHome).as_string()
         self.addStringAsFile(tree, "jboss_home_tree.txt")
 
+        self.__addScrubRules()
         self.__getFiles(self.__jbossServerConfigDirs)
 
-    def postproc(self):
+    def __addScrubRules(self):
         """
         Obfuscate passwords.
         """
@@ -235,19 +226,15 @@ class AS7(Plugin, IndependentPlugin, AS7Mixin):
         for dir_ in self.__jbossServerConfigDirs:
             path = os.path.join(self.__jbossHome, dir_)
 
-            self.doRegexSub(os.path.join(path,"configuration","*.xml"),
+            self.addScrubRule(os.path.join(path,"configuration","*.xml"),
                             password_xml_regex,
                             r'<password>********</password>')
 
-            tmp = os.path.join(path,"configuration")
-            for propFile in find("*-users.properties", tmp):
-                self.doRegexSub(propFile,
-                                r"=(.*)",
-                                r'=********')
+            self.addScrubRule(os.path.join(path,"configuration","*-users.properties"),
+                            r"=(.*)",
+                            r'=********')
 
 #           Remove PW from -ds.xml files
-            tmp = os.path.join(path, "deployments")
-            for dsFile in find("*-ds.xml", tmp):
-                self.doRegexSub(dsFile,
-                                password_xml_regex,
-                                r"<password>********</password>")
+            self.addScrubRule(os.path.join(path, "deployments", "*-ds.xml"),
+                            password_xml_regex,
+                            r"<password>********</password>")
@@ -14,7 +14,6 @@
 
 from sos.plugins import Plugin, RedHatPlugin
 import os, re
-from glob import glob
 
 class cluster(Plugin, RedHatPlugin):
     """cluster suite and GFS related information
@@ -22,6 +21,7 @@ class cluster(Plugin, RedHatPlugin):
 
     optionList = [("gfslockdump", 'gather output of gfs lockdumps', 'slow', False),
                   ('lockdump', 'gather dlm lockdumps', 'slow', False)]
+    consumes = ("mounts",)
 
     def checkenabled(self):
         rhelver = self.policy().rhelVersion()
@@ -53,6 +53,9 @@ class cluster(Plugin, RedHatPlugin):
         self.addCopySpec("/var/log/cluster")
         self.addCopySpec("/var/log/luci/luci.log")
 
+        self.addScrubRule("/etc/cluster/cluster.conf*",
+                r"(\s*\<fencedevice\s*.*\s*passwd\s*=\s*)\S+(\")", r"\1%s" %('"***"'))
+
         if self.getOption('gfslockdump'):
           self.do_gfslockdump()
 
@@ -116,11 +119,8 @@ class cluster(Plugin, RedHatPlugin):
                 suggest_filename = "dlm_locks_%s" % lockspace)
 
     def do_gfslockdump(self):
-        for mntpoint in self.doRegexFindAll(r'^\S+\s+([^\s]+)\s+gfs\s+.*$', "/proc/mounts"):
+        for device, mntpoint, fstype, options in self.getArtifact("mounts"):
+           if fstype != "gfs":
+               continue
            self.collectExtOutput("/sbin/gfs_tool lockdump %s" % mntpoint,
                suggest_filename = "gfs_lockdump_" + self.mangleCommand(mntpoint))
-
-    def postproc(self):
-        for cluster_conf in glob("/etc/cluster/cluster.conf*"):
-            self.doRegexSub(cluster_conf, r"(\s*\<fencedevice\s*.*\s*passwd\s*=\s*)\S+(\")", r"\1%s" %('"***"'))
-        return
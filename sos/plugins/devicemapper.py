@@ -14,14 +14,18 @@
 
 import os
 from sos.plugins import Plugin, RedHatPlugin
+from sos.artifacts import dm_slaves
 
 class devicemapper(Plugin, RedHatPlugin):
     """device-mapper related information (dm, lvm, multipath)
     """
 
-    optionList = [("lvmdump", 'collect raw metadata from PVs', 'slow', False)]
-    optionList = [("lvmdump-a", 'use the -a option of lvmdump (requires the "lvmdump" option)', 'slow', False)]
+    optionList = [("lvmdump", 'collect raw metadata from PVs', 'slow', False),
+                  ("lvmdump-a", 'use the -a option of lvmdump (requires the "lvmdump" option)', 'slow', False),
+                  ("maxdevices", 'maximum number of devices to probe', '', 256)]
     dmraidOptions = ['V','b','r','s','tay','rD']
+    consumes = ("block_holders",)
+    probe_timeout = 30
 
     def do_lvmdump(self):
         """Collects raw metadata directly from the PVs using dd
@@ -53,16 +57,26 @@ class devicemapper(Plugin, RedHatPlugin):
 
         self.collectExtOutput("/usr/bin/systool -v -c -b scsi")
 
-        self.collectExtOutput("/bin/ls -lanR /dev")
-        self.collectExtOutput("/bin/ls -lanR /sys/block")
+        self.collectExtOutput("/bin/ls -lanR /dev", sizelimit=10)
+        self.collectExtOutput("/bin/ls -lanR /sys/block", sizelimit=10)
 
         if self.getOption('lvmdump'):
             self.do_lvmdump()
 
-        if os.path.isdir("/sys/block"):
-           for disk in os.listdir("/sys/block"):
-              if disk in [ ".",  ".." ] or disk.startswith("ram"):
-                 continue
-              self.collectExtOutput("/usr/bin/udevinfo -ap /sys/block/%s" % (disk))
+        # multipath paths and other dm slaves are already described by the
+        # dm device holding them
+        holders = self.getArtifact("block_holders")
+        slaves = dm_slaves(holders)
+        disks = [disk for disk in sorted(holders)
+                 if os.path.isdir("/sys/block/%s" % disk)
+                 and not disk.startswith("ram") and disk not in slaves]
+        limit = int(self.getOption("maxdevices"))
+        if limit and len(disks) > limit:
+            self.soslog.warning("%s: probing only the first %d of %d devices"
+                                % (self.name(), limit, len(disks)))
+            disks = disks[:limit]
+        for disk in disks:
+            self.collectExtOutput("/usr/bin/udevinfo -ap /sys/block/%s" % (disk),
+                                  timeout=self.probe_timeout)
         for opt in self.dmraidOptions:
             self.collectExtOutput("/sbin/dmraid -%s" % (opt,))
@@ -13,6 +13,8 @@
 ## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
 
 from sos.plugins import Plugin, RedHatPlugin, UbuntuPlugin
+from sos.utilities import parallel_map
+from sos.artifacts import dm_slaves
 import os
 import re
 from itertools import *
@@ -20,57 +22,71 @@ from itertools import *
 class filesys(Plugin, RedHatPlugin, UbuntuPlugin):
     """information on filesystems
     """
-    optionList = [("lsof", 'gathers information on all open files', 'slow', False)]
-    optionList = [("dumpe2fs", 'dump filesystem information', 'slow', False)]
+    optionList = [("lsof", 'gathers information on all open files', 'slow', False),
+                  ("dumpe2fs", 'dump filesystem information', 'slow', False),
+                  ("maxdevices", 'maximum number of devices to probe', '', 256)]
+    provides = ("mounts", "partitions")
+    consumes = ("block_holders", "processes")
+    probe_workers = 8
+    probe_timeout = 30
+
+    def probe_devices(self, partlist):
+        """Returns the devices of partlist worth probing: device-mapper
+        slaves such as the paths of a multipath device are skipped, since
+        their parent is probed instead, and no more than the maxdevices
+        option are returned"""
+        slaves = dm_slaves(self.getArtifact("block_holders"))
+        devices = [dev for dev in partlist
+                   if os.path.basename(dev) not in slaves]
+        limit = int(self.getOption("maxdevices"))
+        if limit and len(devices) > limit:
+            self.soslog.warning("%s: probing only the first %d of %d devices"
+                                % (self.name(), limit, len(devices)))
+            devices = devices[:limit]
+        return devices
+
+    def is_whole_disk(self, dev):
+        """Returns True if hdparm reports that dev starts at sector 0"""
+        ret, hdparm, time = self.callExtProg('/sbin/hdparm -g %s' % (dev),
+                                             timeout=self.probe_timeout)
+        if ret != 0:
+            return False
+        return hdparm.strip().split("\n")[-1].strip().split()[-1] == "0"
 
     def setup(self):
         self.addCopySpecs([
             "/proc/filesystems",
             "/etc/fstab",
             "/proc/self/mounts",
-            "/proc/mounts",
             "/proc/mdstat",
             "/etc/raidtab",
             "/etc/mdadm.conf"])
-        mounts = self.collectOutputNow("/bin/mount -l", root_symlink = "mount")
+        mounts = self.provideArtifact("mounts")
+        self.collectExtOutput("/bin/mount -l", root_symlink = "mount")
 
         self.collectExtOutput("/bin/findmnt")
         self.collectExtOutput("/bin/df -al", root_symlink = "df")
         self.collectExtOutput("/bin/df -ali")
         if self.getOption('lsof'):
-            self.collectExtOutput("/usr/sbin/lsof -b +M -n -l -P", root_symlink = "lsof")
+            # shares the process table read by the process plugin
+            self.addStringAsFile(self.getArtifact("processes").lsof(), "lsof_-b_M_-n_-l_-P")
         self.collectExtOutput("/sbin/blkid -c /dev/null")
 
-        part_titlep = re.compile("^major")
-        blankp = re.compile("^$")
-        partlist = []
-        devlist = []
-        try:
-            for line in open('/proc/partitions'):
-                if((bool(part_titlep.match(line))) | (bool(blankp.match(line)))):
-                    continue
-                partlist.append('/dev/' + line.split()[-1])
-        except IOError:
-            exit(1)
+        partlist = self.probe_devices(self.provideArtifact("partitions"))
         if os.path.exists("/sbin/hdparm"):
-            for dev in partlist:
-                ret, hdparm, time = self.callExtProg('/sbin/hdparm -g %s' %(dev))
-                if(ret == 0):
-                    start_geo = hdparm.strip().split("\n")[-1].strip().split()[-1]
-                    if(start_geo == "0"):
-      	                devlist.append(dev)
+            whole = parallel_map(self.is_whole_disk, partlist, self.probe_workers)
+            devlist = [dev for dev, disk in zip(partlist, whole) if disk]
+        else:
             # Cheaper heuristic as RHEL* does not ship hdparm for S390(x)
             # Skips least dm-.* correctly
-        else:
             part_in_disk = re.compile("^/dev/[a-z]+$")
-            for dev in partlist:
-                print part_in_disk.match(dev)
-                if bool(part_in_disk.match(dev)):
-                    devlist.append(dev)
+            devlist = [dev for dev in partlist if part_in_disk.match(dev)]
 
         for i in devlist:
-            self.collectExtOutput("/sbin/parted -s %s print" % (i))
+            self.collectExtOutput("/sbin/parted -s %s print" % (i),
+                                  timeout=self.probe_timeout)
 
         if self.getOption('dumpe2fs'):
-            for extfs in izip(self.doRegexFindAll(r"^(/dev/.+) on .+ type ext.\s+", mounts)):
-                self.collectExtOutput("/sbin/dumpe2fs %s" % (extfs))
+            for device, mntpoint, fstype, options in mounts:
+                if device.startswith("/dev/") and fstype.startswith("ext"):
+                    self.collectExtOutput("/sbin/dumpe2fs %s" % (device))
@@ -63,6 +63,9 @@ class RedHatGeneral(general, RedHatPlugin):
             "/etc/fedora-release",
         ])
 
+        self.addScrubRule("/etc/sysconfig/rhn/up2date",
+                r"(\s*proxyPassword\s*=\s*)\S+", r"\1***")
+
         if self.getOption('all_logs'):
             rhelver = self.policy().rhelVersion()
             logconf = (rhelver in (4, 5)) and "/etc/syslog.conf" \
@@ -72,10 +75,6 @@ class RedHatGeneral(general, RedHatPlugin):
                 if os.path.isfile(i):
                     self.addCopySpec(i)
 
-    def postproc(self):
-        self.doRegexSub("/etc/sysconfig/rhn/up2date",
-                r"(\s*proxyPassword\s*=\s*)\S+", r"\1***")
-
 
 class GeneralDebian(general, DebianPlugin, UbuntuPlugin):
     """Basic system information for Debian based distributions"""
@@ -28,18 +28,16 @@ class hardware(Plugin):
             "/proc/meminfo",
             "/proc/ioports",
             "/proc/interrupts",
-            "/proc/scsi",
             "/proc/dma",
             "/proc/devices",
             "/proc/rtc",
-            "/proc/ide",
-            "/proc/bus",
             "/etc/stinit.def",
             "/proc/chandev",
             "/proc/dasd",
             "/proc/s390dbf/tape",
-            "/sys/bus/scsi",
             "/sys/state"])
+        for pseudo in ["/proc/scsi", "/proc/ide", "/proc/bus", "/sys/bus/scsi"]:
+            self.addPseudoCopySpec(pseudo)
         self.collectExtOutput("""/bin/echo -e "lspci:\n" ; /sbin/lspci ; /bin/echo -e "\nlspci -nvv:\n" ; /sbin/lspci -nvv ; /bin/echo -e "\nlspci -tv:\n" ; /sbin/lspci -tv""", suggest_filename = "lspci", root_symlink = "lspci")
 
         self.collectExtOutput("/usr/sbin/dmidecode", root_symlink = "dmidecode")
@@ -676,11 +676,12 @@ Default=\'all default minimal production standard web\'.', '', False),
 
         self.addCustomText(self.__jbossHTMLBody)
 
+        self.__addScrubRules()
         self.__getFiles(self.__jbossServerConfigDirs)
 
         return
 
-    def postproc(self):
+    def __addScrubRules(self):
         """
         Obfuscate passwords.
         """
@@ -689,20 +690,16 @@ Default=\'all default minimal production standard web\'.', '', False),
             path=os.path.join(self.__jbossHome, "server", dir)
             ## Really annoying that there appears to be no vehicle to
             ## say I want ignore case...argh!
-            self.doRegexSub(os.path.join(path,"conf","login-config.xml"),
+            self.addScrubRule(os.path.join(path,"conf","login-config.xml"),
                             r"\"[Pp][Aa][Ss][Ss][Ww][Oo][Rr][Dd]\".*>.*</[Mm][Oo][Dd][Uu][Ll][Ee]-[Oo][Pp][Tt][Ii][Oo][Nn].*>",
                             r'"password">********</module-option>')
 
-            tmp = os.path.join(path,"conf", "props")
-            for propFile in find("*-users.properties", tmp):
-                self.doRegexSub(propFile,
-                                r"=(.*)",
-                                r'=********')
+            self.addScrubRule(os.path.join(path,"conf", "props", "*-users.properties"),
+                            r"=(.*)",
+                            r'=********')
 
             ## Remove PW from -ds.xml files
-            tmp=os.path.join(path, "deploy")
-            for dsFile in find("*-ds.xml", tmp):
-                self.doRegexSub(dsFile,
-                                r"<[Pp][Aa][Ss][Ss][Ww][Oo][Rr][Dd].*>.*</[Pp][Aa][Ss][Ss][Ww][Oo][Rr][Dd].*>",
-                                r"<password>********</password>")
+            self.addScrubRule(os.path.join(path, "deploy", "*-ds.xml"),
+                            r"<[Pp][Aa][Ss][Ss][Ww][Oo][Rr][Dd].*>.*</[Pp][Aa][Ss][Ss][Ww][Oo][Rr][Dd].*>",
+                            r"<password>********</password>")
         return
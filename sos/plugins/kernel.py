@@ -14,12 +14,156 @@
 
 from sos.plugins import Plugin, RedHatPlugin, DebianPlugin, UbuntuPlugin
 import os, re
+import struct
+import gzip
+from StringIO import StringIO
+
+def module_key(name):
+    """Returns the name a module file or module is known as in /proc/modules"""
+    name = os.path.basename(name)
+    for suffix in (".gz", ".xz", ".zst"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    if name.endswith(".ko"):
+        name = name[:-3]
+    return name.replace("-", "_")
+
+def read_proc_modules(path="/proc/modules"):
+    """Returns a list of dictionaries describing the loaded modules, in the
+    order of /proc/modules"""
+    modules = []
+    try:
+        fp = open(path)
+        try:
+            lines = fp.readlines()
+        finally:
+            fp.close()
+    except IOError:
+        return modules
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 3:
+            continue
+        taint = ""
+        if fields[-1].startswith("("):
+            taint = fields[-1].strip("()")
+        modules.append({'name': fields[0],
+                        'size': fields[1],
+                        'refcnt': fields[2],
+                        'state': len(fields) > 4 and fields[4] or "",
+                        'taint': taint})
+    return modules
+
+def read_sys_attribute(module, attribute):
+    try:
+        fp = open(os.path.join("/sys/module", module, attribute))
+        try:
+            return fp.read().strip()
+        finally:
+            fp.close()
+    except IOError:
+        return None
+
+def module_paths(kernel_version, root="/lib/modules"):
+    """Returns a dictionary mapping module names to the files listed for
+    them in modules.dep"""
+    moddir = os.path.join(root, kernel_version)
+    paths = {}
+    try:
+        fp = open(os.path.join(moddir, "modules.dep"))
+        try:
+            for line in fp:
+                path = line.split(":", 1)[0].strip()
+                if path:
+                    if not os.path.isabs(path):
+                        path = os.path.join(moddir, path)
+                    paths[module_key(path)] = path
+        finally:
+            fp.close()
+    except IOError:
+        pass
+    return paths
+
+def elf_section(fp, section_name):
+    """Returns the content of the named section of the ELF object open as
+    fp, or None if it has no such section"""
+    ident = fp.read(16)
+    if ident[:4] != "\x7fELF":
+        return None
+    endian = ident[5] == "\x02" and ">" or "<"
+    if ident[4] == "\x02":
+        header, section = endian + "HHIQQQIHHHHHH", endian + "IIQQQQIIQQ"
+    else:
+        header, section = endian + "HHIIIIIHHHHHH", endian + "IIIIIIIIII"
+    fields = struct.unpack(header, fp.read(struct.calcsize(header)))
+    shoff, shentsize, shnum, shstrndx = fields[5], fields[10], fields[11], fields[12]
+
+    fp.seek(shoff)
+    table = fp.read(shentsize * shnum)
+    sections = [struct.unpack(section, table[i * shentsize:
+                              i * shentsize + struct.calcsize(section)])
+                for i in range(shnum)]
+    if shstrndx >= len(sections):
+        return None
+    fp.seek(sections[shstrndx][4])
+    names = fp.read(sections[shstrndx][5])
+    for entry in sections:
+        name = names[entry[0]:names.find("\0", entry[0])]
+        if name == section_name:
+            fp.seek(entry[4])
+            return fp.read(entry[5])
+    return None
+
+def read_modinfo(path):
+    """Returns the key=value pairs of a module file's .modinfo section. Keys
+    that appear more than once keep their first value."""
+    info = {}
+    try:
+        if path.endswith(".gz"):
+            # the section lookup needs to seek, decompress it all
+            gz = gzip.open(path)
+            try:
+                fp = StringIO(gz.read())
+            finally:
+                gz.close()
+        elif path.endswith(".ko"):
+            fp = open(path, "rb")
+        else:
+            return info
+        try:
+            modinfo = elf_section(fp, ".modinfo")
+        finally:
+            fp.close()
+    except (IOError, struct.error):
+        return info
+    for entry in (modinfo or "").split("\0"):
+        if "=" in entry:
+            key, value = entry.split("=", 1)
+            info.setdefault(key, value)
+    return info
+
+def module_inventory(kernel_version):
+    """Returns a list of dictionaries describing every loaded module with
+    the srcversion the kernel reports for it and the srcversion and vermagic
+    of the module file modules.dep points at"""
+    paths = module_paths(kernel_version)
+    modules = read_proc_modules()
+    for module in modules:
+        module['loaded_srcversion'] = read_sys_attribute(module['name'], "srcversion")
+        module['path'] = paths.get(module['name'])
+        info = {}
+        if module['path']:
+            info = read_modinfo(module['path'])
+        module['srcversion'] = info.get('srcversion')
+        module['vermagic'] = info.get('vermagic')
+    return modules
 
 class kernel(Plugin, RedHatPlugin, DebianPlugin, UbuntuPlugin):
     """kernel related information
     """
     optionList = [("modinfo", 'gathers information on all kernel modules', 'fast', True)]
-    moduleFile = ""
+    provides = ("lsmod",)
+    inventory = None
     taintList = [
         {'regex':'mvfs*', 'description':'Clearcase module'},
         {'regex':'vnode*', 'description':'Clearcase module'},
@@ -40,25 +184,37 @@ class kernel(Plugin, RedHatPlugin, DebianPlugin, UbuntuPlugin):
         {'regex':'ati-', 'description':'ATI module'}
         ]
 
+    def get_inventory(self):
+        """The loaded modules, read once and shared by diagnose(), setup()
+        and analyze()"""
+        if self.inventory is None:
+            self.inventory = module_inventory(self.policy().kernelVersion())
+        return self.inventory
+
+    def format_inventory(self):
+        lines = ["%-24s %10s %6s %-8s %-6s %-26s %-26s %s" % ("Module", "Size",
+                 "Used", "State", "Taint", "Loaded srcversion",
+                 "File srcversion", "File")]
+        for module in self.get_inventory():
+            lines.append("%-24s %10s %6s %-8s %-6s %-26s %-26s %s" % (
+                module['name'], module['size'], module['refcnt'],
+                module['state'], module['taint'] or "-",
+                module['loaded_srcversion'] or "-", module['srcversion'] or "-",
+                module['path'] or "-"))
+        return "\n".join(lines) + "\n"
+
     def setup(self):
         self.collectExtOutput("/bin/uname -a", root_symlink = "uname")
-        self.moduleFile = self.collectOutputNow("/sbin/lsmod", root_symlink = "lsmod")
+        modules = self.provideArtifact("lsmod", root_symlink = "lsmod")
 
-        if self.getOption('modinfo'):
-            runcmd = ""
-            ret, mods, rtime = self.callExtProg('/sbin/lsmod | /bin/cut -f1 -d" " 2>/dev/null | /bin/grep -v Module 2>/dev/null')
-            for kmod in mods.split('\n'):
-                if '' != kmod.strip():
-                    runcmd = runcmd + " " + kmod
-            if len(runcmd):
-                self.collectExtOutput("/sbin/modinfo " + runcmd)
+        if self.getOption('modinfo') and modules:
+            self.collectExtOutput("/sbin/modinfo " + " ".join(modules), sizelimit=10)
 
         self.collectExtOutput("/sbin/sysctl -a")
         if os.path.isfile("/sbin/ksyms"):
             self.collectExtOutput("/sbin/ksyms")
         self.addCopySpecs([
             "/proc/sys/kernel/random/boot_id",
-            "/sys/module/*/parameters",
             "/proc/filesystems",
             "/proc/ksyms",
             "/proc/slabinfo",
@@ -68,33 +224,30 @@ class kernel(Plugin, RedHatPlugin, DebianPlugin, UbuntuPlugin):
             "/etc/modprobe.conf",
             "/etc/modprobe.d",
             "/proc/cmdline",
-            "/proc/driver",
             "/proc/zoneinfo",
             "/proc/sys/kernel/tainted",
             "/proc/buddyinfo"])
+        self.addPseudoCopySpec("/sys/module/*/parameters", aggregate=True)
+        self.addPseudoCopySpec("/proc/driver")
+        self.addStringAsFile(self.format_inventory(), "module_inventory")
         self.collectExtOutput("/usr/sbin/dkms status")
 
     def diagnose(self):
 
-        infd = open("/proc/modules", "r")
-        for modname in infd.readlines():
-            modname=modname.split(" ")[0]
-            ret, modinfo_srcver, rtime = self.callExtProg("/sbin/modinfo -F srcversion %s" % modname)
-            if not os.access("/sys/module/%s/srcversion" % modname, os.R_OK):
+        for module in self.get_inventory():
+            # nothing to compare without both srcversions, as for modules
+            # built in, compressed with xz or zstd, or missing from
+            # modules.dep
+            if not module['loaded_srcversion'] or not module['srcversion']:
                 continue
-            infd = open("/sys/module/%s/srcversion" % modname, "r")
-            sys_srcver = infd.read().strip("\n")
-            infd.close()
-            if modinfo_srcver != sys_srcver:
-                self.addDiagnose("loaded module %s differs from the one present on the file-system" % modname)
+            if module['srcversion'] != module['loaded_srcversion']:
+                self.addDiagnose("loaded module %s differs from the one present on the file-system" % module['name'])
 
             # this would be a good moment to check the module's signature
             # but at the moment there's no easy way to do that outside of
             # the kernel. i will probably need to write a C lib (derived from
             # the kernel sources to do this verification.
 
-        infd.close()
-
     def analyze(self):
 
         savedtaint = os.path.join(self.cInfo['dstroot'], "/proc/sys/kernel/tainted")
@@ -105,14 +258,15 @@ class kernel(Plugin, RedHatPlugin, DebianPlugin, UbuntuPlugin):
         if (line != "0"):
             self.addAlert("Kernel taint flag is <%s>\n" % line)
 
-        infd = open(self.moduleFile, "r")
-        modules = infd.readlines()
-        infd.close()
+        modules = self.get_inventory()
 
         for tainter in self.taintList:
             p = re.compile(tainter['regex'])
-            for line in modules:
-                if p.match(line) != None:
+            for module in modules:
+                if p.match(module['name']) != None:
                     # found a taint match, create an alert
-                    moduleName = line.split()[0]
-                    self.addAlert("Check for tainted kernel by module %s, which is %s" % (moduleName, tainter['description']))
+                    self.addAlert("Check for tainted kernel by module %s, which is %s" % (module['name'], tainter['description']))
+
+        for module in modules:
+            if module['taint']:
+                self.addAlert("Module %s taints the kernel (%s)" % (module['name'], module['taint']))
@@ -42,6 +42,4 @@ class ldap(Plugin, RedHatPlugin):
 
     def setup(self):
         self.addCopySpecs(["/etc/ldap.conf", "/etc/openldap"])
-
-    def postproc(self):
-        self.doRegexSub("/etc/ldap.conf", r"(\s*bindpw\s*)\S+", r"\1***")
+        self.addScrubRule("/etc/ldap.conf", r"(\s*bindpw\s*)\S+", r"\1***")
@@ -19,20 +19,75 @@ import re
 class networking(Plugin, RedHatPlugin):
     """network related information
     """
-    optionList = [("traceroute", "collects a traceroute to rhn.redhat.com", "slow", False)]
+    optionList = [("traceroute", "collects a traceroute to rhn.redhat.com", "slow", False),
+                  ("physical", "only run ethtool on physical interfaces", "fast", False),
+                  ("interfaces", "only run ethtool on interfaces matching this regular expression", "fast", "")]
+    provides = ("ip_addr",)
+    consumes = ("lsmod",)
+    ethtoolOptions = ["", "-i", "-k", "-S", "-a", "-c", "-g"]
+    net_class = "/sys/class/net"
 
     def get_interface_name(self,ipaddrOut):
         """Return a dictionary for which key are interface name according to the
-        output of ifconifg-a stored in ifconfigFile.
+        output of ip -o addr.
         """
         out={}
-        for line in ipaddrOut[1].splitlines():
+        for line in ipaddrOut.splitlines():
             match=re.match('.*link/ether', line)
             if match:
                 int=match.string.split(':')[1].lstrip()
                 out[int]=True
         return out
 
+    def get_ethernet_interfaces(self, ipaddrOut):
+        """Return the names of the ethernet interfaces, read from sysfs when
+        it is available and from the output of ip -o addr otherwise.
+        """
+        if not os.path.isdir(self.net_class):
+            return sorted(self.get_interface_name(ipaddrOut))
+        interfaces = []
+        for name in sorted(os.listdir(self.net_class)):
+            try:
+                fp = open(os.path.join(self.net_class, name, "type"))
+                try:
+                    # ARPHRD_ETHER, the interfaces ip shows as link/ether
+                    if fp.read().strip() != "1":
+                        continue
+                finally:
+                    fp.close()
+            except IOError:
+                continue
+            interfaces.append(name)
+        return interfaces
+
+    def filter_interfaces(self, interfaces):
+        """Apply the physical and interfaces options to a list of interface
+        names"""
+        if self.getOption("physical"):
+            interfaces = [name for name in interfaces
+                          if os.path.exists(os.path.join(self.net_class, name, "device"))]
+        pattern = self.getOption("interfaces")
+        if pattern and isinstance(pattern, basestring):
+            regex = re.compile(pattern)
+            interfaces = [name for name in interfaces if regex.match(name)]
+        return interfaces
+
+    def ethtool_command(self, interface):
+        """Return a shell command running every ethtool query for interface,
+        each output preceded by a header naming the query"""
+        queries = []
+        for option in self.ethtoolOptions:
+            query = " ".join(filter(None, ["/sbin/ethtool", option, interface]))
+            queries.append("echo '### %s'; %s 2>&1" % (query, query))
+        return "; ".join(queries)
+
+    def collectEthtool(self, interfaces):
+        """Queue one command per interface, its output goes into a single
+        file holding every ethtool query"""
+        for interface in interfaces:
+            self.collectExtOutput(self.ethtool_command(interface),
+                                  suggest_filename = "ethtool_%s" % interface)
+
     def collectIPTable(self,tablename):
         """ When running the iptables command, it unfortunately auto-loads
         the modules before trying to get output.  Some people explicitly
@@ -41,14 +96,14 @@ class networking(Plugin, RedHatPlugin):
         relevant rules in that table """
 
 
-        (status, output, time) = self.callExtProg("/sbin/lsmod | grep -q "+tablename)
-        if status == 0:
-            cmd = "/sbin/iptables -t "+tablename+" -nvL"
-            self.collectExtOutput(cmd)
+        for module in self.getArtifact("lsmod"):
+            if tablename in module:
+                cmd = "/sbin/iptables -t "+tablename+" -nvL"
+                self.collectExtOutput(cmd)
+                break
 
     def setup(self):
         self.addCopySpecs([
-            "/proc/net",
             "/etc/nsswitch.conf",
             "/etc/yp.conf",
             "/etc/inetd.conf",
@@ -56,15 +111,15 @@ class networking(Plugin, RedHatPlugin):
             "/etc/xinetd.d",
             "/etc/host*",
             "/etc/resolv.conf"])
-        ipaddrFile=self.collectOutputNow("/sbin/ip -o addr", root_symlink = "ip_addr")
-        ipaddrOut=self.callExtProg("/sbin/ip -o addr")
+        self.addPseudoCopySpec("/proc/net")
+        ipaddrOut=self.provideArtifact("ip_addr", root_symlink = "ip_addr")
         self.collectExtOutput("/sbin/route -n", root_symlink = "route")
         self.collectIPTable("filter")
         self.collectIPTable("nat")
         self.collectIPTable("mangle")
         self.collectExtOutput("/bin/netstat -s")
         self.collectExtOutput("/bin/netstat -agn")
-        self.collectExtOutput("/bin/netstat -neopa", root_symlink = "netstat")
+        self.collectExtOutput("/bin/netstat -neopa", root_symlink = "netstat", sizelimit=10)
         self.collectExtOutput("/sbin/ip route show table all")
         self.collectExtOutput("/sbin/ip -6 route show table all")
         self.collectExtOutput("/sbin/ip link")
@@ -72,14 +127,7 @@ class networking(Plugin, RedHatPlugin):
         self.collectExtOutput("/sbin/ifenslave -a")
         self.collectExtOutput("/sbin/ip mroute show")
         self.collectExtOutput("/sbin/ip maddr show")
-        if ipaddrOut:
-            for eth in self.get_interface_name(ipaddrOut):
-                self.collectExtOutput("/sbin/ethtool "+eth)
-                self.collectExtOutput("/sbin/ethtool -i "+eth)
-                self.collectExtOutput("/sbin/ethtool -k "+eth)
-                self.collectExtOutput("/sbin/ethtool -S "+eth)
-                self.collectExtOutput("/sbin/ethtool -a "+eth)
-                self.collectExtOutput("/sbin/ethtool -c "+eth)
-                self.collectExtOutput("/sbin/ethtool -g "+eth)
+        self.collectEthtool(self.filter_interfaces(
+                self.get_ethernet_interfaces(ipaddrOut or "")))
         if self.getOption("traceroute"):
             self.collectExtOutput("/bin/traceroute -n rhn.redhat.com")
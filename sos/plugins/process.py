@@ -13,46 +13,44 @@
 ## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
 
 from sos.plugins import Plugin, RedHatPlugin
-import time
+from sos.watchdog import stuck_processes
 import os
 
 class process(Plugin, RedHatPlugin):
     """process information
     """
+    optionList = [("native", "render ps, pstree and lsof output from a single read of /proc", "fast", True)]
+    consumes = ("processes",)
+
     def setup(self):
+        if self.getOption("native") and os.path.isdir("/proc/self"):
+            # one consistent view of the process table instead of five
+            snapshot = self.getArtifact("processes")
+            self.addStringAsFile(snapshot.ps_aux(), "ps_auxwww", root_symlink = "ps")
+            self.addStringAsFile(snapshot.ps_aux_threads(), "ps_auxwwwm")
+            self.addStringAsFile(snapshot.ps_alx(), "ps_alxwww")
+            self.addStringAsFile(snapshot.pstree(), "pstree", root_symlink = "pstree")
+            self.addStringAsFile(snapshot.lsof(), "lsof_-b_M_-n_-l", root_symlink = "lsof")
+            return
+
         self.collectExtOutput("/bin/ps auxwww", root_symlink = "ps")
         self.collectExtOutput("/bin/ps auxwwwm")
         self.collectExtOutput("/bin/ps alxwww")
         self.collectExtOutput("/usr/bin/pstree", root_symlink = "pstree")
-        self.collectExtOutput("/usr/sbin/lsof -b +M -n -l", root_symlink = "lsof")
+        self.collectExtOutput("/usr/sbin/lsof -b +M -n -l", root_symlink = "lsof", sizelimit=25)
 
     def find_mountpoint(s):
         if (os.path.ismount(s) or len(s)==0): return s
         else: return mountpoint(os.path.split(s)[0])
 
     def diagnose(self):
-        from subprocess import Popen, PIPE
-        # check that no process is in state D
-        dpids = []
-        p = Popen("/bin/ps -A -o state,pid --no-heading", shell=True, stdout=PIPE, stderr=PIPE, bufsize=-1)
-        out, err = p.communicate()
-        if not p.returncode:
-            for line in out.split("\n")[:-1]:
-                line = line.split()
-                if line[0] == "D":
-                    # keep an eye on the process to see if the stat changes
-                    for inc in range(1,10):
-                        try:
-                            if len(self.fileGrep("^State: D", " /proc/%d/status" % int(line[1]))) == 0:
-                                # status is not D, good. let's get out of the loop.
-                                time.sleep(0.1 * inc)
-                                continue
-                        except IOError:
-                            # this should never happen...
-                            pass
-                    else:
-                        # still D after 0.1 * range(1,5) seconds
-                        dpids.append(int(line[1]))
-
-        if len(dpids):
-            self.addDiagnose("one or more processes are in state D (sosreport might hang)")
+        # the watchdog has already looked for processes stuck in state D,
+        # unless it never ran
+        watchdog = self.cInfo.get('watchdog')
+        if watchdog and watchdog.checked:
+            stuck = watchdog.stuck
+        else:
+            stuck = stuck_processes()
+        if stuck:
+            self.addDiagnose("one or more processes are in state D (sosreport might hang): %s"
+                             % ", ".join(str(pid) for pid, comm in stuck))
@@ -33,9 +33,7 @@ class RedHatRadius(radius, RedHatPlugin):
     def setup(self):
         super(RedHatRadius, self).setup()
         self.addCopySpecs(["/etc/raddb", "/etc/pam.d/radiusd", "/var/log/radius"])
-
-    def postproc(self):
-        self.doRegexSub("/etc/raddb/sql.conf", r"(\s*password\s*=\s*)\S+", r"\1***")
+        self.addScrubRule("/etc/raddb/sql.conf", r"(\s*password\s*=\s*)\S+", r"\1***")
 
 class DebianRadius(radius, DebianPlugin, UbuntuPlugin):
     """radius related information on Debian distributions
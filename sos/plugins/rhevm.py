@@ -13,11 +13,7 @@ class rhevm(Plugin, RedHatPlugin):
         if self.getOption("vdsmlogs"):
             self.addCopySpec(self.getOption("vdsmlogs"))
 
-    def postproc(self):
-        """
-        Obfuscate passwords.
-        """
-
-        self.doRegexSub("/etc/rhevm/rhevm-config/rhevm-config.properties",
+        # Obfuscate passwords.
+        self.addScrubRule("/etc/rhevm/rhevm-config/rhevm-config.properties",
                         r"Password.type=(.*)",
                         r'Password.type=********')
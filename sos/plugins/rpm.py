@@ -13,12 +13,203 @@
 ## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
 
 from sos.plugins import Plugin, RedHatPlugin
+from sos.utilities import cpu_count
+import os
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+def shard(items, size):
+    """Splits items into consecutive lists of at most size elements"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def shard_size(count, workers, most=50):
+    """Packages differ a lot in size, so every worker gets several shards to
+    keep it busy until the end"""
+    return max(1, min(most, -(-count // (workers * 4))))
+
+def package_files(output):
+    """Takes lines of package name and file name separated by a tab and
+    returns a dictionary mapping every file to the set of packages owning it
+    and one mapping every package to its files"""
+    owners = {}
+    files = {}
+    for line in output.splitlines():
+        try:
+            name, path = line.split("\t", 1)
+        except ValueError:
+            continue
+        owners.setdefault(path, set()).add(name)
+        files.setdefault(name, []).append(path)
+    return owners, files
+
+def verified_path(line):
+    """Returns the file a line of rpm -V output is about"""
+    fields = line.split()
+    if fields and fields[-1].startswith("/"):
+        return fields[-1]
+
+def unchanged_since(paths, since):
+    """Returns True if none of paths has changed since the time since"""
+    for path in paths:
+        try:
+            if os.lstat(path).st_ctime >= since:
+                return False
+        except OSError:
+            return False
+    return True
 
 class rpm(Plugin, RedHatPlugin):
     """RPM information
     """
     optionList = [("rpmq", "queries for package information via rpm -q", "fast", True),
-                  ("rpmva", "runs a verify on all packages", "slow", False)]
+                  ("rpmva", "runs a verify on all packages", "slow", False),
+                  ("rpmva-workers", "number of threads the verify is split for (0 for one per cpu)", "slow", 0),
+                  ("rpmva-cache", "reuse the last verify for packages whose files did not change", "slow", False)]
+
+    verify_cache = "/var/lib/sos/rpm-verify.json"
+    files_query = "/bin/rpm -qa --qf=\"[%{NAME}\t%{FILENAMES}\n]\""
+
+    # the packages verified by each shard command, set by verify_sharded()
+    shards = None
+
+    def shard_command(self, names):
+        return "/bin/rpm -V %s" % " ".join(names)
+
+    def load_cache(self, names, files, versions):
+        """Returns the cached verify results of the packages in names that
+        are still valid"""
+        try:
+            fp = open(self.verify_cache)
+            try:
+                cache = json.load(fp)
+            finally:
+                fp.close()
+        except (IOError, ValueError):
+            return {}
+
+        valid = {}
+        for name in names:
+            entry = cache.get("packages", {}).get(name)
+            if (entry and entry.get("version") == versions.get(name)
+                    and unchanged_since(files.get(name, ()), cache.get("time", 0))):
+                valid[name] = entry
+        return valid
+
+    def save_cache(self, start, packages):
+        try:
+            directory = os.path.dirname(self.verify_cache)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            tmp = self.verify_cache + ".tmp"
+            fp = open(tmp, "w")
+            try:
+                json.dump({"time": start, "packages": packages}, fp)
+            finally:
+                fp.close()
+            os.rename(tmp, self.verify_cache)
+        except (IOError, OSError, ValueError):
+            pass
+
+    def verify_sharded(self, names, workers):
+        """Queues the verification of the packages in names as commands
+        verifying a few packages each, for sosreport to run in parallel
+        with the other commands. Packages whose verify is cached are left
+        out, postproc() puts the results back together."""
+        self.verify_start = time.time()
+        self.names = names
+        self.versions = dict((name, ".".join(pkg["version"])) for name, pkg in
+                             self.policy().package_manager.allPkgs().iteritems())
+        self.use_cache = self.getOption("rpmva-cache")
+        self.owners, self.cached = {}, {}
+        if self.use_cache:
+            status, output, runtime = self.callExtProg(self.files_query)
+            self.owners, files = package_files(output)
+            self.cached = self.load_cache(names, files, self.versions)
+
+        pending = [name for name in names if name not in self.cached]
+        self.shards = shard(pending, shard_size(len(pending), workers))
+        self.shard_index = {}
+        self.shard_outputs = {}
+        for index, members in enumerate(self.shards):
+            command = self.shard_command(members)
+            self.shard_index[command] = index
+            self.collectExtOutput(command, suggest_filename = "rpm-Va.%03d" % index,
+                                  timeout = 3600)
+
+    def collectCommand(self, progs):
+        if not self.shards:
+            return Plugin.collectCommand(self, progs)
+        index = self.shard_index.get(progs[0])
+        if index is None:
+            return Plugin.collectCommand(self, progs)
+        prog, suggest_filename, root_symlink, timeout, sizelimit = progs
+        try:
+            outfn, status, output = self._collectOutput(prog, suggest_filename,
+                    root_symlink, timeout, sizelimit)
+            if outfn:
+                self.shard_outputs[index] = output
+        except Exception, e:
+            self.soslog.debug("error collection output of '%s', traceback follows: %s" % (prog, e))
+
+    def _record_runtime(self, exe):
+        # a shard lists different packages every run
+        return not (self.shards and exe in self.shard_index)
+
+    def shard_output(self, index):
+        """Returns the output of shard index, read back from the archive if
+        the shard was run before the collection was resumed"""
+        if index in self.shard_outputs:
+            return self.shard_outputs[index]
+        try:
+            fp = self.archive.open_file(os.path.join(self.cInfo['cmddir'],
+                    self.name(), "rpm-Va.%03d" % index))
+            try:
+                return fp.read()
+            finally:
+                fp.close()
+        except (IOError, OSError, KeyError):
+            return None
+
+    def verify_report(self):
+        """Returns the output of the shards and the cached results in the
+        order of the packages, and updates the cache from the shards"""
+        starts = {}
+        outputs = [self.shard_output(index) for index in range(len(self.shards))]
+        cached = dict(self.cached)
+        for index, members in enumerate(self.shards):
+            starts[members[0]] = index
+            output = outputs[index]
+            if not self.use_cache or output is None:
+                continue
+            # only cache a shard whose every line can be told apart by package
+            lines = dict((name, []) for name in members)
+            for line in output.splitlines():
+                owned = set(members).intersection(self.owners.get(verified_path(line), ()))
+                if not owned:
+                    break
+                for name in owned:
+                    lines[name].append(line)
+            else:
+                for name in members:
+                    cached[name] = {"version": self.versions.get(name),
+                                    "lines": lines[name]}
+
+        report = []
+        for name in self.names:
+            if name in starts:
+                output = outputs[starts[name]]
+                if output:
+                    report.append(output.rstrip("\n") + "\n")
+            elif name in self.cached:
+                report.extend(line.encode("utf-8") + "\n"
+                              for line in self.cached[name]["lines"])
+        if self.use_cache:
+            self.save_cache(self.verify_start, cached)
+        return "".join(report)
 
     def setup(self):
         self.addCopySpec("/var/log/rpmpkgs")
@@ -27,4 +218,17 @@ class rpm(Plugin, RedHatPlugin):
             self.collectExtOutput("/bin/rpm -qa --qf=\"%{NAME}-%{VERSION}-%{RELEASE}.%{ARCH}~~%{INSTALLTIME:date}\t%{INSTALLTIME}\t%{VENDOR}\n\" --nosignature --nodigest|/bin/awk -F ~~ '{printf \"%-60s%s\\n\",$1,$2}'|sort", root_symlink = "installed-rpms")
 
         if self.getOption("rpmva"):
-            self.collectExtOutput("/bin/rpm -Va", root_symlink = "rpm-Va", timeout = 3600)
+            workers = int(self.getOption("rpmva-workers")) or cpu_count()
+            names = sorted(self.policy().package_manager.allPkgs())
+            if workers > 1 and names:
+                self.verify_sharded(names, workers)
+            else:
+                self.collectExtOutput("/bin/rpm -Va", root_symlink = "rpm-Va", timeout = 3600)
+
+    def postproc(self):
+        if self.shards is None:
+            return
+        content = self.verify_report()
+        path = os.path.join(self.cInfo['cmddir'], self.name(), "rpm-Va")
+        self.archive.add_string(content, path)
+        self._add_root_symlink(path, "rpm-Va", content)
@@ -13,22 +13,119 @@
 ## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
 
 from sos.plugins import Plugin, RedHatPlugin, DebianPlugin, UbuntuPlugin
+from sos.utilities import parallel_map, cpu_count
 from os import listdir
+import os
+import time
 
 class sar(Plugin, RedHatPlugin, DebianPlugin, UbuntuPlugin):
     """Generate the sar file from /var/log/sa/saXX files
     """
 
+    optionList = [("days", "only convert the sa files of the last N days (0 for all)", "", 0),
+                  ("cache", "reuse the conversions cached by earlier runs", "", True)]
     files = ('/var/log/sa', '/usr/bin/sar')
+    path = "/var/log/sa"
+    cache_dir = "/var/lib/sos/sar"
+
+    def cache_file(self, fname, st):
+        """The conversion of fname is cached under a name that records the
+        size and mtime of the sa file it was made from, so a cached file is
+        never reused once the sa file has changed"""
+        return os.path.join(self.cache_dir, "%s.%d.%d"
+                            % (fname, st.st_size, int(st.st_mtime)))
+
+    def read_cache(self, fname, st):
+        try:
+            fp = open(self.cache_file(fname, st))
+            try:
+                return fp.read()
+            finally:
+                fp.close()
+        except IOError:
+            return None
+
+    def write_cache(self, fname, st, content):
+        """Replaces any earlier conversion of fname, silently giving up if
+        the cache is not writable"""
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            for old in listdir(self.cache_dir):
+                if old.rsplit(".", 2)[0] == fname:
+                    os.unlink(os.path.join(self.cache_dir, old))
+            filename = self.cache_file(fname, st)
+            fp = open(filename + ".tmp", "w")
+            try:
+                fp.write(content)
+            finally:
+                fp.close()
+            os.rename(filename + ".tmp", filename)
+        except (IOError, OSError):
+            pass
+
+    def sar_command(self, fname):
+        return "/bin/sh -c \"LANG=C /usr/bin/sar -A -f " + os.path.join(self.path, fname) + "\""
+
+    def convert(self, fname):
+        """Returns the exit status, output and runtime of the conversion of
+        fname"""
+        return self.callExtProg(self.sar_command(fname))
+
+    def sa_files(self, dirList, days=0):
+        """Returns (fname, sar_filename, st) for every sa file in dirList
+        that has no sar file of its own, leaving out those not modified in
+        the last days days when days is set"""
+        oldest = days and time.time() - days * 86400
+        found = []
+        for fname in sorted(dirList):
+            if fname[0:2] == 'sa' and fname[2:3] != 'r':
+                sar_filename = 'sar' + fname[2:4]
+                if sar_filename in dirList:
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.path, fname))
+                except OSError:
+                    continue
+                if st.st_mtime < oldest:
+                    continue
+                found.append((fname, sar_filename, st))
+        return found
+
+    def add_output(self, fname, sar_filename, content):
+        """Stores the conversion of fname with the output of the other
+        commands, as it would have been had sar been run by
+        collectOutputNow(), and links it from the top of the report"""
+        outfn = self.makeCommandFilename(sar_filename)
+        self.archive.add_string(content, outfn)
+        self._add_root_symlink(outfn, sar_filename, content)
+        outfn_strip = outfn[len(self.cInfo['cmddir'])+1:]
+        self.executedCommands.append({'exe': self.sar_command(fname),
+                                      'file': outfn_strip})
+        return outfn_strip
 
     def setup(self):
-        path="/var/log/sa"
-        dirList=listdir(path)
+        use_cache = self.getOption("cache")
+
         # find all the sa file that don't have an existing sar file
-        for fname in dirList:
-            if fname[0:2] == 'sa' and fname[2] != 'r':
-                sar_filename = 'sar' + fname[2:4]
-                if sar_filename not in dirList:
-                    sar_command = "/bin/sh -c \"LANG=C /usr/bin/sar -A -f /var/log/sa/" + fname + "\""
-                    self.collectOutputNow(sar_command, sar_filename, root_symlink=sar_filename)
+        pending = []
+        for fname, sar_filename, st in self.sa_files(listdir(self.path),
+                                                     int(self.getOption("days"))):
+            content = use_cache and self.read_cache(fname, st)
+            if content:
+                self.add_output(fname, sar_filename, content)
+            else:
+                pending.append((fname, sar_filename, st))
 
+        # every conversion keeps a cpu busy
+        results = parallel_map(self.convert, [fname for fname, sar_filename, st in pending],
+                               cpu_count())
+        for (fname, sar_filename, st), (status, content, runtime) in zip(pending, results):
+            if status != 0:
+                continue
+            outfn = self.add_output(fname, sar_filename, content)
+            self.cInfo['manifest'].add_command(cmdline=self.sar_command(fname),
+                    exitcode=status, f_stdout=outfn, runtime=runtime,
+                    size=len(content))
+            if use_cache:
+                self.write_cache(fname, st, content)
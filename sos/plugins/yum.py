@@ -54,7 +54,7 @@ class yum(Plugin, RedHatPlugin):
             # Get a list of channels the machine is subscribed to.
             self.collectExtOutput("/bin/echo \"repo list\" | /usr/bin/yum shell")
             # List various information about available packages
-            self.collectExtOutput("/usr/bin/yum list")
+            self.collectExtOutput("/usr/bin/yum list", sizelimit=10)
 
         if self.getOption("yumdebug") and self.isInstalled('yum-utils'):
             # RHEL6+ alternative for this whole function:
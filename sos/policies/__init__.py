@@ -6,10 +6,9 @@ import platform
 import time
 import fnmatch
 
-from sos.utilities import ImporterHelper, import_module, get_hash_name
+from sos.utilities import ImporterHelper, import_module, get_hash_name, checksum
 from sos.plugins import IndependentPlugin
 from sos import _sos as _
-import hashlib
 
 def import_policy(name):
     policy_fqname = "sos.policies.%s" % name
@@ -217,11 +216,7 @@ No changes will be made to your system.
         if not final_filename:
             return False
 
-        archive_fp = open(final_filename, 'rb')
-        digest = hashlib.new(get_hash_name())
-        digest.update(archive_fp.read())
-        archive_fp.close()
-        return digest.hexdigest()
+        return checksum(final_filename)
 
     def getPreferredHashAlgorithm(self):
         """Returns the string name of the hashlib-supported checksum algorithm
@@ -234,12 +229,14 @@ No changes will be made to your system.
         if not final_filename:
            return False
 
-        # store checksum into file
-        fp = open(final_filename + "." + get_hash_name(), "w")
-        checksum = self._create_checksum(final_filename)
-        if checksum:
-            fp.write(checksum + "\n")
-        fp.close()
+        # store checksum into file, a directory has none
+        checksum = None
+        if os.path.isfile(final_filename):
+            fp = open(final_filename + "." + get_hash_name(), "w")
+            checksum = self._create_checksum(final_filename)
+            if checksum:
+                fp.write(checksum + "\n")
+            fp.close()
 
         self._print()
         self._print(_("Your sosreport has been generated and saved in:\n  %s") % final_filename)
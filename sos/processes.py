@@ -0,0 +1,424 @@
+"""
+A snapshot of every process on the system taken in one pass over /proc, from
+which the output of ps, pstree and lsof is rendered without each of them
+walking /proc again
+"""
+## processes.py
+## read the process table once
+
+### This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+from __future__ import with_statement
+
+import os
+import pwd
+import stat
+import threading
+import time
+
+from sos.utilities import parallel_map
+
+
+def read_file(path):
+    try:
+        fp = open(path)
+        try:
+            return fp.read()
+        finally:
+            fp.close()
+    except (IOError, OSError):
+        return None
+
+
+def parse_stat(content):
+    """Splits the content of /proc/<pid>/stat into the command name and the
+    list of the fields following it. The command name may itself contain
+    spaces and parentheses."""
+    start = content.index("(")
+    end = content.rindex(")")
+    return content[start + 1:end], content[end + 2:].split()
+
+
+def parse_status(content):
+    status = {}
+    for line in content.splitlines():
+        key, sep, value = line.partition(":")
+        if sep:
+            status[key] = value.strip()
+    return status
+
+
+def tty_name(tty_nr):
+    """Returns the name ps shows for the controlling terminal tty_nr"""
+    major = (tty_nr >> 8) & 0xfff
+    minor = (tty_nr & 0xff) | ((tty_nr >> 12) & 0xfff00)
+    if 136 <= major <= 143:
+        return "pts/%d" % (minor + (major - 136) * 256)
+    if major == 4:
+        if minor < 64:
+            return "tty%d" % minor
+        return "ttyS%d" % (minor - 64)
+    return "?"
+
+
+def cpu_time(ticks, hz):
+    seconds = ticks // hz
+    return "%d:%02d" % (seconds // 60, seconds % 60)
+
+
+_user_names = {}
+_user_names_lock = threading.Lock()
+
+def user_name(uid):
+    with _user_names_lock:
+        if uid in _user_names:
+            return _user_names[uid]
+    try:
+        name = pwd.getpwuid(uid)[0]
+    except KeyError:
+        name = str(uid)
+    if len(name) > 8:
+        name = name[:7] + "+"
+    with _user_names_lock:
+        _user_names[uid] = name
+    return name
+
+
+FILE_TYPES = (
+    (stat.S_ISREG, "REG"),
+    (stat.S_ISDIR, "DIR"),
+    (stat.S_ISCHR, "CHR"),
+    (stat.S_ISBLK, "BLK"),
+    (stat.S_ISFIFO, "FIFO"),
+    (stat.S_ISSOCK, "sock"),
+    (stat.S_ISLNK, "LINK"),
+)
+
+def file_type(mode):
+    for test, name in FILE_TYPES:
+        if test(mode):
+            return name
+    return "unknown"
+
+
+class Process(object):
+    """The state of a single process as read from /proc/<pid>"""
+
+    __slots__ = ('pid', 'comm', 'state', 'ppid', 'pgrp', 'session', 'tty_nr',
+                 'tpgid', 'flags', 'ticks', 'priority', 'nice', 'nlwp',
+                 'starttime', 'vsize', 'rss', 'uid', 'wchan', 'cmdline',
+                 'threads', 'files')
+
+    def __init__(self, pid, comm, fields):
+        self.pid = pid
+        self.comm = comm
+        self.state = fields[0]
+        self.ppid, self.pgrp, self.session, self.tty_nr, self.tpgid, \
+            self.flags = [int(field) for field in fields[1:7]]
+        self.ticks = int(fields[11]) + int(fields[12])
+        self.priority, self.nice, self.nlwp = [int(field) for field in fields[15:18]]
+        self.starttime = int(fields[19])
+        self.vsize = int(fields[20])
+        self.rss = int(fields[21])
+        self.uid = 0
+        self.wchan = "-"
+        self.cmdline = []
+        self.threads = []
+        self.files = []
+
+    def command(self):
+        if self.cmdline:
+            return " ".join(self.cmdline)
+        return "[%s]" % self.comm
+
+    def stat_flags(self):
+        """The STAT column of ps in BSD format"""
+        flags = self.state
+        if self.nice < 0:
+            flags += "<"
+        elif self.nice > 0:
+            flags += "N"
+        if self.session == self.pid:
+            flags += "s"
+        if self.nlwp > 1:
+            flags += "l"
+        if self.tpgid > 0 and self.tpgid == self.pgrp:
+            flags += "+"
+        return flags
+
+
+def target_stat(target, is_hung=None):
+    """Returns the lstat of target, the path a /proc link points at. The
+    link itself is never followed, that would block on a dead NFS or FUSE
+    server, and targets is_hung reports are not looked at at all. None is
+    returned for those, for deleted files and for sockets, pipes and other
+    objects that are not paths."""
+    if not target.startswith("/") or target.endswith(" (deleted)"):
+        return None
+    if is_hung and is_hung(target):
+        return None
+    try:
+        return os.lstat(target)
+    except OSError:
+        return None
+
+
+def read_files(path, limit, is_hung=None):
+    """Returns a (fd, target, st, flags) tuple for the current directory,
+    root directory, executable and at most limit open files of the process
+    at path. st is None when target_stat() cannot tell, flags for the
+    open files come from fdinfo."""
+    files = []
+    for fd in ("cwd", "rtd", "txt"):
+        name = {"rtd": "root", "txt": "exe"}.get(fd, fd)
+        try:
+            target = os.readlink(os.path.join(path, name))
+        except OSError:
+            continue
+        files.append((fd, target, target_stat(target, is_hung), None))
+    try:
+        fds = sorted(os.listdir(os.path.join(path, "fd")), key=int)[:limit]
+    except OSError:
+        return files
+    for fd in fds:
+        try:
+            target = os.readlink(os.path.join(path, "fd", fd))
+        except OSError:
+            continue
+        fdinfo = parse_status(read_file(os.path.join(path, "fdinfo", fd)) or "")
+        flags = int(fdinfo.get("flags", "0"), 8)
+        files.append((fd, target, target_stat(target, is_hung), flags))
+    return files
+
+
+def read_process(path, pid, fd_limit=1024, thread_limit=1024, is_hung=None):
+    """Reads the process pid below the proc mount point path. Returns None if
+    it exited while being read."""
+    base = os.path.join(path, str(pid))
+    content = read_file(os.path.join(base, "stat"))
+    if not content:
+        return None
+    comm, fields = parse_stat(content)
+    process = Process(pid, comm, fields)
+
+    status = parse_status(read_file(os.path.join(base, "status")) or "")
+    if "Uid" in status:
+        process.uid = int(status["Uid"].split()[0])
+    cmdline = read_file(os.path.join(base, "cmdline")) or ""
+    process.cmdline = cmdline.rstrip("\0").split("\0") if cmdline else []
+    wchan = read_file(os.path.join(base, "wchan"))
+    if wchan and wchan != "0":
+        process.wchan = wchan
+    if fd_limit:
+        process.files = read_files(base, fd_limit, is_hung)
+
+    if process.nlwp > 1 and thread_limit:
+        try:
+            tids = sorted(os.listdir(os.path.join(base, "task")), key=int)
+        except OSError:
+            tids = []
+        for tid in tids[:thread_limit]:
+            content = read_file(os.path.join(base, "task", tid, "stat"))
+            if content:
+                junk, fields = parse_stat(content)
+                process.threads.append((int(tid), fields[0],
+                        int(fields[11]) + int(fields[12]), int(fields[19])))
+    return process
+
+
+class Snapshot(object):
+    """Every process found below the proc mount point path. The processes
+    are read on at most workers threads; fd_limit and thread_limit bound the
+    number of open files and threads kept for each of them. Open files for
+    which is_hung returns True are listed without being looked at."""
+
+    def __init__(self, path="/proc", workers=4, fd_limit=1024, thread_limit=1024,
+                 is_hung=None):
+        self.path = path
+        self.hz = os.sysconf("SC_CLK_TCK")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self.taken = time.time()
+        self.uptime = float((read_file(os.path.join(path, "uptime")) or "0").split()[0])
+        self.boot_time = self.taken - self.uptime
+        meminfo = parse_status(read_file(os.path.join(path, "meminfo")) or "")
+        self.mem_total = int(meminfo.get("MemTotal", "0 kB").split()[0]) * 1024
+
+        pids = sorted(int(entry) for entry in os.listdir(path) if entry.isdigit())
+        processes = parallel_map(
+                lambda pid: read_process(path, pid, fd_limit, thread_limit, is_hung),
+                pids, workers)
+        self.processes = [process for process in processes if process]
+
+    def _cpu(self, ticks, starttime):
+        elapsed = self.uptime - float(starttime) / self.hz
+        if elapsed <= 0:
+            return 0.0
+        return 100.0 * ticks / self.hz / elapsed
+
+    def _mem(self, process):
+        if not self.mem_total:
+            return 0.0
+        return 100.0 * process.rss * self.page_size / self.mem_total
+
+    def _start(self, starttime):
+        started = self.boot_time + float(starttime) / self.hz
+        if self.taken - started < 24 * 3600:
+            return time.strftime("%H:%M", time.localtime(started))
+        if time.localtime(started)[0] == time.localtime(self.taken)[0]:
+            return time.strftime("%b%d", time.localtime(started))
+        return time.strftime("%Y", time.localtime(started))
+
+    AUX = "%-8s %5s %4s %4s %6s %5s %-8s %-4s %5s %6s %s"
+
+    def _aux_line(self, process):
+        return self.AUX % (user_name(process.uid), process.pid,
+                "%.1f" % self._cpu(process.ticks, process.starttime),
+                "%.1f" % self._mem(process), process.vsize // 1024,
+                process.rss * self.page_size // 1024, tty_name(process.tty_nr),
+                process.stat_flags(), self._start(process.starttime),
+                cpu_time(process.ticks, self.hz), process.command())
+
+    def ps_aux(self):
+        """Output in the format of ps auxwww"""
+        lines = [self.AUX % ("USER", "PID", "%CPU", "%MEM", "VSZ", "RSS", "TTY",
+                             "STAT", "START", "TIME", "COMMAND")]
+        for process in self.processes:
+            lines.append(self._aux_line(process))
+        return "\n".join(lines) + "\n"
+
+    def ps_aux_threads(self):
+        """Output in the format of ps auxwwwm, every process followed by its
+        threads"""
+        lines = [self.AUX % ("USER", "PID", "%CPU", "%MEM", "VSZ", "RSS", "TTY",
+                             "STAT", "START", "TIME", "COMMAND")]
+        for process in self.processes:
+            lines.append(self._aux_line(process))
+            threads = process.threads or [(process.pid, process.state,
+                                           process.ticks, process.starttime)]
+            for tid, state, ticks, starttime in threads:
+                lines.append(self.AUX % (user_name(process.uid), "-",
+                        "%.1f" % self._cpu(ticks, starttime), "-", "-", "-", "-",
+                        state, "-", cpu_time(ticks, self.hz), "-"))
+        return "\n".join(lines) + "\n"
+
+    ALX = "%1s %5s %5s %5s %3s %3s %6s %5s %-6s %-4s %-10s %4s %s"
+
+    def ps_alx(self):
+        """Output in the format of ps alxwww"""
+        lines = [self.ALX % ("F", "UID", "PID", "PPID", "PRI", "NI", "VSZ", "RSS",
+                             "WCHAN", "STAT", "TTY", "TIME", "COMMAND")]
+        for process in self.processes:
+            lines.append(self.ALX % ((process.flags >> 6) & 5, process.uid,
+                    process.pid, process.ppid, process.priority, process.nice,
+                    process.vsize // 1024, process.rss * self.page_size // 1024,
+                    process.wchan[:6], process.stat_flags(),
+                    tty_name(process.tty_nr), cpu_time(process.ticks, self.hz),
+                    process.command()))
+        return "\n".join(lines) + "\n"
+
+    def _subtree(self, process, children):
+        """Returns the lines of the pstree drawing of process"""
+        branches = []
+        for child in children.get(process.pid, ()):
+            branches.append(self._subtree(child, children))
+        if process.nlwp > 1:
+            branches.extend([["{%s}" % process.comm]] * (process.nlwp - 1))
+
+        # identical single line subtrees are drawn once with a count
+        merged = []
+        for branch in branches:
+            if merged and len(branch) == 1 and merged[-1][1] == branch:
+                merged[-1][0] += 1
+            else:
+                merged.append([1, branch])
+        branches = []
+        for count, branch in merged:
+            if count > 1:
+                branch = ["%d*[%s]" % (count, branch[0])]
+            branches.append(branch)
+
+        label = process.comm
+        if not branches:
+            return [label]
+        if len(branches) == 1:
+            indent = " " * (len(label) + 3)
+            return [label + "---" + branches[0][0]] + \
+                   [indent + line for line in branches[0][1:]]
+
+        indent = " " * len(label)
+        lines = []
+        for index, branch in enumerate(branches):
+            last = index == len(branches) - 1
+            if index == 0:
+                lead = label + "-+-"
+            elif last:
+                lead = indent + " `-"
+            else:
+                lead = indent + " |-"
+            follow = indent + (last and "   " or " | ")
+            lines.append(lead + branch[0])
+            lines.extend(follow + line for line in branch[1:])
+        return lines
+
+    def pstree(self):
+        """Output in the format of pstree -A"""
+        pids = set(process.pid for process in self.processes)
+        children = {}
+        roots = []
+        for process in self.processes:
+            if process.ppid in pids and process.ppid != process.pid:
+                children.setdefault(process.ppid, []).append(process)
+            elif process.ppid == 0 and process.pid == 1:
+                roots.append(process)
+        for siblings in children.itervalues():
+            siblings.sort(key=lambda process: process.comm)
+        lines = []
+        for root in roots:
+            lines.extend(self._subtree(root, children))
+        return "\n".join(lines) + "\n"
+
+    LSOF = "%-9s %5s %5s %4s %7s %10s %8s %8s %s"
+
+    def lsof(self):
+        """Output in the format of lsof -n -l -P"""
+        lines = [self.LSOF % ("COMMAND", "PID", "USER", "FD", "TYPE", "DEVICE",
+                              "SIZE/OFF", "NODE", "NAME")]
+        for process in self.processes:
+            for fd, target, st, flags in process.files:
+                if flags is not None:
+                    fd += "rwu"[flags & 3]
+                if st is None:
+                    ftype, device, size, node = "unknown", "", "", ""
+                    # sockets and pipes are named after their inode
+                    kind, sep, inode = target.partition(":[")
+                    if sep and inode.endswith("]"):
+                        ftype = {"socket": "sock", "pipe": "FIFO"}.get(kind, ftype)
+                        size, node = "0t0", inode[:-1]
+                else:
+                    ftype = file_type(st.st_mode)
+                    dev = st.st_dev
+                    if ftype in ("CHR", "BLK"):
+                        dev = st.st_rdev
+                    device = "%d,%d" % (os.major(dev), os.minor(dev))
+                    if ftype in ("REG", "DIR"):
+                        size = st.st_size
+                    else:
+                        size = "0t0"
+                    node = st.st_ino
+                if target.startswith("anon_inode:"):
+                    ftype = "a_inode"
+                lines.append(self.LSOF % (process.comm[:9], process.pid,
+                        process.uid, fd, ftype, device, size, node, target))
+        return "\n".join(lines) + "\n"
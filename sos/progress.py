@@ -0,0 +1,263 @@
+"""
+Live progress of a collection as JSON, for tools driving sosreport in batch
+mode. The state is served on a local UNIX socket, one document per
+connection, and/or rewritten to a status file as it changes
+"""
+## progress.py
+## report what sosreport is doing while it is doing it
+
+### This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+from __future__ import with_statement
+
+import errno
+import os
+import socket
+import stat
+import threading
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+class PluginProgress(object):
+
+    __slots__ = ('name', 'running', 'finished', 'elapsed', 'pending')
+
+    def __init__(self, name):
+        self.name = name
+        self.running = 0
+        self.finished = False
+        self.elapsed = 0.0
+        self.pending = 0
+
+    def state(self):
+        if self.running:
+            return "running"
+        if self.finished:
+            return "done"
+        return "queued"
+
+
+class Progress(object):
+    """The state of a collection. Plugins go from queued to running while any
+    of their work is in progress and to done once they have nothing left to
+    do in the current phase. If status_file is given it is rewritten at
+    most every interval seconds and on every change of phase."""
+
+    def __init__(self, status_file=None, interval=1.0):
+        self.status_file = status_file
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.started = time.time()
+        self.phase = "starting"
+        self.phase_started = self.started
+        self.plugins = {}
+        self.order = []
+        self.bytes = 0
+        self.compress_rate = None
+        self.commands_done = 0
+        self.commands_total = 0
+        self.last_write = 0
+
+    def set_phase(self, phase, plugins=(), pending=None):
+        """Enters phase. Every plugin in plugins is queued again, pending maps
+        plugin names to the number of tasks each has to finish in the phase
+        (1 if not given)"""
+        with self.lock:
+            self.phase = phase
+            self.phase_started = time.time()
+            for name in plugins:
+                if name not in self.plugins:
+                    self.plugins[name] = PluginProgress(name)
+                    self.order.append(name)
+                plugin = self.plugins[name]
+                plugin.finished = False
+                plugin.pending = 1
+                if pending is not None:
+                    plugin.pending = pending.get(name, 0)
+                    plugin.finished = not plugin.pending
+        self.write(force=True)
+
+    def set_commands(self, total):
+        with self.lock:
+            self.commands_total = total
+            self.commands_done = 0
+
+    def start(self, name):
+        with self.lock:
+            self.plugins[name].running += 1
+        self.write()
+
+    def finish(self, name, elapsed, command=False):
+        with self.lock:
+            plugin = self.plugins[name]
+            plugin.running -= 1
+            plugin.elapsed += elapsed
+            plugin.pending -= 1
+            if plugin.pending <= 0 and not plugin.running:
+                plugin.finished = True
+            if command:
+                self.commands_done += 1
+        self.write()
+
+    def track(self, name, func, *args):
+        """Calls func with args while name is running"""
+        self.start(name)
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            self.finish(name, time.time() - start)
+
+    def add_bytes(self, count):
+        with self.lock:
+            self.bytes += count
+
+    def compressed(self, size, elapsed):
+        with self.lock:
+            if elapsed > 0:
+                self.compress_rate = size / elapsed
+
+    def status(self):
+        """Returns the current state as a dictionary"""
+        with self.lock:
+            now = time.time()
+            plugins = {"done": [], "running": [], "queued": []}
+            for name in self.order:
+                plugins[self.plugins[name].state()].append(name)
+            elapsed = now - self.started
+            return {
+                "pid": os.getpid(),
+                "phase": self.phase,
+                "elapsed": elapsed,
+                "phase_elapsed": now - self.phase_started,
+                "plugins": plugins,
+                "plugin_elapsed": dict((name, plugin.elapsed) for name, plugin
+                                       in self.plugins.iteritems()),
+                "commands": {"done": self.commands_done,
+                             "total": self.commands_total},
+                "bytes": self.bytes,
+                "write_rate": elapsed and self.bytes / elapsed,
+                "compress_rate": self.compress_rate,
+            }
+
+    def write(self, force=False):
+        """Rewrites the status file if the last write is old enough"""
+        if not self.status_file:
+            return
+        now = time.time()
+        if not force and now - self.last_write < self.interval:
+            return
+        self.last_write = now
+        with self.write_lock:
+            try:
+                tmp = self.status_file + ".tmp"
+                fp = open(tmp, "w")
+                try:
+                    json.dump(self.status(), fp)
+                finally:
+                    fp.close()
+                os.rename(tmp, self.status_file)
+            except (IOError, OSError):
+                pass
+
+
+class ProgressServer(object):
+    """Serves the status of progress on the UNIX socket path. Every client
+    that connects is sent one JSON document followed by a newline."""
+
+    def __init__(self, progress, path):
+        self.progress = progress
+        self.path = path
+        self.sock = None
+        self.thread = None
+
+    def start(self):
+        """Starts serving. A socket left behind at path by an earlier run is
+        replaced, anything else there raises OSError."""
+        try:
+            stats = os.lstat(self.path)
+        except OSError:
+            stats = None
+        if stats:
+            if not stat.S_ISSOCK(stats.st_mode):
+                raise OSError(errno.EEXIST, "not a socket", self.path)
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        os.chmod(self.path, 0600)
+        self.sock.listen(5)
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def _serve(self):
+        sock = self.sock
+        while True:
+            try:
+                client, address = sock.accept()
+            except socket.error:
+                return
+            try:
+                client.sendall(json.dumps(self.progress.status()) + "\n")
+            except socket.error:
+                pass
+            client.close()
+
+    def stop(self):
+        if not self.sock:
+            return
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+        self.sock = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class MeteredArchive(object):
+    """Wraps an Archive and counts the bytes added to it for progress. All
+    other attributes are those of the wrapped archive."""
+
+    def __init__(self, archive, progress):
+        self.archive = archive
+        self.progress = progress
+
+    def __getattr__(self, name):
+        return getattr(self.archive, name)
+
+    def add_file(self, src, dest=None, fileobj=None):
+        self.archive.add_file(src, dest, fileobj)
+        try:
+            if os.path.isfile(src):
+                self.progress.add_bytes(os.path.getsize(src))
+        except OSError:
+            pass
+
+    def add_string(self, content, dest):
+        self.archive.add_string(content, dest)
+        self.progress.add_bytes(len(content))
+
+    def add_link(self, dest, link_name):
+        self.archive.add_link(dest, link_name)
@@ -8,6 +8,8 @@ except ImportError:
 
 class Node(object):
 
+    __slots__ = ()
+
     def __str__(self):
         return json.dumps(self.data)
 
@@ -16,14 +18,17 @@ class Node(object):
 
 class Leaf(Node):
     """Marker class that can be added to a Section node"""
-    pass
+
+    __slots__ = ()
 
 
 class Report(Node):
     """The root element of a report. This is a container for sections."""
 
+    __slots__ = ('sections',)
+
     def __init__(self):
-        self.data = {}
+        self.sections = {}
 
     def can_add(self, node):
         return isinstance(node, Section)
@@ -31,16 +36,28 @@ class Report(Node):
     def add(self, *nodes):
         for node in nodes:
             if self.can_add(node):
-                self.data[node.name] = node.data
+                self.sections[node.name] = node
+
+    def iter_sections(self):
+        """Yields the sections of the report sorted by name"""
+        for name in sorted(self.sections):
+            yield self.sections[name]
+
+    @property
+    def data(self):
+        return dict((name, section.data)
+                    for name, section in self.sections.iteritems())
 
 
 class Section(Node):
     """A section is a container for leaf elements. Sections may be nested
     inside of Report objects only."""
 
+    __slots__ = ('name', 'leaves')
+
     def __init__(self, name):
         self.name = name
-        self.data = {}
+        self.leaves = {}
 
     def can_add(self, node):
         return isinstance(node, Leaf)
@@ -48,40 +65,72 @@ class Section(Node):
     def add(self, *nodes):
         for node in nodes:
             if self.can_add(node):
-                self.data.setdefault(node.ADDS_TO, []).append(node.data)
+                self.leaves.setdefault(node.ADDS_TO, []).append(node)
+
+    def iter_leaves(self, key):
+        """Yields the data of every leaf added under key"""
+        for leaf in self.leaves.get(key, ()):
+            yield leaf.data
+
+    @property
+    def data(self):
+        return dict((key, list(self.iter_leaves(key))) for key in self.leaves)
 
 
 class Command(Leaf):
 
     ADDS_TO = "commands"
 
+    __slots__ = ('name', 'return_code', 'href')
+
     def __init__(self, name, return_code, href):
-        self.data = {"name": name,
-                     "return_code": return_code,
-                     "href": href}
+        self.name = name
+        self.return_code = return_code
+        self.href = href
+
+    @property
+    def data(self):
+        return {"name": self.name,
+                "return_code": self.return_code,
+                "href": self.href}
 
 
 class CopiedFile(Leaf):
 
     ADDS_TO = "copied_files"
 
+    __slots__ = ('name', 'href')
+
     def __init__(self, name, href):
-        self.data = {"name": name,
-                     "href": href}
+        self.name = name
+        self.href = href
+
+    @property
+    def data(self):
+        return {"name": self.name,
+                "href": self.href}
 
 
 class CreatedFile(Leaf):
 
     ADDS_TO = "created_files"
 
+    __slots__ = ('name',)
+
     def __init__(self, name):
-        self.data = {"name": name}
+        self.name = name
+
+    @property
+    def data(self):
+        return {"name": self.name}
 
 
 class Alert(Leaf):
 
     ADDS_TO = "alerts"
 
+    __slots__ = ('data',)
+
     def __init__(self, content):
         self.data = content
 
@@ -90,6 +139,8 @@ class Note(Leaf):
 
     ADDS_TO = "notes"
 
+    __slots__ = ('data',)
+
     def __init__(self, content):
         self.data = content
 
@@ -110,22 +161,61 @@ class PlainTextReport(object):
         (Note, NOTE,         "-  notes:"),
     )
 
-    buf = []
-
     def __init__(self, report_node):
         self.report_node = report_node
 
     def __str__(self):
-        self.buf = buf = []
-        for section_name, section_contents in sorted(self.report_node.data.iteritems()):
-            buf.append(section_name + "\n" + self.DIVIDER)
-            for type_, format_, header in self.subsections:
-                self.process_subsection(section_contents, type_.ADDS_TO, header, format_)
+        return "\n".join(self)
+
+    def __iter__(self):
+        for section in self.report_node.iter_sections():
+            for line in self.process_section(section):
+                yield line
 
-        return "\n".join(buf)
+    def process_section(self, section):
+        """Yields the lines of text for a single section"""
+        yield section.name + "\n" + self.DIVIDER
+        for type_, format_, header in self.subsections:
+            for line in self.process_subsection(section, type_.ADDS_TO, header, format_):
+                yield line
 
     def process_subsection(self, section, key, header, format_):
-        if key in section:
-            self.buf.append(header)
-            for item in section.get(key):
-                self.buf.append(format_ % item)
+        if key in section.leaves:
+            yield header
+            for item in section.iter_leaves(key):
+                yield format_ % item
+
+
+class ReportWriter(object):
+    """Writes the plain text and JSON forms of a report to two file objects
+    one section at a time, so a section can be discarded as soon as it has
+    been written. Sections must be written in the order they should appear
+    and close() must be called once all of them have been written."""
+
+    def __init__(self, text_fp, json_fp):
+        self.text_fp = text_fp
+        self.json_fp = json_fp
+        self.text = PlainTextReport(None)
+        self.sections = 0
+
+    def write_section(self, section):
+        if self.sections:
+            self.text_fp.write("\n")
+            self.json_fp.write(", ")
+        else:
+            self.json_fp.write("{")
+        self.sections += 1
+
+        first = True
+        for line in self.text.process_section(section):
+            if not first:
+                self.text_fp.write("\n")
+            self.text_fp.write(line)
+            first = False
+
+        self.json_fp.write("%s: %s" % (json.dumps(section.name), section))
+
+    def close(self):
+        if not self.sections:
+            self.json_fp.write("{")
+        self.json_fp.write("}")
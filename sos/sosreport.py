@@ -32,6 +32,8 @@ supplied for application-specific information
 # pylint: disable-msg = R0904
 # pylint: disable-msg = R0903
 
+from __future__ import with_statement
+
 import sys
 import traceback
 import os
@@ -40,18 +42,31 @@ from optparse import OptionParser, Option
 import ConfigParser
 from sos.plugins import import_plugin
 from sos.utilities import ImporterHelper
-from stat import ST_UID, ST_GID, ST_MODE, ST_CTIME, ST_ATIME, ST_MTIME, S_IMODE
-from time import strftime, localtime
+from stat import S_IMODE
 from collections import deque
 from itertools import izip
 import textwrap
 import tempfile
+import threading
+import socket
+from time import time
+try:
+    import json
+except ImportError:
+    import simplejson as json
 
 from sos import _sos as _
 from sos import __version__
 import sos.policies
-from sos.utilities import TarFileArchive, ZipFileArchive
-from sos.reporting import Report, Section, Command, CopiedFile, CreatedFile, Alert, Note, PlainTextReport
+from sos.utilities import ARCHIVE_BACKENDS
+from sos.utilities import Obfuscator, ObfuscatingArchive, SynchronizedArchive
+from sos.utilities import LegacyArchive, takes_fileobj
+from sos.utilities import get_hash_name, dag_map, parallel_map
+from sos.artifacts import ArtifactBus, plugin_dependencies
+from sos.watchdog import Watchdog
+from sos.progress import Progress, ProgressServer, MeteredArchive
+from sos.throttle import Throttle, parse_size
+from sos.reporting import Section, Command, CopiedFile, CreatedFile, Alert, Note, ReportWriter
 
 class TempFileUtil(object):
 
@@ -114,86 +129,418 @@ class SosOption(Option):
 
 
 
-class XmlReport(object):
-    """ Report build class """
-    def __init__(self):
+class Manifest(object):
+    """ Streams a JSON lines record of every command run and every file
+    copied. File records use the stat results captured when the file was
+    copied rather than stat-ing the source again. Every record is also
+    passed to journal when one is set. """
+    def __init__(self, get_fileobj):
+        self.get_fileobj = get_fileobj
+        self.fp = None
+        self.journal = None
+        self.lock = threading.Lock()
+
+    def _write(self, record):
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            if not self.fp:
+                self.fp = self.get_fileobj()
+            self.fp.write(line)
+        if self.journal:
+            self.journal(record)
+
+    def replay(self, records):
+        """ Appends the records journaled by an interrupted run """
+        journal, self.journal = self.journal, None
         try:
-            import libxml2
-        except ImportError:
-            self.enabled = False
-            return
-        else:
-            self.enabled = False
+            for record in records:
+                self._write(record)
+        finally:
+            self.journal = journal
+
+    def add_command(self, cmdline, exitcode, f_stdout=None, runtime=None,
+                    cpu=None, maxrss=None, size=None, truncated=False):
+        """ Appends command run into report. size is the number of bytes the
+        command wrote, which for a truncated command is more than what was
+        stored. """
+        self._write({"type": "command",
+                     "cmdline": cmdline,
+                     "exitcode": exitcode,
+                     "stdout": f_stdout,
+                     "runtime": runtime,
+                     "cpu": cpu,
+                     "maxrss": maxrss,
+                     "size": size,
+                     "truncated": truncated})
+
+    def add_file(self, fname, stats, dest=None, digest=None, algorithm=None,
+                 size=None):
+        """ Appends file added to report. size replaces the size from stats,
+        which is wrong for pseudo files. """
+        if size is None:
+            size = stats.st_size
+        record = {"type": "file",
+                  "name": fname,
+                  "dest": dest,
+                  "uid": stats.st_uid,
+                  "gid": stats.st_gid,
+                  "mode": oct(S_IMODE(stats.st_mode)),
+                  "size": size,
+                  "atime": stats.st_atime,
+                  "mtime": stats.st_mtime,
+                  "ctime": stats.st_ctime}
+        if digest:
+            record[algorithm] = digest
+        self._write(record)
+
+    def serialize_to_file(self, archive, fname):
+        """ Adds the manifest to archive as fname """
+        if not self.fp:
             return
-        self.doc = libxml2.newDoc("1.0")
-        self.root = self.doc.newChild(None, "sos", None)
-        self.commands = self.root.newChild(None, "commands", None)
-        self.files = self.root.newChild(None, "files", None)
-
-    def add_command(self, cmdline, exitcode, stdout = None, stderr = None,
-                    f_stdout=None, f_stderr=None, runtime=None):
-        """ Appends command run into report """
-        if not self.enabled:
+        self.fp.flush()
+        archive.add_file(self.fp.name, dest=fname)
+
+
+class RuntimeHistory(object):
+    """ Remembers how long commands took in previous runs, keyed by plugin
+    and command line, in a small JSON file. The history is used to run the
+    slowest commands first, to shorten the timeout of commands that have
+    always been quick and to estimate how long a collection will take.
+    Commands that have not run for a while are forgotten. """
+
+    # weight of the newest runtime in the moving average
+    weight = 0.5
+    # a command gets this many times its longest runtime, but never less
+    # than timeout_floor seconds and never more than its plugin asked for
+    timeout_factor = 5
+    timeout_floor = 60
+    # commands not run in this many runs are dropped, and no more than
+    # max_entries of the most recently run ones are kept
+    max_idle_runs = 10
+    max_entries = 2000
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.runtimes = {}
+        self.loaded = False
+        runs = 0
+        try:
+            fp = open(filename)
+            try:
+                state = json.load(fp)
+                if "runtimes" in state:
+                    runs, self.runtimes = state["runs"], state["runtimes"]
+                else:
+                    # written before runs were counted
+                    self.runtimes = state
+                self.loaded = True
+            finally:
+                fp.close()
+        except (IOError, ValueError, KeyError, TypeError):
+            pass
+        self.run = runs + 1
+
+    @staticmethod
+    def _key(plugname, command):
+        return "%s\t%s" % (plugname, command)
+
+    def predict(self, plugname, command, default=None):
+        """ Returns the expected runtime of command in seconds """
+        entry = self.runtimes.get(self._key(plugname, command))
+        if not entry:
+            return default
+        return entry["mean"]
+
+    def timeout(self, plugname, command, timeout):
+        """ Returns the timeout to run command with in place of timeout """
+        entry = self.runtimes.get(self._key(plugname, command))
+        if not entry or not timeout:
+            return timeout
+        return int(min(timeout, max(self.timeout_floor,
+                                    self.timeout_factor * entry["max"])))
+
+    def record(self, plugname, command, runtime):
+        key = self._key(plugname, command)
+        with self.lock:
+            entry = self.runtimes.get(key)
+            if entry:
+                entry["mean"] = (self.weight * runtime
+                                 + (1 - self.weight) * entry["mean"])
+                entry["max"] = max(entry["max"], runtime)
+                entry["count"] += 1
+                entry["run"] = self.run
+            else:
+                self.runtimes[key] = {"mean": runtime, "max": runtime,
+                                      "count": 1, "run": self.run}
+
+    def estimate(self, jobs, workers, default=1):
+        """ Returns the time workers would need to run jobs, a list of
+        (plugname, command) tuples, when the longest jobs are started first """
+        loads = [0] * max(workers, 1)
+        predicted = [self.predict(plugname, command, default)
+                     for plugname, command in jobs]
+        for runtime in sorted(predicted, reverse=True):
+            loads[loads.index(min(loads))] += runtime
+        return max(loads)
+
+    def prune(self):
+        """ Drops the commands that have not run for max_idle_runs runs and
+        the least recently run ones beyond max_entries """
+        with self.lock:
+            keys = [key for key, entry in self.runtimes.iteritems()
+                    if self.run - entry.get("run", 0) < self.max_idle_runs]
+            keys.sort(key=lambda key: self.runtimes[key].get("run", 0), reverse=True)
+            self.runtimes = dict((key, self.runtimes[key])
+                                 for key in keys[:self.max_entries])
+
+    def save(self):
+        """ Writes the history back, silently giving up if that is not
+        possible """
+        self.prune()
+        try:
+            directory = os.path.dirname(self.filename)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            tmp = self.filename + ".tmp"
+            fp = open(tmp, "w")
+            try:
+                json.dump({"runs": self.run, "runtimes": self.runtimes}, fp)
+            finally:
+                fp.close()
+            os.rename(tmp, self.filename)
+        except (IOError, OSError):
+            pass
+
+
+class Checkpoint(object):
+    """ Records the plugins that have copied their files and the commands
+    that have run, the end offset of every archive member together with the
+    plugin and command that wrote it, and the manifest records they made.
+    An interrupted run leaves the checkpoint and its manifest journal next
+    to its uncompressed archive. --resume truncates the archive after the
+    last member written only by finished work, collects everything else
+    again and replays the manifest records of what was kept. """
+
+    suffix = ".checkpoint"
+    journal_suffix = ".manifest"
+
+    def __init__(self, archive_name):
+        self.archive_name = archive_name
+        self.filename = archive_name + self.suffix
+        self.journal_filename = archive_name + self.journal_suffix
+        # the size the archive was resumed at
+        self.offset = 0
+        self.files = set()
+        self.commands = {}
+        # [end offset, plugin, command] in archive order, consecutive
+        # members of the same work share an entry
+        self.members = []
+        # the manifest records kept from an interrupted run
+        self.records = []
+        self.journal = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @classmethod
+    def latest(class_, directory):
+        """ Returns the newest checkpoint left in directory, or None """
+        found = []
+        for entry in os.listdir(directory):
+            if entry.startswith("sosreport-") and entry.endswith(class_.suffix):
+                path = os.path.join(directory, entry)
+                found.append((os.stat(path).st_mtime, path))
+        if not found:
+            return None
+        checkpoint = class_(max(found)[1][:-len(class_.suffix)])
+        try:
+            fp = open(checkpoint.filename)
+            try:
+                state = json.load(fp)
+            finally:
+                fp.close()
+        except (IOError, ValueError):
+            return None
+        checkpoint._restore(state, checkpoint._read_journal())
+        return checkpoint
+
+    def _read_journal(self):
+        entries = []
+        try:
+            fp = open(self.journal_filename)
+        except IOError:
+            return entries
+        try:
+            for line in fp:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # the last line of a killed run may be cut short
+                    break
+        finally:
+            fp.close()
+        return entries
+
+    def _restore(self, state, entries):
+        """ Keeps the members up to the first one written by unfinished
+        work. Finished work with members past that point is done again, so
+        the cut moves back until none of its members are kept. """
+        done = set((plugname, None) for plugname in state["files"])
+        for plugname, commands in state["commands"].iteritems():
+            done.update((plugname, exe) for exe in commands)
+        members = state["members"]
+        kept = len(members)
+        while True:
+            cut = 0
+            while cut < kept and tuple(members[cut][1:]) in done:
+                cut += 1
+            for end, plugname, exe in members[cut:]:
+                done.discard((plugname, exe))
+            if cut == kept:
+                break
+            kept = cut
+        self.members = members[:kept]
+        self.offset = state["offset"]
+        if self.members:
+            self.offset = self.members[-1][0]
+        for plugname, exe in done:
+            if exe is None:
+                self.files.add(plugname)
+            else:
+                self.commands.setdefault(plugname, set()).add(exe)
+        entries = [entry for entry in entries
+                   if (entry["plugin"], entry["command"]) in done]
+        self.records = [entry["record"] for entry in entries]
+        tmp = self.journal_filename + ".tmp"
+        fp = open(tmp, "w")
+        try:
+            for entry in entries:
+                fp.write(json.dumps(entry) + "\n")
+        finally:
+            fp.close()
+        os.rename(tmp, self.journal_filename)
+        self.save()
+
+    def has_files(self, plugname):
+        return plugname in self.files
+
+    def has_command(self, plugname, exe):
+        return exe in self.commands.get(plugname, ())
+
+    def start(self, plugname, exe=None):
+        """ Attributes what the calling thread writes from now on to the
+        files of plugname, or to its command exe if given """
+        self.local.work = (plugname, exe)
+        self.local.lost = False
+
+    def stop(self):
+        self.local.work = None
+
+    def lost(self):
+        """ Records that a write of the calling thread did not make it into
+        the archive, its work is not done """
+        self.local.lost = True
+
+    def wrote(self, offset):
+        """ Records that the archive ends at offset after a member written
+        by the calling thread. Called with the archive locked so that the
+        offsets are in archive order. """
+        work = getattr(self.local, "work", None)
+        if work is None or offset is None:
             return
+        plugname, exe = work
+        with self.lock:
+            if self.members and self.members[-1][1:] == [plugname, exe]:
+                self.members[-1][0] = offset
+            else:
+                self.members.append([offset, plugname, exe])
 
-        cmd = self.commands.newChild(None, "cmd", None)
+    def record(self, record):
+        """ Journals a manifest record made by the calling thread """
+        work = getattr(self.local, "work", None)
+        if work is None:
+            return
+        line = json.dumps({"plugin": work[0], "command": work[1],
+                           "record": record}) + "\n"
+        with self.lock:
+            if not self.journal:
+                self.journal = open(self.journal_filename, "a")
+            self.journal.write(line)
+            self.journal.flush()
+
+    def done(self, plugname, exe=None):
+        """ Records that the files of plugname, or its command exe if given,
+        are in the archive, unless the calling thread lost a write """
+        if getattr(self.local, "lost", False):
+            return
+        with self.lock:
+            if exe is None:
+                self.files.add(plugname)
+            else:
+                self.commands.setdefault(plugname, set()).add(exe)
+            self.save()
 
-        cmd.setNsProp(None, "cmdline", cmdline)
+    def save(self):
+        tmp = self.filename + ".tmp"
+        fp = open(tmp, "w")
+        try:
+            json.dump({"offset": self.offset, "files": sorted(self.files),
+                       "commands": dict((plugname, sorted(commands)) for plugname, commands
+                                        in self.commands.iteritems()),
+                       "members": self.members}, fp)
+        finally:
+            fp.close()
+        os.rename(tmp, self.filename)
+
+    def remove(self):
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+        for filename in (self.filename, self.journal_filename):
+            try:
+                os.unlink(filename)
+            except OSError:
+                pass
 
-        cmdchild = cmd.newChild(None, "exitcode", str(exitcode))
 
-        if runtime:
-            cmd.newChild(None, "runtime", str(runtime))
+class CheckpointedArchive(object):
+    """Wraps an Archive and tells checkpoint where the archive ends after
+    every member. Writes are serialized with a lock, which also keeps them
+    from being written from several threads at once, and refused once the
+    archive is closed. All other attributes are those of the wrapped
+    archive."""
 
-        if stdout or f_stdout:
-            cmdchild = cmd.newChild(None, "stdout", stdout)
-            if f_stdout:
-                cmdchild.setNsProp(None, "file", f_stdout)
+    def __init__(self, archive, checkpoint):
+        self.archive = archive
+        self.state = checkpoint
+        self.lock = threading.Lock()
+        self.closed = False
 
-        if stderr or f_stderr:
-            cmdchild = cmd.newChild(None, "stderr", stderr)
-            if f_stderr:
-                cmdchild.setNsProp(None, "file", f_stderr)
+    def __getattr__(self, name):
+        return getattr(self.archive, name)
 
-    def add_file(self, fname, stats):
-        """ Appends file(s) added to report """
-        if not self.enabled:
-            return
+    def _write(self, method, *args):
+        with self.lock:
+            if self.closed:
+                # a command still running when the collection was sealed
+                self.state.lost()
+                raise IOError("%s is closed" % self.archive.name())
+            method(*args)
+            self.state.wrote(self.archive.checkpoint())
 
-        cfile = self.files.newChild(None, "file", None)
-
-        cfile.setNsProp(None, "fname", fname)
-
-        cchild = cfile.newChild(None, "uid", str(stats[ST_UID]))
-        cchild = cfile.newChild(None, "gid", str(stats[ST_GID]))
-        cfile.newChild(None, "mode", str(oct(S_IMODE(stats[ST_MODE]))))
-        cchild = cfile.newChild(None, "ctime", strftime('%a %b %d %H:%M:%S %Y',
-                                                        localtime(stats[ST_CTIME])))
-        cchild.setNsProp(None, "tstamp", str(stats[ST_CTIME]))
-        cchild = cfile.newChild(None, "atime", strftime('%a %b %d %H:%M:%S %Y',
-                                                        localtime(stats[ST_ATIME])))
-        cchild.setNsProp(None, "tstamp", str(stats[ST_ATIME]))
-        cchild = cfile.newChild(None, "mtime", strftime('%a %b %d %H:%M:%S %Y',
-                                                        localtime(stats[ST_MTIME])))
-        cchild.setNsProp(None, "tstamp", str(stats[ST_MTIME]))
-
-    def serialize(self):
-        """ Serializes xml """
-        if not self.enabled:
-            return
+    def add_file(self, src, dest=None, fileobj=None):
+        self._write(self.archive.add_file, src, dest, fileobj)
 
-        self.ui_log.info(self.doc.serialize(None,  1))
+    def add_string(self, content, dest):
+        self._write(self.archive.add_string, content, dest)
 
-    def serialize_to_file(self, fname):
-        """ Serializes to file """
-        if not self.enabled:
-            return
+    def add_link(self, dest, link_name):
+        self._write(self.archive.add_link, dest, link_name)
 
-        outf = tempfile.NamedTemporaryFile()
-        outf.write(self.doc.serialize(None, 1))
-        outf.flush()
-        self.archive.add_file(outf.name, dest=fname)
-        outf.close()
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.archive.close()
 
 
 class SoSReport(object):
@@ -202,7 +549,6 @@ class SoSReport(object):
         self.loaded_plugins = deque()
         self.skipped_plugins = deque()
         self.all_options = deque()
-        self.xml_report = XmlReport()
         self.global_plugin_options = {}
 
         try:
@@ -214,6 +560,17 @@ class SoSReport(object):
 
         self.opts, self.args = self.parse_options(opts)
         self.tempfile_util = TempFileUtil(tmp_dir=self.opts.tmp_dir)
+        self.manifest = Manifest(self.get_temp_file)
+        self.watchdog = Watchdog(self.opts.mount_timeout)
+        self.artifacts = ArtifactBus(watchdog=self.watchdog)
+        self.checkpoint = None
+        self.interrupted = False
+        self.progress = Progress(self.opts.status_file)
+        self.progress_server = None
+        self.throttle = Throttle()
+        self.history = None
+        if self.opts.history_file:
+            self.history = RuntimeHistory(self.opts.history_file)
         self._set_debug()
         self._read_config()
         self.policy = sos.policies.load()
@@ -231,7 +588,11 @@ class SoSReport(object):
                 'soslog': self.soslog,
                 'policy': self.policy,
                 'verbosity': self.opts.verbosity,
-                'xmlreport': self.xml_report,
+                'manifest': self.manifest,
+                'artifacts': self.artifacts,
+                'history': self.history,
+                'watchdog': self.watchdog,
+                'throttle': self.throttle,
                 'cmdlineopts': self.opts,
                 'config': self.config,
                 'global_plugin_options': self.global_plugin_options,
@@ -240,17 +601,95 @@ class SoSReport(object):
     def get_temp_file(self):
         return self.tempfile_util.new()
 
+    def _archive_class(self):
+        if self.opts.compression_type == 'auto':
+            return self.policy.preferedArchive()
+        return ARCHIVE_BACKENDS[self.opts.compression_type]
+
     def _set_archive(self):
-        if self.opts.compression_type not in ('auto', 'zip', 'bzip2', 'gzip', 'xz'):
-            raise Exception("Invalid compression type specified. Options are: auto, zip, bzip2, gzip and xz")
+        if self.opts.compression_type != 'auto' and self.opts.compression_type not in ARCHIVE_BACKENDS:
+            raise Exception("Invalid compression type specified. Options are: auto, %s"
+                            % ", ".join(sorted(ARCHIVE_BACKENDS)))
+        if self.opts.obfuscate:
+            self.obfuscator = Obfuscator([self.policy.hostname])
+            self.policy.reportName = self.obfuscator.obfuscate(self.policy.reportName)
+        if self.opts.resume:
+            if self._resume_archive():
+                return
+            self.ui_log.info(_("No interrupted collection to resume, starting a new one."))
         archive_name = os.path.join(self.opts.tmp_dir,self.policy.getArchiveName())
-        if self.opts.compression_type == 'auto':
-            auto_archive = self.policy.preferedArchive()
-            self.archive = auto_archive(archive_name)
-        elif self.opts.compression_type == 'zip':
-            self.archive = ZipFileArchive(archive_name)
-        else:
-            self.archive = TarFileArchive(archive_name)
+        self.archive = self._archive_class()(archive_name)
+        if self.opts.obfuscate:
+            self.archive = ObfuscatingArchive(self.archive, self.obfuscator)
+        elif self.archive.supports_reopen:
+            # the obfuscation mapping lives in memory only, so an obfuscated
+            # run could not be resumed consistently
+            self.checkpoint = Checkpoint(archive_name)
+            self.checkpoint.save()
+        self._wrap_archive()
+
+    def _wrap_archive(self):
+        if not takes_fileobj(self.archive):
+            self.archive = LegacyArchive(self.archive)
+        self.archive.limit_compression(self.throttle)
+        self.archive = MeteredArchive(self.archive, self.progress)
+        if self.checkpoint:
+            # serializes the writes as well
+            self.archive = CheckpointedArchive(self.archive, self.checkpoint)
+            self.manifest.journal = self.checkpoint.record
+        elif self.opts.threads > 1:
+            self.archive = SynchronizedArchive(self.archive)
+        if self.throttle.writes.rate:
+            self.archive.limit_writes(self.throttle.writes)
+
+    def _resume_archive(self):
+        archive_class = self._archive_class()
+        if self.opts.obfuscate or not archive_class.supports_reopen:
+            return False
+        checkpoint = Checkpoint.latest(self.opts.tmp_dir)
+        if not checkpoint:
+            return False
+        try:
+            self.archive = archive_class.reopen(checkpoint.archive_name, checkpoint.offset)
+        except (IOError, OSError):
+            # left behind by a run with another archive backend
+            return False
+        self.checkpoint = checkpoint
+        self.manifest.replay(checkpoint.records)
+        self.ui_log.info(_("Resuming the collection in %s") % self.archive.name())
+        self._wrap_archive()
+        return True
+
+    def _start(self, plugname, exe=None):
+        if self.checkpoint:
+            self.checkpoint.start(plugname, exe)
+
+    def _stop(self):
+        if self.checkpoint:
+            self.checkpoint.stop()
+
+    def _checkpoint(self, plugname, exe=None):
+        # what finishes after seal() may be missing from the archive
+        if self.checkpoint and not self.interrupted:
+            self.checkpoint.done(plugname, exe)
+
+    def seal(self):
+        """ Closes the archive as it is after an interruption, keeping the
+        checkpoint next to it for --resume """
+        self.interrupted = True
+        self.progress.set_phase("interrupted")
+        self._stop_progress()
+        for plugname, plugin in self.loaded_plugins:
+            plugin.exit_please()
+        if not getattr(self, "archive", None):
+            return
+        self._finish_logging()
+        self.archive.close()
+        self.tempfile_util.clean()
+        self.ui_log.info(_("\nCollection interrupted, the partial archive has been saved in:\n  %s")
+                % self.archive.name())
+        if self.checkpoint:
+            self.ui_log.info(_("Run sosreport again with --resume to complete it."))
 
     def _set_directories(self):
         self.cmddir = 'sos_commands'
@@ -305,6 +744,30 @@ class SoSReport(object):
         except IOError:
             pass
 
+    def _throttle_option(self, name, convert, default):
+        """Returns a throttling option given on the command line or else in
+        the [general] section of the configuration file"""
+        value = getattr(self.opts, name)
+        if value is None and self.config.has_option("general", name):
+            value = self.config.get("general", name)
+        if value is None or value == "":
+            return default
+        return convert(value)
+
+    def _set_throttle(self):
+        try:
+            self.throttle = Throttle(
+                read_limit=self._throttle_option("read_limit", parse_size, 0),
+                write_limit=self._throttle_option("write_limit", parse_size, 0),
+                compress_cpu=self._throttle_option("compress_cpu", int, 0),
+                nice=self._throttle_option("nice", int, 0),
+                ionice=self._throttle_option("ionice", str, None),
+                max_load=self._throttle_option("max_load", float, 0),
+                max_pressure=self._throttle_option("max_pressure", float, 0))
+        except ValueError, e:
+            self.soslog.fatal(_("invalid throttling option: %s") % e)
+            self._exit(1)
+
     def _setup_logging(self):
 
         if not sys.stdin.isatty():
@@ -597,6 +1060,35 @@ class SoSReport(object):
     def _log_plugin_exception(self, plugin_name):
         self.soslog.error("%s\n%s" % (plugin_name, traceback.format_exc()))
 
+    def _start_progress(self):
+        if not self.opts.status_socket:
+            return
+        self.progress_server = ProgressServer(self.progress, self.opts.status_socket)
+        try:
+            self.progress_server.start()
+        except (socket.error, OSError), e:
+            self.soslog.warning(_("unable to serve progress on %s: %s")
+                    % (self.opts.status_socket, e))
+            self.progress_server = None
+
+    def _stop_progress(self):
+        if self.progress_server:
+            self.progress_server.stop()
+            self.progress_server = None
+
+    def watch(self):
+        """Look for hung mounts before any plugin gets to touch them. The
+        processes stuck in state D are looked for even when the mounts are
+        not probed."""
+        self.watchdog.check(self.artifacts.get("mounts"))
+        for mountpoint in self.watchdog.hung:
+            self.soslog.warning(_("%s did not respond within %d seconds, "
+                "commands and files using it are skipped")
+                % (mountpoint, self.opts.mount_timeout))
+        if self.watchdog.stuck:
+            self.soslog.warning(_("processes in uninterruptible sleep: %s")
+                % ", ".join("%s (%d)" % (comm, pid) for pid, comm in self.watchdog.stuck))
+
     def diagnose(self):
         tmpcount = 0
         for plugname, plug in self.loaded_plugins:
@@ -650,18 +1142,27 @@ class SoSReport(object):
             self.ui_log.info(e)
             self._exit(0)
 
-    def setup(self):
-        for plugname, plug in self.loaded_plugins:
-            try:
-                plug.archive = self.archive
-                plug.setup()
-            except KeyboardInterrupt:
+    def _setup_plugin(self, plugname):
+        plug = self.plugins_by_name[plugname]
+        try:
+            plug.archive = self.archive
+            self.progress.track(plugname, plug.setup)
+        except KeyboardInterrupt:
+            raise
+        except:
+            if self.raise_plugins:
                 raise
-            except:
-                if self.raise_plugins:
-                    raise
-                else:
-                    self._log_plugin_exception(plugname)
+            else:
+                self._log_plugin_exception(plugname)
+
+    def setup(self):
+        # plugins providing an artifact are set up before the plugins that
+        # consume it, independent plugins are set up concurrently
+        self.plugins_by_name = dict(self.loaded_plugins)
+        self.progress.set_phase("setup", [name for name, plug in self.loaded_plugins])
+        depends = plugin_dependencies(self.loaded_plugins)
+        dag_map(self._setup_plugin, [name for name, plug in self.loaded_plugins],
+                depends, self.opts.threads)
 
     def version(self):
         """Fetch version information from all plugins and store in the report
@@ -674,7 +1175,60 @@ class SoSReport(object):
         self.archive.add_string(content="\n".join(versions), dest='version.txt')
 
 
+    def _run_command(self, job):
+        plugname, plug, progs = job
+        if self.interrupted:
+            return
+        self.progress.start(plugname)
+        start = time()
+        self.throttle.acquire()
+        self._start(plugname, progs[0])
+        try:
+            plug.collectCommand(progs)
+            self._checkpoint(plugname, progs[0])
+        except KeyboardInterrupt:
+            raise
+        except:
+            if self.raise_plugins:
+                raise
+            else:
+                self._log_plugin_exception(plugname)
+        finally:
+            self._stop()
+            self.throttle.release()
+        self.progress.finish(plugname, time() - start, command=True)
+        if not self.opts.silent:
+            with self.progress_lock:
+                self.commands_run += 1
+                sys.stdout.write("\r  Running command %d/%d: %s...        "
+                        % (self.commands_run, self.commands_total, plugname))
+                sys.stdout.flush()
+
     def copy_stuff(self):
+        jobs = [(plugname, plug, progs) for plugname, plug in self.loaded_plugins
+                for progs in plug.collectProgs
+                if not (self.checkpoint and self.checkpoint.has_command(plugname, progs[0]))]
+        if self.history and self.opts.threads > 1:
+            # longest processing time first: starting the slowest commands
+            # early keeps one of them from finishing long after the rest
+            jobs.sort(key=lambda job: self.history.predict(job[0], job[2][0], 0),
+                      reverse=True)
+        if self.history and self.history.loaded:
+            estimate = self.history.estimate([(job[0], job[2][0]) for job in jobs],
+                                             self.opts.threads)
+            self.ui_log.info(_(" Estimated time to run %d commands: %d seconds")
+                             % (len(jobs), estimate))
+            self.ui_log.info("")
+
+        pending = {}
+        for plugname, plug in self.loaded_plugins:
+            pending[plugname] = not (self.checkpoint and self.checkpoint.has_files(plugname))
+        for job in jobs:
+            pending[job[0]] += 1
+        self.progress.set_phase("collecting", [name for name, plug in self.loaded_plugins],
+                                pending)
+        self.progress.set_commands(len(jobs))
+
         plugruncount = 0
         for i in izip(self.loaded_plugins):
             plugruncount += 1
@@ -682,8 +1236,13 @@ class SoSReport(object):
             if not self.opts.silent:
                 sys.stdout.write("\r  Running %d/%d: %s...        " % (plugruncount, len(self.loaded_plugins), plugname))
                 sys.stdout.flush()
+            if self.checkpoint and self.checkpoint.has_files(plugname):
+                continue
+            self._start(plugname)
             try:
-                plug.copyStuff()
+                self.progress.track(plugname, plug.collectFiles)
+                self._add_files_to_manifest(plug)
+                self._checkpoint(plugname)
             except KeyboardInterrupt:
                 raise
             except:
@@ -691,23 +1250,40 @@ class SoSReport(object):
                     raise
                 else:
                     self._log_plugin_exception(plugname)
+            finally:
+                self._stop()
+
+        self.progress_lock = threading.Lock()
+        self.commands_run = 0
+        self.commands_total = len(jobs)
+        parallel_map(self._run_command, jobs, self.opts.threads)
+
+        if self.history:
+            self.history.save()
+
+    def _add_files_to_manifest(self, plug):
+        # the digests were taken from the bytes as they went into the
+        # archive, the files are not read a second time
+        algorithm = get_hash_name()
+        for oneFile in plug.copiedFiles:
+            self.manifest.add_file(oneFile["srcpath"], oneFile["stat"],
+                                   dest=oneFile["dstpath"],
+                                   digest=oneFile.get("digest"), algorithm=algorithm,
+                                   size=oneFile.get("size"))
 
     def report(self):
-        for plugname, plug in self.loaded_plugins:
-            for oneFile in plug.copiedFiles:
-                try:
-                    self.xml_report.add_file(oneFile["srcpath"], os.stat(oneFile["srcpath"]))
-                except:
-                    pass
-
-        self.xml_report.serialize_to_file(
-            os.path.join(self.rptdir, "sosreport.xml"))
+        self.manifest.serialize_to_file(self.archive,
+            os.path.join(self.rptdir, "manifest.jsonl"))
 
 
     def plain_report(self):
-        report = Report()
+        text_fd = self.get_temp_file()
+        json_fd = self.get_temp_file()
+        writer = ReportWriter(text_fd, json_fd)
 
-        for plugname, plug in self.loaded_plugins:
+        # sections are built and written one at a time in name order so
+        # that each can be dropped as soon as it has been written
+        for plugname, plug in sorted(self.loaded_plugins, key=lambda p: p[0]):
             section = Section(name=plugname)
 
             for alert in plug.alerts:
@@ -725,12 +1301,13 @@ class SoSReport(object):
             for content, f in plug.copyStrings:
                 section.add(CreatedFile(name=f))
 
-            report.add(section)
+            writer.write_section(section)
 
-        fd = self.get_temp_file()
-        fd.write(str(PlainTextReport(report)))
-        fd.flush()
-        self.archive.add_file(fd.name, dest=os.path.join('sos_reports', 'sos.txt'))
+        writer.close()
+        text_fd.flush()
+        json_fd.flush()
+        self.archive.add_file(text_fd.name, dest=os.path.join('sos_reports', 'sos.txt'))
+        self.archive.add_file(json_fd.name, dest=os.path.join('sos_reports', 'sos.json'))
 
 
     def html_report(self):
@@ -779,15 +1356,16 @@ class SoSReport(object):
         rfd.write('</ul>')
 
 
-        # Call the report method for each plugin
+        # Stream each plugin's section straight to the report file
         for plugname, plug in self.loaded_plugins:
             try:
-                html = plug.report()
+                for html in plug.report_fragments():
+                    rfd.write(html)
             except:
                 if self.raise_plugins:
                     raise
-            else:
-                rfd.write(html)
+                else:
+                    self._log_plugin_exception(plugname)
 
         rfd.write("</body></html>")
 
@@ -810,7 +1388,26 @@ class SoSReport(object):
 
         self._finish_logging()
 
-        final_filename = self.archive.compress(self.opts.compression_type)
+        self.progress.set_phase("compressing")
+        size = None
+        if not self.archive.compresses_inline and os.path.isfile(self.archive.name()):
+            size = os.path.getsize(self.archive.name())
+        start = time()
+        final_filename = self.archive.compress(self.opts.compression_type, self.throttle)
+        if size is not None:
+            self.progress.compressed(size, time() - start)
+        if self.checkpoint:
+            self.checkpoint.remove()
+
+        if not final_filename:
+            self.ui_log.info(_("The %s archive keeps nothing, no report was saved.")
+                    % self.opts.compression_type)
+        elif self.opts.obfuscate:
+            # the mapping must never end up inside the archive itself
+            mapping_filename = final_filename + ".map"
+            self.obfuscator.write_mapping(mapping_filename)
+            self.ui_log.info(_("The obfuscation mapping has been saved in:\n  %s")
+                    % mapping_filename)
 
         # automated submission will go here
         if not self.opts.upload:
@@ -820,6 +1417,8 @@ class SoSReport(object):
 
         self.tempfile_util.clean()
 
+        self.progress.set_phase("done")
+        self._stop_progress()
         return final_filename
 
     def ensure_plugins(self):
@@ -887,13 +1486,59 @@ class SoSReport(object):
                              help="enable analyzations", default=False)
         parser.add_option("--report", action="store_true",
                              dest="report",
-                             help="Enable html/xml reporting", default=False)
+                             help="Enable html/text reports and the file manifest", default=False)
         parser.add_option("--profile", action="store_true",
                              dest="profiler",
                              help="turn on profiling", default=False)
         parser.add_option("-z", "--compression-type", dest="compression_type",
-                            help="compression technology to use [auto, zip, gzip, bzip2, xz] (default=auto)",
+                            help="compression technology or archive backend to use [auto, %s] (default=auto)"
+                                 % ", ".join(sorted(ARCHIVE_BACKENDS)),
                             default="auto")
+        parser.add_option("--output-limit", action="store", type="float",
+                             dest="output_limit", default=100,
+                             help="stop commands that write more than this many megabytes, 0 for no global limit; plugin-specific limits still apply (default=100)")
+        parser.add_option("--history-file", action="store",
+                             dest="history_file", default="/var/lib/sos/runtimes.json",
+                             help="file remembering command runtimes between runs, empty to disable")
+        parser.add_option("--mount-timeout", action="store", type="int",
+                             dest="mount_timeout", default=5,
+                             help="seconds a network mount is given to respond before it is considered hung, 0 to disable (default=5)")
+        parser.add_option("--resume", action="store_true",
+                             dest="resume", default=False,
+                             help="continue the last interrupted collection left in the temporary directory")
+        parser.add_option("--status-socket", action="store",
+                             dest="status_socket", default=None,
+                             help="serve the progress of the collection as JSON on this UNIX socket")
+        parser.add_option("--status-file", action="store",
+                             dest="status_file", default=None,
+                             help="keep the progress of the collection as JSON in this file")
+        parser.add_option("--read-limit", action="store",
+                             dest="read_limit", default=None,
+                             help="bytes per second files are copied at most, with an optional K, M or G suffix")
+        parser.add_option("--write-limit", action="store",
+                             dest="write_limit", default=None,
+                             help="bytes per second written to the archive at most, with an optional K, M or G suffix")
+        parser.add_option("--compress-cpu", action="store", type="int",
+                             dest="compress_cpu", default=None,
+                             help="percentage of one cpu compression may use")
+        parser.add_option("--nice", action="store", type="int",
+                             dest="nice", default=None,
+                             help="niceness increment commands are run with")
+        parser.add_option("--ionice", action="store",
+                             dest="ionice", default=None,
+                             help="I/O scheduling class commands are run with: idle, best-effort or realtime, optionally followed by :level")
+        parser.add_option("--max-load", action="store", type="float",
+                             dest="max_load", default=None,
+                             help="run one command at a time while the load average per cpu is above this")
+        parser.add_option("--max-pressure", action="store", type="float",
+                             dest="max_pressure", default=None,
+                             help="run one command at a time while more than this percentage of time is spent waiting for cpu or I/O")
+        parser.add_option("--threads", action="store", type="int",
+                             dest="threads", default=4,
+                             help="number of plugins set up and commands run at once (default=4)")
+        parser.add_option("--obfuscate", action="store_true",
+                             dest="obfuscate", default=False,
+                             help="replace hostnames, IP and MAC addresses with pseudonyms")
 
         return parser.parse_args(opts)
 
@@ -911,6 +1556,7 @@ class SoSReport(object):
     def execute(self):
         try:
             self._setup_logging()
+            self._set_throttle()
             self.policy.setCommons(self.get_commons())
             self.print_header()
             self.load_plugins()
@@ -924,21 +1570,28 @@ class SoSReport(object):
 
             self.ensure_plugins()
             self.batch()
+            self._start_progress()
+            self.watch()
 
             if self.opts.diagnose:
                 self.diagnose()
 
             self.prework()
-            self.setup()
+            try:
+                self.setup()
 
-            self.ui_log.info(_(" Running plugins. Please wait ..."))
-            self.ui_log.info("")
+                self.ui_log.info(_(" Running plugins. Please wait ..."))
+                self.ui_log.info("")
 
-            self.copy_stuff()
+                self.copy_stuff()
+            except (KeyboardInterrupt, SystemExit):
+                self.seal()
+                return None
 
             self.ui_log.info("")
 
             if self.opts.report:
+                self.progress.set_phase("reporting")
                 self.report()
                 self.html_report()
                 self.plain_report()
@@ -0,0 +1,243 @@
+"""
+Keep a collection from hurting the workload on the host it runs on: limit
+the bandwidth of the files copied and of the archive written, run child
+commands at a lower CPU and I/O priority, cap the CPU used by compression
+and run fewer commands at once while the host is overloaded
+"""
+## throttle.py
+## be gentle with production hosts
+
+### This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+from __future__ import with_statement
+
+import os
+import signal
+import threading
+import time
+
+from sos.utilities import cpu_count, resolve_executable
+
+IONICE_CLASSES = {"realtime": "1", "best-effort": "2", "idle": "3"}
+
+SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(value):
+    """Returns the number of bytes in value, a number optionally followed by
+    K, M or G. Empty values and 0 are 0."""
+    value = str(value or "0").strip().upper()
+    if value.endswith("B"):
+        value = value[:-1]
+    unit = ""
+    if value and value[-1] in SIZE_UNITS:
+        unit = value[-1]
+        value = value[:-1]
+    size = float(value) * SIZE_UNITS[unit]
+    if size < 0:
+        raise ValueError("negative size")
+    return int(size)
+
+
+def ionice_arguments(value):
+    """Returns the ionice arguments for value, an I/O scheduling class name
+    or number optionally followed by a colon and a priority level"""
+    if not value:
+        return []
+    ioclass, sep, level = str(value).partition(":")
+    ioclass = IONICE_CLASSES.get(ioclass, ioclass)
+    if ioclass not in IONICE_CLASSES.values():
+        raise ValueError("unknown I/O scheduling class %s" % value)
+    arguments = ["-c", ioclass]
+    if level:
+        if not level.isdigit() or int(level) > 7:
+            raise ValueError("I/O priority level must be 0 to 7")
+        arguments.extend(["-n", level])
+    return arguments
+
+
+def load_average(path="/proc/loadavg"):
+    """Returns the one minute load average, or None if it is unknown"""
+    try:
+        fp = open(path)
+        try:
+            return float(fp.read().split()[0])
+        finally:
+            fp.close()
+    except (IOError, ValueError, IndexError):
+        return None
+
+
+def pressure(resource, path="/proc/pressure"):
+    """Returns the share of the last ten seconds some task spent waiting on
+    resource, in percent, or None on kernels without pressure stall
+    information"""
+    try:
+        fp = open(os.path.join(path, resource))
+        try:
+            for line in fp:
+                fields = line.split()
+                if fields and fields[0] == "some":
+                    for field in fields[1:]:
+                        if field.startswith("avg10="):
+                            return float(field[6:])
+        finally:
+            fp.close()
+    except (IOError, ValueError):
+        pass
+    return None
+
+
+class TokenBucket(object):
+    """Limits a flow to rate bytes per second on average, letting bursts of
+    up to burst bytes through at once. Callers consume the bytes they are
+    about to move and are put to sleep for as long as the bucket is in
+    debt. A rate of 0 does not limit anything."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.stamp = time.time()
+        self.lock = threading.Lock()
+
+    def consume(self, count):
+        """Takes count bytes from the bucket and returns the number of
+        seconds the caller was made to wait"""
+        if not self.rate or not count:
+            return 0
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= count
+            wait = max(0, -self.tokens / float(self.rate))
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class CpuLimiter(threading.Thread):
+    """Holds the process group of a child to share of a cpu by stopping and
+    continuing it in turn, period seconds at a time, until it exits"""
+
+    def __init__(self, process, share, period=0.1):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.process = process
+        self.share = share
+        self.period = period
+        self.stopped = False
+
+    def _signal(self, signum):
+        try:
+            os.killpg(self.process.pid, signum)
+        except OSError:
+            return False
+        return True
+
+    def run(self):
+        running = self.period * self.share
+        while not self.stopped and self.process.poll() is None:
+            time.sleep(running)
+            if self.stopped or not self._signal(signal.SIGSTOP):
+                return
+            time.sleep(self.period - running)
+            if not self._signal(signal.SIGCONT):
+                return
+
+    def stop(self):
+        """Lets the process run freely again, it must not be left stopped
+        behind an interrupted sosreport"""
+        self.stopped = True
+        self._signal(signal.SIGCONT)
+
+
+class Throttle(object):
+    """The limits a collection runs under. read_limit and write_limit are in
+    bytes per second, compress_cpu is the percentage of one cpu compression
+    may use, nice and ionice are the priorities child commands are started
+    with. Fewer commands are run at once while the load average per cpu is
+    above max_load or more than max_pressure percent of the time is spent
+    waiting for cpu or I/O. 0 disables a limit."""
+
+    # how often the load is looked at again while commands are held back
+    interval = 1.0
+
+    def __init__(self, read_limit=0, write_limit=0, compress_cpu=0, nice=0,
+                 ionice=None, max_load=0, max_pressure=0):
+        if compress_cpu < 0 or compress_cpu > 100:
+            raise ValueError("compression cpu share must be 0 to 100 percent")
+        self.reads = TokenBucket(read_limit)
+        self.writes = TokenBucket(write_limit)
+        self.compress_cpu = compress_cpu
+        self.nice = nice
+        self.max_load = max_load
+        self.max_pressure = max_pressure
+        self.prefix = []
+        ionice = ionice_arguments(ionice)
+        if ionice and resolve_executable("ionice"):
+            self.prefix.extend([resolve_executable("ionice")] + ionice)
+        if nice and resolve_executable("nice"):
+            self.prefix.extend([resolve_executable("nice"), "-n", str(nice)])
+        self.cpus = cpu_count()
+        self.running = 0
+        self.cond = threading.Condition()
+
+    def overloaded(self):
+        """Returns True if the host is busier than the limits allow"""
+        if self.max_load:
+            load = load_average()
+            if load is not None and load / self.cpus > self.max_load:
+                return True
+        if self.max_pressure:
+            for resource in ("cpu", "io"):
+                waiting = pressure(resource)
+                if waiting is not None and waiting > self.max_pressure:
+                    return True
+        return False
+
+    def acquire(self):
+        """Waits until another command may be started. While the host is
+        overloaded commands are run one at a time."""
+        with self.cond:
+            while self.running and self.overloaded():
+                self.cond.wait(self.interval)
+            self.running += 1
+
+    def release(self):
+        with self.cond:
+            self.running -= 1
+            self.cond.notifyAll()
+
+    def compress_workers(self):
+        """Returns how many threads may compress at once. Compression held
+        to a share of one cpu runs on one thread, otherwise a nicer
+        collection leaves more of the cpus to the host."""
+        if self.compress_cpu and self.compress_cpu < 100:
+            return 1
+        return max(1, self.cpus * (20 - min(max(self.nice, 0), 19)) // 20)
+
+    def limit_cpu(self, process):
+        """Starts holding process, which must lead its own process group, to
+        the compression cpu share"""
+        if not self.compress_cpu or self.compress_cpu >= 100 \
+                or not hasattr(os, "killpg"):
+            return None
+        limiter = CpuLimiter(process, self.compress_cpu / 100.0)
+        limiter.start()
+        return limiter
+
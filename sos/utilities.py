@@ -24,9 +24,11 @@ from __future__ import with_statement
 
 import os
 import re
+import glob
 import string
 import fnmatch
 import inspect
+import shutil
 from stat import *
 #from itertools import *
 from subprocess import Popen, PIPE
@@ -35,13 +37,23 @@ import logging
 import zipfile
 import tarfile
 import hashlib
-import logging
+import zlib
+import binascii
+from collections import deque
 from contextlib import closing
+try:
+    import json
+except ImportError:
+    import simplejson as json
 try:
     from cStringIO import StringIO
 except ImportError:
     from StringIO import StringIO
 import time
+import errno
+import signal
+import threading
+import Queue
 
 def tail(filename, number_of_bytes):
     """Returns the last number_of_bytes of filename"""
@@ -63,29 +75,199 @@ def fileobj(path_or_file, mode='r'):
     else:
         return closing(path_or_file)
 
-def checksum(file_, chunk_size=128, algorithm=None):
+# reads are a multiple of the page size so that large files are consumed
+# in as few syscalls as possible without pulling everything into memory
+CHECKSUM_CHUNK_SIZE = 1 << 20
+
+def checksum(file_, chunk_size=CHECKSUM_CHUNK_SIZE, algorithm=None):
     """Returns the checksum of the supplied filename. The file is read in
     chunk_size blocks"""
     if not algorithm:
         algorithm = get_hash_name()
-    digest = hashlib.new(algorithm)
+    return multi_checksum(file_, (algorithm,), chunk_size)[algorithm]
+
+def multi_checksum(file_, algorithms=None, chunk_size=CHECKSUM_CHUNK_SIZE):
+    """Returns a dictionary mapping each algorithm name in algorithms to the
+    hex digest of the supplied filename or file object. Every digest is
+    computed from a single pass over the data."""
+    if not algorithms:
+        algorithms = (get_hash_name(),)
+    digests = [(name, hashlib.new(name)) for name in algorithms]
     with fileobj(file_, 'rb') as fd:
         data = fd.read(chunk_size)
         while data:
-            digest.update(data)
+            for name, digest in digests:
+                digest.update(data)
             data = fd.read(chunk_size)
-        return digest.hexdigest()
+    return dict((name, digest.hexdigest()) for name, digest in digests)
+
+def checksum_files(files, algorithm=None, workers=4, chunk_size=CHECKSUM_CHUNK_SIZE):
+    """Returns a list of (filename, checksum) tuples for every file in files,
+    in the same order as files. The files are hashed on a pool of worker
+    threads. If a file cannot be read its checksum is None."""
+    if not algorithm:
+        algorithm = get_hash_name()
+
+    def _checksum(fname):
+        # fileobj() would hash an unreadable file as an empty one
+        try:
+            return checksum(open(fname, 'rb'), chunk_size, algorithm)
+        except (IOError, OSError):
+            return None
+
+    return zip(files, parallel_map(_checksum, files, workers))
+
+def cpu_count():
+    """Returns the number of online cpus, or 1 if that is unknown"""
+    try:
+        return max(1, os.sysconf("SC_NPROCESSORS_ONLN"))
+    except (AttributeError, ValueError, OSError):
+        return 1
+
+def _join(threads, errors):
+    """Waits for threads to finish. The joins time out now and then so that
+    signals are still handled; an interruption is recorded in errors, which
+    stops the workers from starting anything new, and then re-raised."""
+    try:
+        for thread in threads:
+            while thread.isAlive():
+                thread.join(0.5)
+    except (KeyboardInterrupt, SystemExit), e:
+        errors.append(e)
+        raise
+
+def parallel_map(func, items, workers=4):
+    """Applies func to every element of items on a pool of at most workers
+    threads and returns the results as a list in the same order as items.
+    The first exception raised by func is re-raised once all workers have
+    stopped."""
+    items = list(items)
+    results = [None] * len(items)
+    if workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    queue = Queue.Queue()
+    for job in enumerate(items):
+        queue.put(job)
+    errors = []
+
+    def _worker():
+        while not errors:
+            try:
+                index, item = queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[index] = func(item)
+            except Exception, e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=_worker)
+               for i in range(min(workers, len(items)))]
+    for thread in threads:
+        thread.setDaemon(True)
+        thread.start()
+    _join(threads, errors)
+
+    if errors:
+        raise errors[0]
+    return results
+
+def dag_map(func, items, depends, workers=4):
+    """Like parallel_map, but an item is not started before every item it
+    depends on has finished. depends maps an item to the items it waits for;
+    those that are not in items are ignored. Items are started in the order
+    they are given as soon as they are ready. If the remaining items depend
+    on each other in a cycle the first of them is started regardless so that
+    every item runs exactly once."""
+    items = list(items)
+    position = dict((item, index) for index, item in enumerate(items))
+    results = [None] * len(items)
+    waits = []
+    dependents = [[] for item in items]
+    for index, item in enumerate(items):
+        wait = set(position[dep] for dep in depends.get(item, ())
+                   if dep in position and dep != item)
+        for dep in wait:
+            dependents[dep].append(index)
+        waits.append(wait)
+
+    pending = set(range(len(items)))
+    ready = [index for index in range(len(items)) if not waits[index]]
+    state = {"running": 0}
+    errors = []
+    cond = threading.Condition()
+
+    def _next():
+        # called with cond held
+        while not errors and pending:
+            if ready:
+                index = ready.pop(0)
+            elif not state["running"]:
+                index = min(pending)
+            else:
+                cond.wait()
+                continue
+            pending.discard(index)
+            state["running"] += 1
+            return index
+        return None
+
+    def _worker():
+        while True:
+            with cond:
+                index = _next()
+            if index is None:
+                return
+            try:
+                try:
+                    results[index] = func(items[index])
+                except Exception, e:
+                    errors.append(e)
+            finally:
+                with cond:
+                    state["running"] -= 1
+                    for dependent in dependents[index]:
+                        waits[dependent].discard(index)
+                        if not waits[dependent] and dependent in pending \
+                                and dependent not in ready:
+                            ready.append(dependent)
+                            ready.sort()
+                    cond.notifyAll()
+
+    if workers <= 1 or len(items) <= 1:
+        _worker()
+    else:
+        threads = [threading.Thread(target=_worker)
+                   for i in range(min(workers, len(items)))]
+        for thread in threads:
+            thread.setDaemon(True)
+            thread.start()
+        _join(threads, errors)
+
+    if errors:
+        raise errors[0]
+    return results
+
+# the hash algorithm of the policy, looked up on first use
+_hash_name = None
 
 def get_hash_name():
-    """Returns the algorithm used when computing a hash"""
+    """Returns the algorithm used when computing a hash. The policy is only
+    consulted once, the answer is remembered for the life of the process."""
+    global _hash_name
+    if _hash_name:
+        return _hash_name
+
     import sos.policies
     policy = sos.policies.load()
     try:
         name = policy.getPreferredHashAlgorithm()
         hashlib.new(name)
-        return name
     except:
-        return 'sha256'
+        name = 'sha256'
+    _hash_name = name
+    return name
 
 def convert_bytes(bytes_, K=1 << 10, M=1 << 20, G=1 << 30, T=1 << 40):
     """Converts a number of bytes to a shorter, more human friendly format"""
@@ -103,6 +285,134 @@ def convert_bytes(bytes_, K=1 << 10, M=1 << 20, G=1 << 30, T=1 << 40):
 
 
 
+# files in /proc and /sys report a size of 0, so they are read in chunks
+# of this size until the kernel has nothing more to give
+PSEUDO_READ_SIZE = 1 << 16
+
+def pseudo_file_paths(copyspec):
+    """Yields a (path, lstat result) tuple for every readable regular file
+    matched by the glob copyspec or found below a directory it matches.
+    Matched paths are followed if they are symbolic links, links found below
+    them are not."""
+    for top in sorted(glob.glob(copyspec)):
+        try:
+            stats = os.stat(top)
+        except OSError:
+            continue
+        if not S_ISDIR(stats.st_mode):
+            if S_ISREG(stats.st_mode) and stats.st_mode & 0444:
+                yield top, stats
+            continue
+        dirs = [top]
+        while dirs:
+            path = dirs.pop()
+            try:
+                names = sorted(os.listdir(path))
+            except OSError:
+                continue
+            for name in names:
+                name = os.path.join(path, name)
+                try:
+                    stats = os.lstat(name)
+                except OSError:
+                    continue
+                if S_ISDIR(stats.st_mode):
+                    dirs.append(name)
+                elif S_ISREG(stats.st_mode) and stats.st_mode & 0444:
+                    yield name, stats
+
+def read_pseudo_file(path):
+    """Returns the content of a /proc or /sys file without relying on the
+    size the file reports"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        chunks = []
+        chunk = os.read(fd, PSEUDO_READ_SIZE)
+        while chunk:
+            chunks.append(chunk)
+            chunk = os.read(fd, PSEUDO_READ_SIZE)
+        return "".join(chunks)
+    finally:
+        os.close(fd)
+
+def read_pseudo_files(paths, timeout=5):
+    """Reads every file in paths on a reader thread and returns a list with
+    the content of each, in the same order, or None for the files that could
+    not be read. A read that has not returned after at least timeout seconds
+    is given up on: the reader is left behind and a new one carries on with the next
+    file, so one blocking attribute can not stall the whole collection."""
+    paths = list(paths)
+    results = [None] * len(paths)
+
+    def _reader(start, progress):
+        for index in xrange(start, len(paths)):
+            progress["index"] = index
+            if progress.get("abandoned"):
+                return
+            try:
+                content = read_pseudo_file(paths[index])
+            except (IOError, OSError):
+                continue
+            if not progress.get("abandoned"):
+                results[index] = content
+
+    start = 0
+    while start < len(paths):
+        progress = {"index": start}
+        reader = threading.Thread(target=_reader, args=(start, progress))
+        reader.setDaemon(True)
+        reader.start()
+        last = None
+        while True:
+            reader.join(timeout)
+            if not reader.isAlive():
+                start = len(paths)
+                break
+            if progress["index"] == last:
+                progress["abandoned"] = True
+                logging.getLogger('sos').warning(
+                        "reading %s timed out after %ds" % (paths[last], timeout))
+                results[last] = None
+                start = last + 1
+                break
+            last = progress["index"]
+    return results
+
+# the directory of the archive that holds aggregated pseudo files
+PSEUDO_AGGREGATE_DIR = "sos_pseudo"
+
+def is_pseudo_aggregate(dest):
+    """Returns True if dest is the archive path of an aggregate built by
+    aggregate_pseudo_files()"""
+    return dest.split(os.sep, 1)[0] == PSEUDO_AGGREGATE_DIR
+
+def aggregate_pseudo_files(files):
+    """Returns a single document holding every (path, content) tuple in
+    files. It starts with an index with one "offset size path" line per file,
+    offsets counted from the end of the index, which is terminated by an
+    empty line. The contents follow each other without separators."""
+    index = []
+    offset = 0
+    for path, content in files:
+        index.append("%d %d %s\n" % (offset, len(content), path))
+        offset += len(content)
+    index.append("\n")
+    return "".join(index + [content for path, content in files])
+
+def split_pseudo_aggregate(document):
+    """Returns the (path, content) tuples stored in a document built by
+    aggregate_pseudo_files()"""
+    if document.startswith("\n"):
+        header, data = "", document[1:]
+    else:
+        header, data = document.split("\n\n", 1)
+    files = []
+    for line in header.splitlines():
+        offset, size, path = line.split(" ", 2)
+        offset, size = int(offset), int(size)
+        files.append((path, data[offset:offset + size]))
+    return files
+
 def find(file_pattern, top_dir, max_depth=None, path_pattern=None):
     """generator function to find files recursively. Usage:
 
@@ -135,30 +445,186 @@ def grep(pattern, *files_or_paths):
 
     return matches
 
+_executables = {}
+_executables_lock = threading.Lock()
+
+def resolve_executable(command):
+    """Returns the path of the executable command would run, looking it up on
+    the PATH unless it contains a directory, or None if there is no such
+    executable. Lookups are remembered for as long as PATH is unchanged."""
+    paths = os.environ.get("PATH", "")
+    key = (command, paths)
+    with _executables_lock:
+        if key in _executables:
+            return _executables[key]
+    found = None
+    for path in [command] + [os.path.join(p, command)
+                             for p in paths.split(os.path.pathsep)]:
+        if os.access(path, os.X_OK) and not os.path.isdir(path):
+            found = path
+            break
+    with _executables_lock:
+        _executables[key] = found
+    return found
+
 def is_executable(command):
     """Returns if a command matches an executable on the PATH"""
+    return resolve_executable(command) is not None
 
-    paths = os.environ.get("PATH", "").split(os.path.pathsep)
-    candidates = [command] + [os.path.join(p, command) for p in paths]
-    return any(os.access(path, os.X_OK) for path in candidates)
+# anything the shell would have to interpret; quoting alone is handled by
+# shlex so such commands can still be run without a shell
+SHELL_SYNTAX = re.compile(r"[|&;<>()$`\\*?\[\]{}~#\n]")
 
-def sosGetCommandOutput(command, timeout=300):
-    """Execute a command through the system shell. First checks to see if the
-    requested command is executable. Returns (returncode, stdout, 0)"""
+def command_argv(command):
+    """Returns the argument vector command can be executed with directly, or
+    None if it needs a shell"""
+    if SHELL_SYNTAX.search(command):
+        return None
+    try:
+        argv = shlex.split(command)
+    except ValueError:
+        return None
+    if not argv or "=" in argv[0]:
+        return None
+    return argv
+
+
+class CommandResult(object):
+    """The outcome of running a command with run_command(). status follows
+    the shell's conventions: 127 when the command could not be found, 124
+    when it was killed after running out of time and 128 plus the signal
+    number when it was killed by a signal. wall and cpu are in seconds,
+    maxrss is the peak resident set size in kilobytes. size is the number of
+    bytes the command wrote before it exited or was stopped; truncated is set
+    when it was stopped for writing more than the size limit."""
+
+    __slots__ = ('command', 'status', 'output', 'wall', 'cpu', 'maxrss',
+                 'timed_out', 'size', 'truncated')
+
+    def __init__(self, command, status=127, output=""):
+        self.command = command
+        self.status = status
+        self.output = output
+        self.wall = 0
+        self.cpu = None
+        self.maxrss = None
+        self.timed_out = False
+        self.size = 0
+        self.truncated = False
+
+
+def _kill_group(process):
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except OSError:
+        pass
+
+def _wait(process):
+    """Reaps process and returns its resource usage where the platform
+    reports it"""
+    if not hasattr(os, "wait4"):
+        process.wait()
+        return None
+    while True:
+        try:
+            pid, status, rusage = os.wait4(process.pid, 0)
+            break
+        except OSError, e:
+            if e.errno != errno.EINTR:
+                raise
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    return rusage
+
+# appended to the output of a command that was stopped at its size limit
+TRUNCATED_MARKER = "\n\n[sosreport: output truncated after %d bytes, command stopped]\n"
+
+OUTPUT_CHUNK_SIZE = 1 << 16
+
+def run_command(command, timeout=300, sizelimit=None, prefix=None):
+    """Runs command and returns a CommandResult. The command is executed
+    directly when it uses no shell syntax and through /bin/sh otherwise. It
+    runs in its own process group, which is killed as a whole if it has not
+    finished after timeout seconds or as soon as it has written more than
+    sizelimit bytes. The output of a stopped command is cut at sizelimit and
+    ends with TRUNCATED_MARKER. Standard error is discarded. prefix is an
+    argument vector the command is run under, such as nice -n 10."""
+    result = CommandResult(command)
     # XXX: what is this doing this for?
     cmdfile = command.strip("(").split()[0]
-
-    if is_executable(cmdfile):
-
-        # use /usr/bin/timeout to implement a timeout
-        if timeout and is_executable("/usr/bin/timeout"):
-            command = "/usr/bin/timeout %ds %s" % (timeout, command)
-
-        p = Popen(command, shell=True, stdout=PIPE, stderr=PIPE, bufsize=-1)
-        stdout, stderr = p.communicate()
-        return (p.returncode, stdout.strip(), 0)
+    executable = resolve_executable(cmdfile)
+    if not executable:
+        return result
+
+    argv = command_argv(command)
+    if argv:
+        argv[0] = executable
+    if prefix:
+        argv = list(prefix) + (argv or ["/bin/sh", "-c", command])
+
+    start = time.time()
+    devnull = open(os.devnull, "w")
+    try:
+        p = Popen(argv or command, shell=not argv, stdout=PIPE,
+                  stderr=devnull, bufsize=-1, close_fds=True,
+                  preexec_fn=getattr(os, "setsid", None))
+    finally:
+        devnull.close()
+
+    timer = None
+    if timeout:
+        def _expire():
+            result.timed_out = True
+            _kill_group(p)
+        timer = threading.Timer(timeout, _expire)
+        timer.setDaemon(True)
+        timer.start()
+    chunks = []
+    try:
+        while True:
+            chunk = p.stdout.read(OUTPUT_CHUNK_SIZE)
+            if not chunk:
+                break
+            result.size += len(chunk)
+            chunks.append(chunk)
+            if sizelimit and result.size > sizelimit:
+                result.truncated = True
+                _kill_group(p)
+                break
+        p.stdout.close()
+        rusage = _wait(p)
+    finally:
+        if timer:
+            timer.cancel()
+
+    result.wall = time.time() - start
+    output = "".join(chunks)
+    if result.truncated:
+        result.output = output[:sizelimit] + TRUNCATED_MARKER % sizelimit
+    else:
+        result.output = output.strip()
+    if result.timed_out:
+        result.status = 124
+    elif p.returncode < 0:
+        result.status = 128 - p.returncode
     else:
-        return (127, "", 0)
+        result.status = p.returncode
+    if rusage:
+        result.cpu = rusage.ru_utime + rusage.ru_stime
+        result.maxrss = rusage.ru_maxrss
+    return result
+
+def sosGetCommandOutput(command, timeout=300, prefix=None):
+    """Execute a command, through the system shell only if it needs one.
+    First checks to see if the requested command is executable. Returns
+    (returncode, stdout, runtime)"""
+    result = run_command(command, timeout, prefix=prefix)
+    return (result.status, result.output, result.wall)
 
 def import_module(module_fqname, superclasses=None):
     """Imports the module module_fqname and returns a list of defined classes
@@ -180,9 +646,115 @@ def shell_out(cmd):
     Does not handle exceptions."""
     return sosGetCommandOutput(cmd)[1]
 
+def read_content(src, fileobj=None):
+    """Returns the content of the file src, read from fileobj if given"""
+    if fileobj:
+        return fileobj.read()
+    fp = open(src, 'rb')
+    try:
+        return fp.read()
+    finally:
+        fp.close()
+
+class DigestReader(object):
+    """Wraps a file being copied into an archive and computes the digest of
+    the bytes read from it, which are those stored"""
+
+    def __init__(self, fp, algorithm):
+        self.fp = fp
+        self.hash = hashlib.new(algorithm)
+
+    def read(self, size=-1):
+        data = self.fp.read(size)
+        self.hash.update(data)
+        return data
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+    def close(self):
+        self.fp.close()
+
+class ThrottledFile(object):
+    """Wraps a file object and holds what is read from or written to it to
+    the rate of bucket, a TokenBucket, one chunk at a time. All other
+    attributes are those of the wrapped file."""
+
+    chunk_size = 1 << 16
+
+    def __init__(self, fp, bucket):
+        self.fp = fp
+        self.bucket = bucket
+
+    def __getattr__(self, name):
+        return getattr(self.fp, name)
+
+    def read(self, size=-1):
+        chunks = []
+        while size:
+            if size < 0:
+                chunk = self.fp.read(self.chunk_size)
+            else:
+                chunk = self.fp.read(min(size, self.chunk_size))
+                size -= len(chunk)
+            if not chunk:
+                break
+            self.bucket.consume(len(chunk))
+            chunks.append(chunk)
+        return "".join(chunks)
+
+    def write(self, data):
+        for offset in xrange(0, len(data), self.chunk_size):
+            chunk = data[offset:offset + self.chunk_size]
+            self.bucket.consume(len(chunk))
+            self.fp.write(chunk)
+
 class Archive(object):
+    """The interface of the archive backends. An archive is written as a
+    stream: files, strings and links are added one after the other, then it
+    is closed and compressed. What a backend can do beyond that is declared
+    by its capability flags:
+
+    supports_reopen    an interrupted archive can be opened again with
+                       reopen() to continue after its last checkpoint()
+    supports_links     add_link() stores a symbolic link
+    compresses_inline  members are compressed as they are added and the
+                       method given to compress() is not used
+    """
 
     _name = "unset"
+    supports_reopen = False
+    supports_links = False
+    compresses_inline = False
+    write_limit = None
+
+    @classmethod
+    def reopen(class_, name, offset):
+        """Opens the archive name left behind by an interrupted run after
+        its checkpoint at offset"""
+        raise NotImplementedError
+
+    def name(self):
+        """Returns the path of the archive on disk"""
+        raise NotImplementedError
+
+    def add_file(self, src, dest=None, fileobj=None):
+        """Adds the file or directory src, as dest if given. The content of
+        a file is read from fileobj, an open file on src, when one is given
+        so that the caller sees exactly the bytes stored. Backends whose
+        add_file() does not take fileobj are still supported, see
+        LegacyArchive."""
+        raise NotImplementedError
+
+    def add_string(self, content, dest):
+        raise NotImplementedError
+
+    def open_file(self, name):
+        """Returns a file object to read the member name back from"""
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
 
     def prepend(self, src):
         if src:
@@ -193,25 +765,73 @@ class Archive(object):
     def add_link(self, dest, link_name):
         pass
 
-    def compress(self, method):
-        """Compress an archive object via method. ZIP archives are ignored. If
-        method is automatic then the following technologies are tried in order: xz,
-        bz2 and gzip"""
+    def limit_writes(self, bucket):
+        """Holds the bytes written to the archive on disk to the rate of
+        bucket, a TokenBucket"""
+        self.write_limit = bucket
+
+    def limit_compression(self, throttle):
+        """Holds the compression done while members are added to the cpu
+        share and priority of throttle. Only archives that compress inline
+        have anything to do."""
+        pass
+
+    def _limited(self, fp):
+        if self.write_limit:
+            return ThrottledFile(fp, self.write_limit)
+        return fp
+
+    def checkpoint(self):
+        """Makes everything added so far durable and returns the size of the
+        archive at this point, or None if the archive cannot be resumed"""
+        return None
+
+    def compress(self, method, throttle=None):
+        """Compress an archive object via method and return the name of the
+        result. Archives that compress inline are only closed. If method is
+        automatic then the following technologies are tried in order: xz,
+        bz2 and gzip. The compressor runs at the priority and within the cpu
+        share of throttle when one is given."""
 
         self.close()
 
 
 class TarFileArchive(Archive):
 
+    supports_reopen = True
+    supports_links = True
+
     def __init__(self, name):
         self._name = name
         self._suffix = "tar"
         self.tarfile = tarfile.open(self.name(), mode="w")
 
+    @classmethod
+    def reopen(class_, name, offset):
+        """Opens the archive name left behind by an interrupted run for
+        appending, dropping whatever was written after offset"""
+        archive = class_.__new__(class_)
+        archive._name = name
+        archive._suffix = "tar"
+        fp = open(archive.name(), "r+b")
+        try:
+            fp.truncate(offset)
+            # tarfile only appends to an archive with an end marker
+            fp.seek(offset)
+            fp.write(tarfile.NUL * tarfile.BLOCKSIZE * 2)
+        finally:
+            fp.close()
+        archive.tarfile = tarfile.open(archive.name(), mode="a")
+        return archive
+
+    def checkpoint(self):
+        self.tarfile.fileobj.flush()
+        return self.tarfile.offset
+
     def name(self):
         return "%s.%s" % (self._name, self._suffix)
 
-    def add_file(self, src, dest=None):
+    def add_file(self, src, dest=None, fileobj=None):
         if dest:
             dest = self.prepend(dest)
         else:
@@ -220,9 +840,7 @@ class TarFileArchive(Archive):
         if os.path.isdir(src):
             self.tarfile.add(src, dest)
         else:
-            fp = open(src, 'rb')
-            content = fp.read()
-            fp.close()
+            content = read_content(src, fileobj)
 
             tar_info = tarfile.TarInfo(name=dest)
             tar_info.size = len(content)
@@ -244,6 +862,18 @@ class TarFileArchive(Archive):
         tar_info.mtime = time.time()
         self.tarfile.addfile(tar_info, None)
 
+    def add_member(self, tar_info, fileobj=None):
+        """Adds tar_info, taken from another archive, with its metadata
+        intact. The content of a regular file is streamed from fileobj."""
+        tar_info.name = self.prepend(tar_info.name)
+        if tar_info.islnk():
+            tar_info.linkname = self.prepend(tar_info.linkname)
+        self.tarfile.addfile(tar_info, fileobj)
+
+    def limit_writes(self, bucket):
+        super(TarFileArchive, self).limit_writes(bucket)
+        self.tarfile.fileobj = self._limited(self.tarfile.fileobj)
+
     def open_file(self, name):
         try:
             self.tarfile.close()
@@ -255,11 +885,12 @@ class TarFileArchive(Archive):
         finally:
             self.tarfile.close()
             self.tarfile = tarfile.open(self.name(), mode="a")
+            self.tarfile.fileobj = self._limited(self.tarfile.fileobj)
 
     def close(self):
         self.tarfile.close()
 
-    def compress(self, method):
+    def compress(self, method, throttle=None):
         super(TarFileArchive, self).compress(method)
 
         methods = ['xz', 'bzip2', 'gzip']
@@ -273,8 +904,18 @@ class TarFileArchive(Archive):
         for cmd in methods:
             try:
                 command = shlex.split("%s %s" % (cmd,self.name()))
-                p = Popen(command, stdout=PIPE, stderr=PIPE, bufsize=-1)
-                stdout, stderr = p.communicate()
+                limiter = None
+                if throttle:
+                    command = throttle.prefix + command
+                p = Popen(command, stdout=PIPE, stderr=PIPE, bufsize=-1,
+                          preexec_fn=getattr(os, "setsid", None))
+                try:
+                    if throttle:
+                        limiter = throttle.limit_cpu(p)
+                    stdout, stderr = p.communicate()
+                finally:
+                    if limiter:
+                        limiter.stop()
                 if stdout:
                     log.info(stdout)
                 if stderr:
@@ -287,56 +928,375 @@ class TarFileArchive(Archive):
             raise last_error
 
 
-class ZipFileArchive(Archive):
+class SeekableTarFileArchive(Archive):
+    """A gzip compressed tar archive in which every member is compressed as
+    an independent gzip stream. The concatenated streams are still a valid
+    .tar.gz for standard tar and gzip, and a sidecar index (the archive name
+    with an .idx suffix) maps each member name to its compressed offset and
+    length so a single member can be read without decompressing the rest.
+    """
+
+    supports_links = True
+    compresses_inline = True
 
     def __init__(self, name):
         self._name = name
+        self._suffix = "tar.gz"
+        self.algorithm = get_hash_name()
+        self.index = {}
+        self.fp = open(self.name(), "wb")
+
+    def name(self):
+        return "%s.%s" % (self._name, self._suffix)
+
+    def index_name(self):
+        return self.name() + ".idx"
+
+    def _add_member(self, tar_info, content=""):
+        tar_info.size = len(content)
+        header = tar_info.tobuf(tarfile.GNU_FORMAT)
+        blocks, remainder = divmod(len(content), tarfile.BLOCKSIZE)
+        padding = remainder and tarfile.NUL * (tarfile.BLOCKSIZE - remainder) or ""
+
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        data = compressor.compress(header)
+        data += compressor.compress(content)
+        data += compressor.compress(padding) + compressor.flush()
+
+        offset = self.fp.tell()
+        self.fp.write(data)
+        self.index[tar_info.name] = {
+            "offset": offset,
+            "length": len(data),
+            "header": len(header),
+            "size": tar_info.size,
+            "type": tar_info.type,
+            self.algorithm: hashlib.new(self.algorithm, content).hexdigest(),
+        }
+
+    def add_file(self, src, dest=None, fileobj=None):
+        if not dest:
+            dest = src
+
+        if os.path.isdir(src):
+            for path, dirnames, filenames in os.walk(src):
+                for filename in filenames:
+                    filename = os.path.join(path, filename)
+                    self.add_file(filename,
+                            os.path.join(dest, filename[len(src):].lstrip(os.sep)))
+            return
+
+        content = read_content(src, fileobj)
+
+        tar_info = tarfile.TarInfo(name=self.prepend(dest))
+        tar_info.mtime = os.stat(src).st_mtime
+        self._add_member(tar_info, content)
+
+    def add_string(self, content, dest):
+        tar_info = tarfile.TarInfo(name=self.prepend(dest))
+        tar_info.mtime = time.time()
+        self._add_member(tar_info, content)
+
+    def add_link(self, dest, link_name):
+        tar_info = tarfile.TarInfo(name=self.prepend(link_name))
+        tar_info.type = tarfile.SYMTYPE
+        tar_info.linkname = dest
+        tar_info.mtime = time.time()
+        self._add_member(tar_info)
+
+    def limit_writes(self, bucket):
+        super(SeekableTarFileArchive, self).limit_writes(bucket)
+        self.fp = self._limited(self.fp)
+
+    def open_file(self, name):
+        self.fp.flush()
+        return StringIO(read_seekable_member(self.name(), self.prepend(name),
+                                             self.index))
+
+    def close(self):
+        if self.fp.closed:
+            return
+        # the end of archive marker is its own stream as well
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self.fp.write(compressor.compress(tarfile.NUL * tarfile.RECORDSIZE) +
+                      compressor.flush())
+        self.fp.close()
+
+        fp = open(self.index_name(), "w")
+        json.dump({"algorithm": self.algorithm, "members": self.index}, fp)
+        fp.close()
+
+    def compress(self, method, throttle=None):
+        super(SeekableTarFileArchive, self).compress(method)
+        return self.name()
+
+
+def read_seekable_member(filename, member, index=None):
+    """Returns the content of member from the seekable archive filename.
+    index is the member index, it is loaded from the sidecar file when it is
+    not supplied. Raises KeyError if member is not in the archive."""
+    if index is None:
+        fp = open(filename + ".idx")
         try:
-            import zlib
-            self.compression = zipfile.ZIP_DEFLATED
-        except:
-            self.compression = zipfile.ZIP_STORED
+            index = json.load(fp)["members"]
+        finally:
+            fp.close()
 
-        self.zipfile = zipfile.ZipFile(self.name(), mode="w", compression=self.compression)
+    entry = index[member]
+    fp = open(filename, "rb")
+    try:
+        fp.seek(entry["offset"])
+        data = fp.read(entry["length"])
+    finally:
+        fp.close()
+
+    data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+    return data[entry["header"]:entry["header"] + entry["size"]]
+
+
+class ZipMember(object):
+    """A member on its way into a ZipFileArchive. The content of a file is
+    read, unless it was given, and compressed by deflate() on a worker
+    thread."""
+
+    __slots__ = ('info', 'src', 'content', 'size', 'data', 'error', 'done')
+
+    def __init__(self, info, src=None, content=None, size=0):
+        self.info = info
+        self.src = src
+        self.content = content
+        if content is not None:
+            size = len(content)
+        self.size = size
+        self.data = None
+        self.error = None
+        self.done = threading.Event()
+
+    def deflate(self):
+        try:
+            try:
+                content = self.content
+                if content is None:
+                    fp = open(self.src, "rb")
+                    try:
+                        content = fp.read()
+                    finally:
+                        fp.close()
+                self.info.file_size = len(content)
+                self.info.CRC = binascii.crc32(content) & 0xffffffff
+                if self.info.compress_type == zipfile.ZIP_DEFLATED:
+                    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                                  zlib.DEFLATED, -15)
+                    content = compressor.compress(content) + compressor.flush()
+                self.info.compress_size = len(content)
+                self.data = content
+            except (IOError, OSError), e:
+                self.error = e
+        finally:
+            self.content = None
+            self.done.set()
+
+
+class ZipFileArchive(Archive):
+    """A zip archive whose members are compressed on a pool of worker
+    threads, zip members being independent of each other. They are written
+    to the archive, and listed in its central directory, in the order they
+    were added. Zip64 extensions are used once the archive, a member or the
+    number of members outgrows the classic format."""
+
+    compresses_inline = True
+    # files larger than this are compressed in chunks, on the calling
+    # thread, instead of in memory
+    stream_size = 64 << 20
+    # bounds the bytes of content held in memory waiting to be written,
+    # every member counting for at least member_overhead
+    max_pending = 128 << 20
+    member_overhead = 4096
+
+    def __init__(self, name, workers=None):
+        self._name = name
+        self.compression = zipfile.ZIP_DEFLATED
+        self.workers = workers or cpu_count()
+        self.cpu_share = 0
+        self.nice = 0
+        self.jobs = Queue.Queue()
+        self.pending = deque()
+        self.pending_bytes = 0
+        self.threads = []
+
+        self.zipfile = self._open("w")
+
+    def _open(self, mode):
+        archive = zipfile.ZipFile(self.name(), mode=mode,
+                                  compression=self.compression, allowZip64=True)
+        archive.fp = self._limited(archive.fp)
+        return archive
+
+    def limit_writes(self, bucket):
+        super(ZipFileArchive, self).limit_writes(bucket)
+        self.zipfile.fp = self._limited(self.zipfile.fp)
 
     def name(self):
         return "%s.zip" % self._name
 
-    def compress(self, method):
+    def compress(self, method, throttle=None):
         super(ZipFileArchive, self).compress(method)
         return self.name()
 
-    def add_file(self, src, dest=None):
+    def limit_compression(self, throttle):
+        self.workers = throttle.compress_workers()
+        self.cpu_share = throttle.compress_cpu / 100.0
+        self.nice = throttle.nice
+
+    def _rest(self, start):
+        """Sleeps long enough after compressing since start to keep to the
+        cpu share"""
+        if 0 < self.cpu_share < 1:
+            time.sleep((time.time() - start) * (1 - self.cpu_share)
+                       / self.cpu_share)
+
+    def _deflate(self):
+        if self.nice > 0:
+            # on Linux this only lowers the priority of this thread
+            try:
+                os.nice(self.nice)
+            except OSError:
+                pass
+        while True:
+            member = self.jobs.get()
+            if member is None:
+                return
+            start = time.time()
+            member.deflate()
+            self._rest(start)
+
+    def _submit(self, member):
+        if not self.threads:
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._deflate)
+                thread.setDaemon(True)
+                thread.start()
+                self.threads.append(thread)
+        self.jobs.put(member)
+        self.pending.append(member)
+        self.pending_bytes += max(member.size, self.member_overhead)
+        self._drain()
+
+    def _drain(self, block=False):
+        """Writes out the members at the head of the queue that are ready,
+        waiting for them if block is set or too much content is pending"""
+        while self.pending and (block or self.pending[0].done.isSet()
+                                or self.pending_bytes > self.max_pending):
+            member = self.pending.popleft()
+            self.pending_bytes -= max(member.size, self.member_overhead)
+            self._write(member)
+
+    def _write(self, member):
+        member.done.wait()
+        if member.error:
+            logging.getLogger('sos').error("Unable to add %s to the archive: %s"
+                                           % (member.info.filename, member.error))
+            return
+
+        # what ZipFile.writestr() does, with the compression already done
+        info = member.info
+        info.header_offset = self.zipfile.fp.tell()
+        self.zipfile._writecheck(info)
+        self.zipfile._didModify = True
+        self.zipfile.fp.write(info.FileHeader())
+        self.zipfile.fp.write(member.data)
+        self.zipfile.filelist.append(info)
+        self.zipfile.NameToInfo[info.filename] = info
+
+    def _write_stream(self, info, fileobj, size):
+        """Compresses fileobj into the archive chunk by chunk, what
+        ZipFile.write() does for a file"""
+        zip64 = size * 1.05 > zipfile.ZIP64_LIMIT
+        info.file_size = info.compress_size = info.CRC = crc = 0
+        info.header_offset = self.zipfile.fp.tell()
+        self.zipfile._writecheck(info)
+        self.zipfile._didModify = True
+        self.zipfile.fp.write(info.FileHeader(zip64))
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                      zlib.DEFLATED, -15)
+        while True:
+            chunk = fileobj.read(OUTPUT_CHUNK_SIZE)
+            if not chunk:
+                break
+            start = time.time()
+            info.file_size += len(chunk)
+            crc = binascii.crc32(chunk, crc)
+            chunk = compressor.compress(chunk)
+            info.compress_size += len(chunk)
+            self.zipfile.fp.write(chunk)
+            self._rest(start)
+        chunk = compressor.flush()
+        info.compress_size += len(chunk)
+        self.zipfile.fp.write(chunk)
+        info.CRC = crc & 0xffffffff
+        if not zip64 and max(info.file_size,
+                             info.compress_size) > zipfile.ZIP64_LIMIT:
+            raise RuntimeError("%s grew while it was compressed"
+                               % info.filename)
+        # the header goes in again now that the sizes and crc are known
+        position = self.zipfile.fp.tell()
+        self.zipfile.fp.seek(info.header_offset)
+        self.zipfile.fp.write(info.FileHeader(zip64))
+        self.zipfile.fp.seek(position)
+        self.zipfile.filelist.append(info)
+        self.zipfile.NameToInfo[info.filename] = info
+
+    def _stop(self):
+        self._drain(block=True)
+        for thread in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def add_file(self, src, dest=None, fileobj=None):
         src = str(src)
         if dest:
             dest = str(dest)
+        else:
+            dest = src
 
         if os.path.isdir(src):
-            # We may not need, this, but if we do I only want to do it
-            # one time
-            regex = re.compile(r"^" + src)
             for path, dirnames, filenames in os.walk(src):
                 for filename in filenames:
-                    filename = "/".join((path, filename))
-                    if dest:
-                        self.zipfile.write(filename,
-                                self.prepend(re.sub(regex, dest, filename)))
-                    else:
-                        self.zipfile.write(filename, self.prepend(filename))
+                    filename = os.path.join(path, filename)
+                    self.add_file(filename,
+                            os.path.join(dest, filename[len(src):].lstrip(os.sep)))
+            return
+
+        stats = os.stat(src)
+        info = zipfile.ZipInfo(os.path.normpath(self.prepend(dest)),
+                date_time=time.localtime(stats.st_mtime)[:6])
+        info.compress_type = self.compression
+        info.external_attr = (stats.st_mode & 0xFFFF) << 16L
+        if stats.st_size > self.stream_size:
+            # written in place, after everything added before it
+            self._drain(block=True)
+            fp = fileobj or open(src, "rb")
+            try:
+                self._write_stream(info, fp, stats.st_size)
+            finally:
+                if not fileobj:
+                    fp.close()
+        elif fileobj:
+            self._submit(ZipMember(info, content=fileobj.read()))
         else:
-            if dest:
-                self.zipfile.write(src, self.prepend(dest))
-            else:
-                self.zipfile.write(src, self.prepend(src))
+            self._submit(ZipMember(info, src=src, size=stats.st_size))
 
     def add_string(self, content, dest):
         info = zipfile.ZipInfo(self.prepend(dest),
-                date_time=time.localtime(time.time()))
+                date_time=time.localtime(time.time())[:6])
         info.compress_type = self.compression
         info.external_attr = 0400 << 16L
-        self.zipfile.writestr(info, content)
+        self._submit(ZipMember(info, content=content))
 
     def open_file(self, name):
+        self._drain(block=True)
         try:
             self.zipfile.close()
             self.zipfile = zipfile.ZipFile(self.name(), mode="r")
@@ -345,12 +1305,374 @@ class ZipFileArchive(Archive):
             return file_obj
         finally:
             self.zipfile.close()
-            self.zipfile = zipfile.ZipFile(self.name(), mode="a")
+            self.zipfile = self._open("a")
 
     def close(self):
+        self._stop()
         self.zipfile.close()
 
 
+class DirectoryArchive(Archive):
+    """Collects into a plain directory, for the fastest local collection.
+    Nothing is packed or compressed and every file can be looked at as soon
+    as it has been added. A resumed collection overwrites what it collects
+    again."""
+
+    supports_reopen = True
+    supports_links = True
+
+    def __init__(self, name):
+        self._name = name
+        os.makedirs(self._name, 0700)
+
+    @classmethod
+    def reopen(class_, name, offset):
+        if not os.path.isdir(name):
+            raise OSError(errno.ENOENT, "no such directory", name)
+        archive = class_.__new__(class_)
+        archive._name = name
+        return archive
+
+    def name(self):
+        return self._name
+
+    def checkpoint(self):
+        # every member is complete once added, nothing is ever truncated
+        return 0
+
+    def _path(self, dest):
+        path = os.path.join(os.path.dirname(self._name), self.prepend(dest))
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if os.path.islink(path):
+            os.unlink(path)
+        return path
+
+    def add_file(self, src, dest=None, fileobj=None):
+        if not dest:
+            dest = src
+
+        if os.path.isdir(src):
+            for path, dirnames, filenames in os.walk(src):
+                for filename in filenames:
+                    filename = os.path.join(path, filename)
+                    member = os.path.join(dest, filename[len(src):].lstrip(os.sep))
+                    if os.path.islink(filename):
+                        self.add_link(os.readlink(filename), member)
+                    else:
+                        self.add_file(filename, member)
+            return
+
+        path = self._path(dest)
+        source = fileobj or open(src, "rb")
+        try:
+            fp = self._limited(open(path, "wb"))
+            try:
+                shutil.copyfileobj(source, fp, OUTPUT_CHUNK_SIZE)
+            finally:
+                fp.close()
+        finally:
+            if not fileobj:
+                source.close()
+        stats = os.stat(src)
+        os.utime(path, (stats.st_atime, stats.st_mtime))
+
+    def add_string(self, content, dest):
+        fp = self._limited(open(self._path(dest), "wb"))
+        try:
+            fp.write(content)
+        finally:
+            fp.close()
+
+    def add_link(self, dest, link_name):
+        path = self._path(link_name)
+        if os.path.exists(path):
+            os.unlink(path)
+        os.symlink(dest, path)
+
+    def open_file(self, name):
+        return open(os.path.join(os.path.dirname(self._name),
+                                 self.prepend(name)), "rb")
+
+    def close(self):
+        pass
+
+    def compress(self, method, throttle=None):
+        return self.name()
+
+
+class NullArchive(Archive):
+    """Throws away everything added to it, to measure how fast a collection
+    runs without the cost of an archive. Nothing can be read back and no
+    report is left behind."""
+
+    supports_links = True
+
+    def __init__(self, name):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+    def add_file(self, src, dest=None, fileobj=None):
+        if fileobj:
+            while fileobj.read(OUTPUT_CHUNK_SIZE):
+                pass
+
+    def add_string(self, content, dest):
+        pass
+
+    def add_link(self, dest, link_name):
+        pass
+
+    def open_file(self, name):
+        raise IOError(errno.ENOENT, "the null archive keeps nothing", name)
+
+    def close(self):
+        pass
+
+    def compress(self, method, throttle=None):
+        return None
+
+
+# the archive backends -z can select, by name
+ARCHIVE_BACKENDS = {}
+
+def register_archive(class_, *names):
+    """Makes the archive backend class_ selectable as any of names"""
+    for name in names:
+        ARCHIVE_BACKENDS[name] = class_
+
+register_archive(TarFileArchive, "gzip", "bzip2", "xz")
+register_archive(SeekableTarFileArchive, "seekable")
+register_archive(ZipFileArchive, "zip")
+register_archive(DirectoryArchive, "dir")
+register_archive(NullArchive, "null")
+
+
+class Obfuscator(object):
+    """Replaces hostnames, IPv4 and IPv6 addresses and MAC addresses with
+    pseudonyms. The same original value is always given the same pseudonym
+    so that data collected from different files can still be correlated.
+
+    Content is scanned once with a single compiled alternation of the known
+    hostnames (as literals) and a cheap pattern for anything that looks like
+    the start of an address. Only those candidates are then checked against
+    the exact address patterns."""
+
+    IPV4 = (r"(?<![\w.])(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}"
+            r"(?:25[0-5]|2[0-4]\d|1?\d?\d)(?![\w]|\.\d)")
+    IPV6 = (r"(?<![\w:])(?:(?:[0-9a-f]{1,4}:){7}[0-9a-f]{1,4}|"
+            r"(?:[0-9a-f]{1,4}:){1,7}(?::[0-9a-f]{1,4}){1,7}|"
+            r"(?:[0-9a-f]{1,4}:){1,7}:)(?![\w:])")
+    MAC = r"(?<![\w:])(?:[0-9a-f]{2}:){5}[0-9a-f]{2}(?![\w:])"
+    # the prefix of an IPv4 address mapped into (or compatible with) IPv6
+    MAPPED = r"::(?:ffff:)?"
+    CANDIDATE = r"(?<![\w.])(?:::)?[0-9a-f]{1,4}[:.][0-9a-f:.]{2,}"
+
+    # values that carry no information about the host and are left alone
+    IGNORED = ("127.0.0.1", "0.0.0.0", "255.255.255.255", "::1",
+               "00:00:00:00:00:00", "ff:ff:ff:ff:ff:ff")
+
+    def __init__(self, hostnames=()):
+        self.names = []
+        self.mapping = {}
+        self.counters = {}
+        self._regex = None
+        self._addresses = [(kind, re.compile(pattern, re.IGNORECASE))
+                           for kind, pattern in (("mac", self.MAC),
+                                                 ("ipv6", self.IPV6),
+                                                 ("ipv4", self.IPV4))]
+        self._mapped = re.compile(self.MAPPED, re.IGNORECASE)
+        self.add_hostnames(*hostnames)
+
+    def add_hostnames(self, *hostnames):
+        """Adds hostnames to the set of literals to obfuscate. For a fully
+        qualified name the short name is added as well."""
+        for hostname in hostnames:
+            if not hostname:
+                continue
+            for name in (hostname.split(".")[0], hostname):
+                name = name.lower()
+                if name not in self.names and name not in ("localhost",):
+                    self.names.append(name)
+        self._regex = None
+
+    def _compile(self):
+        patterns = []
+        if self.names:
+            # longest first so a fully qualified name wins over its short name
+            names = sorted(self.names, key=len, reverse=True)
+            patterns.append(r"(?P<host>\b(?:%s)\b)"
+                            % "|".join(re.escape(name) for name in names))
+        patterns.append(r"(?P<addr>%s)" % self.CANDIDATE)
+        return re.compile("|".join(patterns), re.IGNORECASE)
+
+    def _pseudonym(self, kind, value):
+        count = self.counters.get(kind, 0)
+        self.counters[kind] = count + 1
+        if kind == "host":
+            return "host%d" % count
+        elif kind == "mac":
+            return "02:00:00:%02x:%02x:%02x" % ((count >> 16) & 0xff,
+                    (count >> 8) & 0xff, count & 0xff)
+        elif kind == "ipv6":
+            return "2001:db8::%x" % (count + 1)
+        else:
+            count += 1
+            return "198.%d.%d.%d" % (18 + (count >> 16 & 1),
+                    (count >> 8) & 0xff, count & 0xff)
+
+    def _lookup(self, kind, value):
+        key = value if kind == "ipv4" else value.lower()
+        if key in self.IGNORED:
+            return value
+        if key not in self.mapping:
+            self.mapping[key] = (kind, self._pseudonym(kind, key))
+        return self.mapping[key][1]
+
+    def _replace(self, match):
+        if match.lastgroup == "host":
+            return self._lookup("host", match.group(0))
+
+        # an IPv4 address mapped into IPv6 gets the pseudonym of the IPv4
+        # address so that both forms can still be correlated
+        mapped = self._mapped.match(match.string, match.start(), match.end())
+        if mapped:
+            kind, regex = self._addresses[-1]
+            address = regex.match(match.string, mapped.end(), match.end())
+            if not address:
+                return match.group(0)
+            return (mapped.group(0) + self._lookup(kind, address.group(0)) +
+                    match.string[address.end():match.end()])
+
+        # the candidate may carry trailing text such as a port number
+        for kind, regex in self._addresses:
+            address = regex.match(match.string, match.start(), match.end())
+            if address:
+                return (self._lookup(kind, address.group(0)) +
+                        match.string[address.end():match.end()])
+        return match.group(0)
+
+    def obfuscate(self, content):
+        """Returns content with every known hostname and address replaced
+        by its pseudonym."""
+        if self._regex is None:
+            self._regex = self._compile()
+        return self._regex.sub(self._replace, content)
+
+    def write_mapping(self, filename):
+        """Writes the table of original values and pseudonyms to filename,
+        which is created readable by its owner only."""
+        fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+        fp = os.fdopen(fd, "w")
+        try:
+            for original, (kind, pseudonym) in sorted(self.mapping.items(),
+                    key=lambda item: item[1]):
+                fp.write("%s\t%s\t%s\n" % (kind, pseudonym, original))
+        finally:
+            fp.close()
+
+
+class ObfuscatingArchive(object):
+    """Wraps an Archive and passes every file and string written to it
+    through an Obfuscator before it is stored. All other attributes are
+    those of the wrapped archive."""
+
+    def __init__(self, archive, obfuscator):
+        self.archive = archive
+        self.obfuscator = obfuscator
+
+    def __getattr__(self, name):
+        return getattr(self.archive, name)
+
+    def add_file(self, src, dest=None, fileobj=None):
+        if not dest:
+            dest = src
+        if os.path.isdir(src):
+            for path, dirnames, filenames in os.walk(src):
+                for filename in filenames:
+                    filename = os.path.join(path, filename)
+                    self.add_file(filename,
+                            os.path.join(dest, filename[len(src):].lstrip(os.sep)))
+        else:
+            self.add_string(read_content(src, fileobj), dest)
+
+    def add_string(self, content, dest):
+        if is_pseudo_aggregate(dest):
+            # pseudonyms differ in length from what they replace, the index
+            # of the aggregate is built again around the new contents
+            obfuscate = self.obfuscator.obfuscate
+            content = aggregate_pseudo_files([(obfuscate(path), obfuscate(data))
+                    for path, data in split_pseudo_aggregate(content)])
+        else:
+            content = self.obfuscator.obfuscate(content)
+        self.archive.add_string(content, dest)
+
+
+def takes_fileobj(archive):
+    """Returns True if the add_file() method of archive accepts fileobj"""
+    try:
+        args, varargs, keywords, defaults = inspect.getargspec(archive.add_file)
+    except TypeError:
+        return True
+    return varargs is not None or keywords is not None or "fileobj" in args
+
+
+class LegacyArchive(object):
+    """Wraps an Archive whose add_file() predates the fileobj argument. The
+    backend reads the file itself, so the content stored may differ from
+    what the caller read and hashed. All other attributes are those of the
+    wrapped archive."""
+
+    def __init__(self, archive):
+        self.archive = archive
+
+    def __getattr__(self, name):
+        return getattr(self.archive, name)
+
+    def add_file(self, src, dest=None, fileobj=None):
+        if fileobj:
+            # the caller's digest is taken from what it reads
+            while fileobj.read(CHECKSUM_CHUNK_SIZE):
+                pass
+        self.archive.add_file(src, dest)
+
+
+class SynchronizedArchive(object):
+    """Wraps an Archive so that it can be written to from several threads.
+    Writes are serialized with a lock, all other attributes are those of the
+    wrapped archive."""
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.archive, name)
+
+    def add_file(self, src, dest=None, fileobj=None):
+        with self.lock:
+            self.archive.add_file(src, dest, fileobj)
+
+    def add_string(self, content, dest):
+        with self.lock:
+            self.archive.add_string(content, dest)
+
+    def add_link(self, dest, link_name):
+        with self.lock:
+            self.archive.add_link(dest, link_name)
+
+    def checkpoint(self):
+        with self.lock:
+            return self.archive.checkpoint()
+
+    def close(self):
+        with self.lock:
+            self.archive.close()
+
+
 class DirTree(object):
     """Builds an ascii representation of a directory structure"""
 
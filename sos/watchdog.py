@@ -0,0 +1,145 @@
+"""
+Detect processes and mount points stuck in uninterruptible I/O before
+collection starts, so that plugins can stay away from a mount that would hang
+every command or copy touching it
+"""
+## watchdog.py
+## find hung mounts before they hang sosreport
+
+### This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+import os
+import threading
+import time
+
+from sos.processes import read_file, parse_stat
+
+# file systems whose server can go away and leave every access to them
+# blocked in state D
+REMOTE_FILESYSTEMS = ("nfs", "nfs4", "cifs", "smbfs", "smb3", "ceph", "afs",
+                      "9p", "glusterfs", "lustre", "gfs2", "ocfs2")
+
+
+def stuck_processes(proc="/proc", settle=0.5):
+    """Returns a (pid, command name) tuple for every process in state D. A
+    process only counts as stuck if it is still in state D settle seconds
+    after it was first seen, which filters out ordinary disk waits."""
+    def blocked(pids):
+        found = []
+        for pid in pids:
+            content = read_file(os.path.join(proc, pid, "stat"))
+            if content:
+                comm, fields = parse_stat(content)
+                if fields[0] == "D":
+                    found.append((pid, comm))
+        return found
+
+    try:
+        pids = [entry for entry in os.listdir(proc) if entry.isdigit()]
+    except OSError:
+        return []
+    candidates = blocked(pids)
+    if not candidates:
+        return []
+    time.sleep(settle)
+    return [(int(pid), comm) for pid, comm in
+            blocked([pid for pid, comm in candidates])]
+
+
+def _statvfs(path):
+    try:
+        os.statvfs(path)
+    except OSError:
+        pass
+
+
+def unresponsive_mounts(mountpoints, timeout=5):
+    """Returns the mount points in mountpoints that do not answer a statvfs
+    within timeout seconds. Every mount point is probed on its own thread;
+    the threads probing hung mounts are left behind blocked."""
+    probes = []
+    for mountpoint in mountpoints:
+        thread = threading.Thread(target=_statvfs, args=(mountpoint,))
+        thread.setDaemon(True)
+        thread.start()
+        probes.append((mountpoint, thread))
+
+    deadline = time.time() + timeout
+    hung = []
+    for mountpoint, thread in probes:
+        thread.join(max(0, deadline - time.time()))
+        if thread.isAlive():
+            hung.append(mountpoint)
+    return hung
+
+
+class Watchdog(object):
+    """Remembers the processes stuck in state D and the mounts that did not
+    respond within timeout seconds when check() was last called. A timeout
+    of 0 skips probing the mounts, processes are looked at regardless."""
+
+    # commands that stat every mount point whether they are pointed at one
+    # or not
+    mount_walkers = ("df", "findmnt", "du", "lsof", "stat")
+    walker_timeout = 30
+
+    def __init__(self, timeout=5):
+        self.timeout = timeout
+        self.checked = False
+        self.stuck = []
+        self.hung = []
+
+    def check(self, mounts):
+        """Takes the (device, mount point, type, options) tuples of the mounts
+        artifact"""
+        self.stuck = stuck_processes()
+        self.checked = True
+        if self.timeout <= 0:
+            return
+        remote = [mountpoint for device, mountpoint, fstype, options in mounts
+                  if fstype in REMOTE_FILESYSTEMS or fstype.startswith("fuse")]
+        self.hung = unresponsive_mounts(remote, self.timeout)
+
+    def guard(self, command, timeout):
+        """Returns the timeout command may be run with, or None if it must
+        not be run at all because it names a path on a hung mount"""
+        if not self.hung:
+            return timeout
+        if self.touches(command):
+            return None
+        if self.walks_mounts(command):
+            # it may still block on a hung mount, so don't wait long
+            return min(timeout, self.walker_timeout)
+        return timeout
+
+    def is_hung(self, path):
+        """Returns True if path is on or below a hung mount point"""
+        for mountpoint in self.hung:
+            if path == mountpoint or path.startswith(mountpoint.rstrip("/") + "/"):
+                return True
+        return False
+
+    def touches(self, command):
+        """Returns True if command names a path on a hung mount"""
+        for word in command.split():
+            if self.is_hung(word.strip("\"'")):
+                return True
+        return False
+
+    def walks_mounts(self, command):
+        """Returns True if command would stat every mount point, including the
+        hung ones"""
+        words = command.split()
+        return bool(words) and os.path.basename(words[0]) in self.mount_walkers
@@ -1,11 +1,18 @@
 #!/usr/bin/env python
 
 import unittest
+import hashlib
 import os
+import shutil
 import tarfile
 import zipfile
 
-from sos.utilities import TarFileArchive, ZipFileArchive
+from sos.utilities import TarFileArchive, ZipFileArchive, Obfuscator, ObfuscatingArchive
+from sos.utilities import aggregate_pseudo_files, split_pseudo_aggregate
+from sos.utilities import SeekableTarFileArchive, read_seekable_member
+from sos.utilities import DirectoryArchive, NullArchive, ARCHIVE_BACKENDS
+from sos.utilities import DigestReader, LegacyArchive, takes_fileobj
+from sos.throttle import Throttle
 
 class ZipFileArchiveTest(unittest.TestCase):
 
@@ -86,6 +93,52 @@ class ZipFileArchiveTest(unittest.TestCase):
     def test_compress(self):
         self.assertEquals(self.zf.compress("zip"), self.zf.name())
 
+    def test_members_in_order(self):
+        names = ['tests/%03d.txt' % i for i in range(100)]
+        for i, name in enumerate(names):
+            self.zf.add_string(str(i) * (i * 1000), name)
+        self.zf.close()
+
+        zf = zipfile.ZipFile('test.zip', 'r')
+        self.assertEquals(zf.namelist(), ['test/' + name for name in names])
+        self.assertEquals(zf.testzip(), None)
+        self.assertEquals(zf.read('test/tests/042.txt'), '42' * 42000)
+        zf.close()
+
+    def test_streamed_file(self):
+        self.zf.stream_size = 0
+        self.zf.add_string('before', 'before.txt')
+        self.zf.add_file('tests/archive_tests.py', 'tests/streamed')
+        self.zf.add_string('after', 'after.txt')
+        self.zf.close()
+
+        zf = zipfile.ZipFile('test.zip', 'r')
+        self.assertEquals(zf.namelist(), ['test/before.txt', 'test/tests/streamed', 'test/after.txt'])
+        self.assertEquals(zf.read('test/tests/streamed'), open('tests/archive_tests.py').read())
+        self.assertEquals(zf.testzip(), None)
+        zf.close()
+
+    def test_pending_bounded_by_bytes(self):
+        self.zf.max_pending = 1000
+        self.zf.add_string('x' * 600, 'a')
+        self.zf.add_string('x' * 600, 'b')
+        self.assertTrue(self.zf.pending_bytes <= 1000)
+        self.zf.close()
+        self.assertEquals(self.zf.pending_bytes, 0)
+
+    def test_limit_compression(self):
+        self.zf.limit_compression(Throttle(compress_cpu=50, nice=10))
+        self.assertEquals(self.zf.workers, 1)
+        self.assertEquals(self.zf.cpu_share, 0.5)
+        self.zf.add_string('x' * 1000, 'a')
+        self.zf.close()
+        zf = zipfile.ZipFile('test.zip', 'r')
+        self.assertEquals(zf.read('test/a'), 'x' * 1000)
+        zf.close()
+
+    def test_zip64(self):
+        self.assertTrue(self.zf.zipfile._allowZip64)
+
 class TarFileArchiveTest(unittest.TestCase):
 
     def setUp(self):
@@ -109,6 +162,19 @@ class TarFileArchiveTest(unittest.TestCase):
 
         self.check_for_file('test/tests/ziptest')
 
+    def test_add_file_digest(self):
+        fp = open('tests/archive_tests.py', 'rb')
+        reader = DigestReader(fp, 'md5')
+        self.tf.add_file('tests/archive_tests.py', fileobj=reader)
+        fp.close()
+        self.tf.close()
+
+        content = open('tests/archive_tests.py').read()
+        self.assertEquals(reader.hexdigest(), hashlib.md5(content).hexdigest())
+        rtf = tarfile.open('test.tar')
+        self.assertEquals(rtf.extractfile('test/tests/archive_tests.py').read(), content)
+        rtf.close()
+
     def test_add_dir(self):
         self.tf.add_file('tests/')
         self.tf.close()
@@ -156,5 +222,217 @@ class TarFileArchiveTest(unittest.TestCase):
     def test_compress(self):
         name = self.tf.compress("gzip")
 
+    def test_reopen(self):
+        self.tf.add_string('kept', 'tests/kept.txt')
+        offset = self.tf.checkpoint()
+        self.tf.add_string('dropped', 'tests/dropped.txt')
+        self.tf.close()
+
+        self.tf = TarFileArchive.reopen('test', offset)
+        self.tf.add_string('added', 'tests/added.txt')
+        self.tf.close()
+
+        rtf = tarfile.open('test.tar')
+        self.assertEquals(rtf.getnames(), ['test/tests/kept.txt', 'test/tests/added.txt'])
+        rtf.close()
+
+class SeekableTarFileArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tf = SeekableTarFileArchive('test')
+
+    def tearDown(self):
+        os.unlink(self.tf.name())
+        if os.path.exists(self.tf.index_name()):
+            os.unlink(self.tf.index_name())
+
+    def check_for_file(self, filename):
+        rtf = tarfile.open('test.tar.gz')
+        rtf.getmember(filename)
+        rtf.close()
+
+    def test_create(self):
+        self.tf.close()
+        self.assertTrue(os.path.exists('test.tar.gz'))
+        self.assertTrue(os.path.exists('test.tar.gz.idx'))
+
+    def test_add_file(self):
+        self.tf.add_file('tests/ziptest')
+        self.tf.close()
+
+        self.check_for_file('test/tests/ziptest')
+
+    def test_add_renamed_dir(self):
+        self.tf.add_file('tests/', 'tests_renamed/')
+        self.tf.close()
+
+        self.check_for_file('test/tests_renamed/ziptest')
+
+    def test_make_link(self):
+        self.tf.add_file('tests/ziptest')
+        self.tf.add_link('tests/ziptest', 'link_name')
+        self.tf.close()
+
+        self.check_for_file('test/link_name')
+
+    def test_get_file(self):
+        self.tf.add_string('this is my content', 'tests/string_test.txt')
+
+        afp = self.tf.open_file('tests/string_test.txt')
+        self.assertEquals('this is my content', afp.read())
+
+    def test_overwrite_file(self):
+        self.tf.add_string('this is my content', 'tests/string_test.txt')
+        self.tf.add_string('this is my new content', 'tests/string_test.txt')
+
+        afp = self.tf.open_file('tests/string_test.txt')
+        self.assertEquals('this is my new content', afp.read())
+
+    def test_read_with_sidecar_index(self):
+        self.tf.add_string('a' * 1000, 'tests/a.txt')
+        self.tf.add_string('this is my content', 'tests/string_test.txt')
+        self.tf.compress('seekable')
+        self.assertEquals('this is my content',
+                read_seekable_member('test.tar.gz', 'test/tests/string_test.txt'))
+
+    def test_readable_by_tarfile(self):
+        self.tf.add_string('this is my content', 'tests/string_test.txt')
+        self.tf.close()
+        rtf = tarfile.open('test.tar.gz')
+        self.assertEquals('this is my content',
+                rtf.extractfile('test/tests/string_test.txt').read())
+        rtf.close()
+
+
+class ObfuscatingArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tf = ObfuscatingArchive(TarFileArchive('test'),
+                                     Obfuscator(['secret-host']))
+
+    def tearDown(self):
+        os.unlink(self.tf.name())
+
+    def test_add_string(self):
+        self.tf.add_string('secret-host 10.0.0.1', 'tests/string_test.txt')
+        afp = self.tf.open_file('tests/string_test.txt')
+        content = afp.read()
+        self.assertFalse('secret-host' in content)
+        self.assertFalse('10.0.0.1' in content)
+
+    def test_pseudo_aggregate(self):
+        files = [("/proc/sys/kernel/hostname", "secret-host\n"),
+                 ("/proc/net/addr", "10.0.0.1\n"),
+                 ("/proc/sys/kernel/ostype", "Linux\n")]
+        self.tf.add_string(aggregate_pseudo_files(files), 'sos_pseudo/test/proc')
+        files = split_pseudo_aggregate(self.tf.open_file('sos_pseudo/test/proc').read())
+        self.assertEquals([path for path, data in files],
+                          ["/proc/sys/kernel/hostname", "/proc/net/addr",
+                           "/proc/sys/kernel/ostype"])
+        self.assertEquals(files[0][1], "host0\n")
+        self.assertTrue(files[1][1].startswith("198.18."))
+        self.assertEquals(files[2][1], "Linux\n")
+
+    def test_add_dir(self):
+        self.tf.add_file('tests/', 'tests_renamed/')
+        self.tf.close()
+
+        rtf = tarfile.open('test.tar')
+        rtf.getmember('test/tests_renamed/ziptest')
+        rtf.close()
+
+class DirectoryArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.da = DirectoryArchive('test')
+
+    def tearDown(self):
+        shutil.rmtree('test')
+
+    def test_add_file(self):
+        self.da.add_file('tests/ziptest')
+        self.assertTrue(os.path.isfile('test/tests/ziptest'))
+
+    def test_add_renamed_dir(self):
+        self.da.add_file('tests/', 'tests_renamed/')
+        self.assertTrue(os.path.isfile('test/tests_renamed/ziptest'))
+
+    def test_overwrite_file(self):
+        self.da.add_string('this is my content', 'tests/string_test.txt')
+        self.da.add_string('this is my new content', 'tests/string_test.txt')
+
+        afp = self.da.open_file('tests/string_test.txt')
+        self.assertEquals('this is my new content', afp.read())
+        afp.close()
+
+    def test_make_link(self):
+        self.da.add_string('content', 'sos_commands/ps')
+        self.da.add_link('sos_commands/ps', 'ps')
+        self.da.add_link('sos_commands/ps', 'ps')
+        self.assertEquals(os.readlink('test/ps'), 'sos_commands/ps')
+        self.assertEquals(open('test/ps').read(), 'content')
+
+    def test_reopen(self):
+        self.da.add_string('kept', 'tests/kept.txt')
+        self.da = DirectoryArchive.reopen('test', self.da.checkpoint())
+        self.da.add_string('added', 'tests/added.txt')
+        self.assertEquals(sorted(os.listdir('test/tests')), ['added.txt', 'kept.txt'])
+        self.assertRaises(OSError, DirectoryArchive.reopen, 'missing', 0)
+
+    def test_compress(self):
+        self.assertEquals(self.da.compress('auto'), 'test')
+
+class NullArchiveTest(unittest.TestCase):
+
+    def test_discards(self):
+        na = NullArchive('test')
+        na.add_file('tests/ziptest')
+        na.add_string('content', 'tests/string_test.txt')
+        na.add_link('tests/ziptest', 'link_name')
+        self.assertRaises(IOError, na.open_file, 'tests/string_test.txt')
+        self.assertEquals(na.compress('auto'), None)
+        self.assertFalse(os.path.exists('test'))
+
+class BackendRegistryTest(unittest.TestCase):
+
+    def test_backends(self):
+        self.assertEquals(sorted(ARCHIVE_BACKENDS),
+                          ['bzip2', 'dir', 'gzip', 'null', 'seekable', 'xz', 'zip'])
+        self.assertTrue(ARCHIVE_BACKENDS['xz'] is TarFileArchive)
+
+    def test_capabilities(self):
+        self.assertTrue(TarFileArchive.supports_reopen)
+        self.assertFalse(ZipFileArchive.supports_links)
+        self.assertTrue(ZipFileArchive.compresses_inline)
+        self.assertTrue(SeekableTarFileArchive.compresses_inline)
+
+
+class OldArchive(NullArchive):
+
+    def __init__(self):
+        self.added = []
+
+    def add_file(self, src, dest=None):
+        self.added.append((src, dest))
+
+
+class LegacyArchiveTest(unittest.TestCase):
+
+    def test_takes_fileobj(self):
+        self.assertTrue(takes_fileobj(NullArchive('test')))
+        self.assertFalse(takes_fileobj(OldArchive()))
+
+    def test_add_file(self):
+        archive = OldArchive()
+        fp = DigestReader(open('tests/ziptest', 'rb'), 'md5')
+        try:
+            LegacyArchive(archive).add_file('tests/ziptest', 'dest', fp)
+        finally:
+            fp.close()
+        self.assertEquals(archive.added, [('tests/ziptest', 'dest')])
+        # the file was still read through for the digest
+        self.assertEquals(fp.hexdigest(),
+                          hashlib.md5(open('tests/ziptest', 'rb').read()).hexdigest())
+
 if __name__ == "__main__":
     unittest.main()
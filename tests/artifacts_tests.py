@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from sos.artifacts import ArtifactBus, Artifact, ArtifactException
+from sos.artifacts import parse_lsmod, parse_mounts, parse_partitions
+from sos.artifacts import block_holders, dm_slaves
+from sos.artifacts import plugin_dependencies
+
+
+class ParserTest(unittest.TestCase):
+
+    def test_lsmod(self):
+        content = "\n".join(["Module                  Size  Used by",
+                             "iptable_filter         12810  1",
+                             "ip_tables              27240  1 iptable_filter"])
+        self.assertEquals(parse_lsmod(content), ["iptable_filter", "ip_tables"])
+
+    def test_mounts(self):
+        content = "/dev/sda1 / ext4 rw,relatime 0 0\nproc /proc proc rw 0 0\n"
+        self.assertEquals(parse_mounts(content),
+                [("/dev/sda1", "/", "ext4", "rw,relatime"),
+                 ("proc", "/proc", "proc", "rw")])
+
+    def test_partitions(self):
+        content = "\n".join(["major minor  #blocks  name", "",
+                             "   8        0  488386584 sda",
+                             "   8        1     512000 sda1"])
+        self.assertEquals(parse_partitions(content), ["/dev/sda", "/dev/sda1"])
+
+
+class BlockHoldersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sysfs = tempfile.mkdtemp()
+        for path in ["sda/holders", "sda/sda1/holders/md0", "sdb/holders/dm-0",
+                     "sdc/holders/dm-0", "dm-0/holders", "md0/holders"]:
+            os.makedirs(os.path.join(self.sysfs, path))
+
+    def tearDown(self):
+        shutil.rmtree(self.sysfs)
+
+    def test_holders(self):
+        holders = block_holders(self.sysfs)
+        self.assertEquals(holders["sda"], [])
+        self.assertEquals(holders["sda1"], ["md0"])
+        self.assertEquals(holders["sdb"], ["dm-0"])
+        self.assertEquals(holders["dm-0"], [])
+
+    def test_dm_slaves(self):
+        self.assertEquals(dm_slaves(block_holders(self.sysfs)), set(["sdb", "sdc"]))
+
+    def test_missing_sysfs(self):
+        self.assertEquals(block_holders(os.path.join(self.sysfs, "none")), {})
+
+
+class ArtifactBusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.produced = []
+        def parse(content):
+            self.produced.append(content)
+            return content.upper()
+        self.bus = ArtifactBus({"word": Artifact("word", command="echo word",
+                                                 parse=parse)})
+
+    def test_produced_once(self):
+        self.assertEquals("WORD", self.bus.get("word"))
+        self.assertEquals("WORD", self.bus.get("word"))
+        self.assertEquals(["word"], self.produced)
+
+    def test_published_value_wins(self):
+        self.bus.publish("word", "other")
+        self.assertEquals("OTHER", self.bus.get("word"))
+        self.assertTrue("word" in self.bus)
+
+    def test_unknown(self):
+        self.assertRaises(ArtifactException, self.bus.get, "missing")
+
+    def test_watched_function(self):
+        watchdog = object()
+        bus = ArtifactBus({"seen": Artifact("seen", function=lambda w: w is watchdog,
+                                            watched=True)}, watchdog=watchdog)
+        self.assertTrue(bus.get("seen"))
+
+
+class MockPlugin(object):
+
+    def __init__(self, provides=(), consumes=()):
+        self.provides = provides
+        self.consumes = consumes
+
+
+class DependencyTest(unittest.TestCase):
+
+    def test_dependencies(self):
+        plugins = [("networking", MockPlugin(("ip_addr",), ("lsmod",))),
+                   ("kernel", MockPlugin(("lsmod",))),
+                   ("cluster", MockPlugin(consumes=("mounts",))),
+                   ("self", MockPlugin(("lsmod",), ("lsmod",)))]
+        depends = plugin_dependencies(plugins)
+        self.assertEquals(depends["networking"], set(["kernel", "self"]))
+        self.assertEquals(depends["kernel"], set())
+        self.assertEquals(depends["cluster"], set())
+        self.assertEquals(depends["self"], set(["kernel"]))
+
+if __name__ == "__main__":
+    unittest.main()
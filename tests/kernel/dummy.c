@@ -0,0 +1,4 @@
+/* source of the dummy.ko fixtures: gcc -c dummy.c -o dummy.ko, gcc -m32 -c dummy.c -o dummy32.ko */
+static const char modinfo[] __attribute__((section(".modinfo"), used)) =
+    "license=GPL\0srcversion=0123456789ABCDEF0123456\0vermagic=3.10.0 SMP mod_unload \0alias=dummy\0alias=other";
+int dummy_init(void) { return 0; }
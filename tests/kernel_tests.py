@@ -0,0 +1,107 @@
+import os
+import unittest
+from StringIO import StringIO
+
+from sos.plugins.kernel import kernel, module_key, read_proc_modules, module_paths
+from sos.plugins.kernel import elf_section, read_modinfo
+
+PATH = os.path.join(os.path.dirname(__file__), "kernel")
+
+def j(filename):
+    return os.path.join(PATH, filename)
+
+
+class ElfTests(unittest.TestCase):
+
+    def test_elf_section_64(self):
+        fp = open(j("dummy.ko"), "rb")
+        try:
+            section = elf_section(fp, ".modinfo")
+        finally:
+            fp.close()
+        self.assertTrue(section.startswith("license=GPL\0"))
+
+    def test_elf_section_32(self):
+        fp = open(j("dummy32.ko"), "rb")
+        try:
+            self.assertTrue("srcversion=" in elf_section(fp, ".modinfo"))
+        finally:
+            fp.close()
+
+    def test_missing_section(self):
+        fp = open(j("dummy.ko"), "rb")
+        try:
+            self.assertEquals(elf_section(fp, ".gnu.linkonce.this_module"), None)
+        finally:
+            fp.close()
+
+    def test_not_elf(self):
+        self.assertEquals(elf_section(StringIO("#!/bin/sh\n"), ".modinfo"), None)
+
+
+class ModinfoTests(unittest.TestCase):
+
+    def test_read_modinfo(self):
+        info = read_modinfo(j("dummy.ko"))
+        self.assertEquals(info["srcversion"], "0123456789ABCDEF0123456")
+        self.assertEquals(info["vermagic"], "3.10.0 SMP mod_unload ")
+        # the first of repeated keys is kept
+        self.assertEquals(info["alias"], "dummy")
+
+    def test_read_modinfo_gz(self):
+        self.assertEquals(read_modinfo(j("dummy.ko.gz")), read_modinfo(j("dummy.ko")))
+
+    def test_unsupported_compression(self):
+        self.assertEquals(read_modinfo(j("dummy.ko.xz")), {})
+
+    def test_missing_file(self):
+        self.assertEquals(read_modinfo(j("missing.ko")), {})
+
+
+class ProcModulesTests(unittest.TestCase):
+
+    def test_read_proc_modules(self):
+        modules = read_proc_modules(j("proc_modules"))
+        self.assertEquals([module['name'] for module in modules], ["dummy", "nf_tables"])
+        self.assertEquals(modules[0]['taint'], "OE")
+        self.assertEquals(modules[0]['state'], "Live")
+        self.assertEquals(modules[1]['refcnt'], "2")
+        self.assertEquals(modules[1]['taint'], "")
+
+    def test_missing(self):
+        self.assertEquals(read_proc_modules(j("missing")), [])
+
+    def test_module_paths(self):
+        self.assertEquals(module_paths("kernel", root=os.path.dirname(PATH)),
+                {"dummy": j("kernel/drivers/dummy.ko"),
+                 "nf_tables": j("kernel/net/nf-tables.ko.xz")})
+        self.assertEquals(module_paths("missing", root=PATH), {})
+
+    def test_module_key(self):
+        self.assertEquals(module_key("/lib/modules/x/nf-tables.ko.xz"), "nf_tables")
+        self.assertEquals(module_key("dummy.ko"), "dummy")
+
+
+class DiagnoseTests(unittest.TestCase):
+
+    def setUp(self):
+        self.plugin = kernel({})
+
+    def inventory(self, srcversion):
+        self.plugin.inventory = [{'name': 'dummy', 'loaded_srcversion': 'ABC',
+                                  'srcversion': srcversion}]
+        self.plugin.diagnose()
+        return self.plugin.diagnose_msgs
+
+    def test_differs(self):
+        self.assertEquals(len(self.inventory("DEF")), 1)
+
+    def test_same(self):
+        self.assertEquals(self.inventory("ABC"), [])
+
+    def test_unknown_file_srcversion(self):
+        self.assertEquals(self.inventory(None), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from sos.plugins.networking import networking
+
+IP_ADDR = """1: lo    inet 127.0.0.1/8 scope host lo
+2: eth1: <BROADCAST,MULTICAST,UP> mtu 1500 qdisc pfifo_fast state UP qlen 1000\\    link/ether 52:54:00:12:34:56 brd ff:ff:ff:ff:ff:ff
+3: eth0: <BROADCAST,MULTICAST,UP> mtu 1500 qdisc pfifo_fast state UP qlen 1000\\    link/ether 52:54:00:12:34:57 brd ff:ff:ff:ff:ff:ff
+"""
+
+
+class InterfaceTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.plugin = networking({})
+        self.plugin.net_class = os.path.join(self.tmp_dir, "net")
+        # two physical ethernet interfaces, a bridge and the loopback
+        for name, type_, device in (("eth0", "1", True), ("eth1", "1", True),
+                                    ("br0", "1", False), ("lo", "772", False)):
+            path = os.path.join(self.plugin.net_class, name)
+            os.makedirs(path)
+            open(os.path.join(path, "type"), "w").write(type_ + "\n")
+            if device:
+                os.mkdir(os.path.join(path, "device"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_ethernet_interfaces_from_sysfs(self):
+        self.assertEquals(self.plugin.get_ethernet_interfaces(""),
+                          ["br0", "eth0", "eth1"])
+
+    def test_ethernet_interfaces_without_sysfs(self):
+        self.plugin.net_class = os.path.join(self.tmp_dir, "missing")
+        self.assertEquals(self.plugin.get_ethernet_interfaces(IP_ADDR),
+                          ["eth0", "eth1"])
+
+    def test_filter_nothing(self):
+        self.assertEquals(self.plugin.filter_interfaces(["br0", "eth0", "eth1"]),
+                          ["br0", "eth0", "eth1"])
+
+    def test_filter_physical(self):
+        self.plugin.setOption("physical", True)
+        self.assertEquals(self.plugin.filter_interfaces(["br0", "eth0", "eth1"]),
+                          ["eth0", "eth1"])
+
+    def test_filter_pattern(self):
+        self.plugin.setOption("interfaces", "eth[1-9]")
+        self.assertEquals(self.plugin.filter_interfaces(["br0", "eth0", "eth1"]),
+                          ["eth1"])
+
+    def test_ethtool_commands(self):
+        self.plugin.collectEthtool(["eth0", "eth1"])
+        self.assertEquals([progs[1] for progs in self.plugin.collectProgs],
+                          ["ethtool_eth0", "ethtool_eth1"])
+        command = self.plugin.collectProgs[0][0]
+        self.assertTrue(command.startswith("echo '### /sbin/ethtool eth0'; "
+                                           "/sbin/ethtool eth0 2>&1; "
+                                           "echo '### /sbin/ethtool -i eth0'; "))
+        self.assertEquals(command.count("### "), len(self.plugin.ethtoolOptions))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+import tarfile
+import tempfile
+import shutil
+import time
+
+from StringIO import StringIO
+
+from sos.orchestrator import Orchestrator, LocalTransport, ARCHIVE_RE
+
+
+class FakeTransport(LocalTransport):
+    """Pretends sosreport ran on the target and produced a small report"""
+
+    def run(self, command, timeout):
+        if self.target == "broken":
+            return (1, "", 0)
+        if self.target == "slow":
+            time.sleep(timeout + 1)
+        tmp_dir = tempfile.mkdtemp()
+        name = os.path.join(tmp_dir, "sosreport-%s-1.tar.gz" % self.target)
+        top = "sosreport-%s-1" % self.target
+        tf = tarfile.open(name, "w:gz")
+        tf.add("tests/ziptest", top + "/sos_commands/ziptest")
+        empty = tarfile.TarInfo(top + "/sos_commands/empty")
+        empty.type = tarfile.DIRTYPE
+        tf.addfile(empty)
+        secret = tarfile.TarInfo(top + "/etc/shadow")
+        secret.size, secret.mode, secret.mtime, secret.uid = 6, 0600, 1000, 42
+        tf.addfile(secret, StringIO("secret"))
+        link = tarfile.TarInfo(top + "/etc/shadow-")
+        link.type, link.linkname = tarfile.LNKTYPE, top + "/etc/shadow"
+        tf.addfile(link)
+        tf.close()
+        return (0, "Your sosreport has been generated and saved in:\n  %s\n" % name, 0)
+
+    def remove(self, path):
+        shutil.rmtree(os.path.dirname(path))
+
+
+class OrchestratorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.orchestrator = Orchestrator(["node1", "node2", "broken"],
+                FakeTransport, tmp_dir=self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_archive_re(self):
+        match = ARCHIVE_RE.search("saved in:\n  /tmp/sosreport-foo-2012.tar.xz\n\nThe")
+        self.assertEquals(match.group(1), "/tmp/sosreport-foo-2012.tar.xz")
+
+    def test_collect_keeps_order(self):
+        results = self.orchestrator.collect()
+        self.assertEquals([r.target for r in results], ["node1", "node2", "broken"])
+        self.assertTrue(results[0].ok())
+        self.assertFalse(results[2].ok())
+
+    def test_merge(self):
+        results = self.orchestrator.collect()
+        name = self.orchestrator.merge(results, "merged", "gzip")
+        tf = tarfile.open(name)
+        tf.getmember("merged/node1/sos_commands/ziptest")
+        tf.getmember("merged/node2/sos_commands/ziptest")
+        manifest = tf.extractfile("merged/manifest.txt").read()
+        tf.close()
+        self.assertTrue("node1\tok" in manifest)
+        self.assertTrue("broken\tfailed" in manifest)
+
+    def test_merge_keeps_metadata(self):
+        results = self.orchestrator.collect()
+        tf = tarfile.open(self.orchestrator.merge(results, "merged", "gzip"))
+        secret = tf.getmember("merged/node1/etc/shadow")
+        self.assertEquals((secret.mode, secret.mtime, secret.uid), (0600, 1000, 42))
+        self.assertTrue(tf.getmember("merged/node1/sos_commands/empty").isdir())
+        link = tf.getmember("merged/node1/etc/shadow-")
+        self.assertTrue(link.islnk())
+        self.assertEquals(link.linkname, "merged/node1/etc/shadow")
+        self.assertEquals(tf.extractfile(link).read(), "secret")
+        tf.close()
+
+    def test_timeout(self):
+        orchestrator = Orchestrator(["slow"], FakeTransport,
+                tmp_dir=self.tmp_dir, timeout=1)
+        result = orchestrator.collect()[0]
+        self.assertFalse(result.ok())
+        self.assertTrue("did not finish" in result.error)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,13 @@
 import unittest
+import hashlib
 import os
 import tempfile
 from StringIO import StringIO
 
 from sos.plugins import Plugin, regex_findall, sosRelPath, mangle_command
-from sos.utilities import Archive
+from sos.utilities import Archive, split_pseudo_aggregate, get_hash_name
+from sos.artifacts import ArtifactBus, Artifact
+from sos.watchdog import Watchdog
 
 PATH = os.path.dirname(__file__)
 
@@ -20,23 +23,28 @@ def create_file(size):
 
 class MockArchive(Archive):
 
+    supports_links = True
+
     def __init__(self):
         self.m = {}
         self.strings = {}
+        self.links = {}
 
     def name(self):
         return "mock.archive"
 
-    def add_file(self, src, dest=None):
+    def add_file(self, src, dest=None, fileobj=None):
         if not dest:
             dest = src
+        if fileobj:
+            fileobj.read()
         self.m[src] = dest
 
     def add_string(self, content, dest):
         self.m[dest] = content
 
     def add_link(self, dest, link_name):
-        pass
+        self.links[link_name] = dest
 
     def open_file(self, name):
         return open(self.m.get(name), 'r')
@@ -86,6 +94,13 @@ class EnablerPlugin(Plugin):
 class MockOptions(object):
 
     profiler = False
+    output_limit = 0
+
+
+class MockManifest(object):
+
+    def add_command(self, **kwargs):
+        pass
 
 
 
@@ -164,6 +179,20 @@ class PluginTests(unittest.TestCase):
         p.setOption("opt", "testing")
         self.assertEquals(p.getOption("opt"), "testing")
 
+    def test_add_string_root_symlink(self):
+        self.mp.addStringAsFile("content", "ps", root_symlink="ps")
+        self.mp.collectFiles()
+        path = os.path.join("sos_strings", "mockplugin", "ps")
+        self.assertEquals(self.mp.archive.m[path], "content")
+        self.assertEquals(self.mp.archive.links, {"ps": path})
+
+    def test_add_string_root_symlink_without_links(self):
+        self.mp.archive.supports_links = False
+        self.mp.addStringAsFile("content", "ps", root_symlink="ps")
+        self.mp.collectFiles()
+        self.assertEquals(self.mp.archive.m["ps"], "content")
+        self.assertEquals(self.mp.archive.links, {})
+
     def test_set_nonexistant_plugin_option(self):
         p = MockPlugin({})
         self.assertFalse(p.setOption("badopt", "testing"))
@@ -213,6 +242,27 @@ class PluginTests(unittest.TestCase):
         self.mp.doCopyFileOrDir("tests", sub=("tests/", "foobar/"))
         self.assertEquals(self.mp.archive.m["tests/plugin_tests.py"], 'foobar/plugin_tests.py')
 
+    def test_copy_keeps_stat(self):
+        self.mp.doCopyFileOrDir("tests/tail_test.txt")
+        copied = self.mp.copiedFiles[0]
+        self.assertEquals(copied['stat'].st_size, os.stat("tests/tail_test.txt").st_size)
+
+    def test_copy_keeps_digest(self):
+        self.mp.doCopyFileOrDir("tests/tail_test.txt")
+        copied = self.mp.copiedFiles[0]
+        content = open("tests/tail_test.txt", "rb").read()
+        self.assertEquals(copied['digest'],
+                hashlib.new(get_hash_name(), content).hexdigest())
+
+    def test_copy_dangling_symlink(self):
+        tmp_dir = tempfile.mkdtemp()
+        link = os.path.join(tmp_dir, "dangling")
+        os.symlink(os.path.join(tmp_dir, "not_here"), link)
+        self.mp.doCopyFileOrDir(link)
+        self.assertEquals(self.mp.archive.m, {})
+        os.unlink(link)
+        os.rmdir(tmp_dir)
+
     def test_copy_dir_bad_path(self):
         self.mp.doCopyFileOrDir("not_here_tests")
         self.assertEquals(self.mp.archive.m, {})
@@ -315,5 +365,168 @@ class RegexSubTests(unittest.TestCase):
         self.assertEquals(1, replacements)
         self.assertTrue("foobar" in self.mp.archive.m.get(j('tail_test.txt')))
 
+
+class ReportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.mp = MockPlugin({
+            'cmdlineopts': MockOptions(),
+            'rptdir': 'sos_reports',
+            'cmddir': 'sos_commands',
+        })
+        self.mp.archive = MockArchive()
+        self.mp.report_page_size = 2
+        for i in range(5):
+            self.mp.copiedFiles.append({'srcpath': '/src/%d' % i,
+                                        'dstpath': '/dst/%d' % i,
+                                        'symlink': 'no'})
+
+    def test_report_is_joined_fragments(self):
+        self.mp.executedCommands.append({'exe': 'ls', 'file': None})
+        html = self.mp.report()
+        self.assertTrue('<h2> Plugin <em>mockplugin</em></h2>' in html)
+        self.assertTrue('<li>ls</li>' in html)
+
+    def test_long_lists_are_paginated(self):
+        html = self.mp.report()
+        self.assertEquals(2, html.count('<li>'))
+        self.assertTrue('mockplugin_files_3.html' in html)
+        page = self.mp.archive.m['sos_reports/mockplugin_files_2.html']
+        self.assertTrue('/src/2' in page and '/src/3' in page)
+        page = self.mp.archive.m['sos_reports/mockplugin_files_3.html']
+        self.assertTrue('/src/4' in page)
+
+
+class ScrubRuleTests(unittest.TestCase):
+
+    def setUp(self):
+        self.mp = MockPlugin({
+            'cmdlineopts': MockOptions()
+        })
+        self.mp.archive = MockArchive()
+
+    def test_scrubbed_before_archive(self):
+        self.mp.addCopySpec(j("tail_test.txt"))
+        self.mp.addScrubRule(j("tail*"), r"(tail)", "foobar")
+        self.mp.addScrubRule(j("tail*"), r"line", "row")
+        self.mp.copyStuff()
+        content = self.mp.archive.m.get(j('tail_test.txt'))
+        self.assertTrue("foobar" in content)
+        self.assertFalse("line" in content)
+        self.assertEquals(1, self.mp.scrubRules[0].count)
+        self.assertTrue(self.mp.scrubRules[1].count > 1)
+        # the digest is that of the scrubbed content stored
+        self.assertEquals(self.mp.copiedFiles[0]['digest'],
+                hashlib.new(get_hash_name(), content).hexdigest())
+
+    def test_rule_not_matching_path(self):
+        self.mp.addCopySpec(j("tail_test.txt"))
+        self.mp.addScrubRule("/etc/*", r"(tail)", "foobar")
+        self.mp.copyStuff()
+        self.assertEquals(j('tail_test.txt'),
+                self.mp.archive.m.get(j('tail_test.txt')))
+        self.assertEquals(0, self.mp.scrubRules[0].count)
+
+
+class ArtifactTests(unittest.TestCase):
+
+    def setUp(self):
+        self.mp = MockPlugin({
+            'cmdlineopts': MockOptions(),
+            'cmddir': 'sos_commands',
+            'manifest': MockManifest(),
+            'artifacts': ArtifactBus({
+                'lines': Artifact('lines', path=j('tail_test.txt'),
+                                  parse=lambda content: content.splitlines()),
+                'hello': Artifact('hello', command='echo hello'),
+            }),
+        })
+        self.mp.archive = MockArchive()
+
+    def test_provide_file_artifact(self):
+        lines = self.mp.provideArtifact('lines')
+        self.assertTrue(len(lines) > 1)
+        self.assertEquals(self.mp.copyPaths, [(j('tail_test.txt'), None)])
+        self.assertEquals(lines, self.mp.getArtifact('lines'))
+
+    def test_provide_command_artifact(self):
+        self.assertEquals('hello', self.mp.provideArtifact('hello'))
+        self.assertEquals('hello',
+                self.mp.archive.m['sos_commands/mockplugin/echo_hello'])
+
+    def test_consume_without_provider(self):
+        self.assertEquals('hello', self.mp.getArtifact('hello'))
+        self.assertEquals({}, self.mp.archive.m)
+
+
+class PseudoCopySpecTests(unittest.TestCase):
+
+    def setUp(self):
+        self.mp = MockPlugin({
+            'cmdlineopts': MockOptions()
+        })
+        self.mp.archive = MockArchive()
+
+    def test_files(self):
+        self.mp.addPseudoCopySpec("/proc/self/stat*")
+        self.mp.copyStuff()
+        content = self.mp.archive.m['/proc/self/status']
+        self.assertTrue("Pid:" in content)
+        copied = [f for f in self.mp.copiedFiles if f['srcpath'] == '/proc/self/status']
+        self.assertEquals(copied[0]['size'], len(content))
+
+    def test_aggregate(self):
+        self.mp.addPseudoCopySpec("/proc/self/stat*", aggregate=True)
+        self.mp.copyStuff()
+        name = 'sos_pseudo/mockplugin/proc.self.stat'
+        files = dict(split_pseudo_aggregate(self.mp.archive.m[name]))
+        self.assertTrue("Pid:" in files['/proc/self/status'])
+        self.assertEquals(self.mp.archive.m.keys(), [name])
+
+
+class CollectOutputTests(unittest.TestCase):
+
+    def setUp(self):
+        self.mp = MockPlugin({
+            'cmdlineopts': MockOptions(),
+            'cmddir': 'sos_commands',
+            'manifest': MockManifest(),
+        })
+        self.mp.archive = MockArchive()
+
+    def test_output_limit(self):
+        self.mp.collectExtOutput("yes", sizelimit=0.001)
+        self.mp.copyStuff()
+        output = self.mp.archive.m['sos_commands/mockplugin/yes']
+        self.assertTrue(output.endswith("command stopped]\n"))
+        self.assertTrue(len(output) < 2048)
+
+
+class HungMountTests(unittest.TestCase):
+
+    def setUp(self):
+        watchdog = Watchdog()
+        self.path = os.path.abspath(__file__)
+        watchdog.hung = [os.path.dirname(self.path)]
+        self.mp = MockPlugin({
+            'cmdlineopts': MockOptions(),
+            'cmddir': 'sos_commands',
+            'manifest': MockManifest(),
+            'watchdog': watchdog,
+        })
+        self.mp.archive = MockArchive()
+
+    def test_copy_spec_skipped(self):
+        self.mp.addCopySpec(self.path)
+        self.assertEquals(self.mp.copyPaths, [])
+
+    def test_command_skipped(self):
+        self.mp.collectExtOutput("cat %s" % self.path)
+        self.mp.copyStuff()
+        self.assertEquals(self.mp.archive.m, {})
+
+    def test_call_ext_prog_skipped(self):
+        self.assertEquals(self.mp.callExtProg("cat %s" % self.path), (1, "", 0))
+
 if __name__ == "__main__":
     unittest.main()
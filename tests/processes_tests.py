@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from sos.processes import Snapshot, parse_stat, tty_name
+
+STAT = "%d (%s) S %d %d %d 0 -1 4194560 0 0 0 0 10 5 0 0 20 0 %d 0 100 1000000 50"
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_parse_stat(self):
+        comm, fields = parse_stat(STAT % (7, "a (b) c", 1, 7, 7, 1))
+        self.assertEquals(comm, "a (b) c")
+        self.assertEquals(fields[:2], ["S", "1"])
+
+    def test_tty_name(self):
+        self.assertEquals(tty_name(0), "?")
+        self.assertEquals(tty_name(34816 + 3), "pts/3")
+        self.assertEquals(tty_name(1024 + 1), "tty1")
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def add_process(self, pid, comm, ppid, cmdline="", nlwp=1):
+        base = os.path.join(self.proc, str(pid))
+        os.makedirs(base)
+        open(os.path.join(base, "stat"), "w").write(STAT % (pid, comm, ppid, pid, pid, nlwp))
+        open(os.path.join(base, "status"), "w").write("Name:\t%s\nUid:\t0\t0\t0\t0\n" % comm)
+        open(os.path.join(base, "cmdline"), "w").write(cmdline)
+
+    def setUp(self):
+        self.proc = tempfile.mkdtemp()
+        open(os.path.join(self.proc, "uptime"), "w").write("1000.00 900.00\n")
+        open(os.path.join(self.proc, "meminfo"), "w").write("MemTotal:  1024 kB\n")
+        self.add_process(1, "init", 0, "/sbin/init\0")
+        self.add_process(20, "sshd", 1, "/usr/sbin/sshd\0-D\0", nlwp=3)
+        self.add_process(21, "getty", 1)
+        self.add_process(22, "getty", 1)
+        self.snapshot = Snapshot(self.proc)
+
+    def tearDown(self):
+        shutil.rmtree(self.proc)
+
+    def test_processes(self):
+        self.assertEquals([p.pid for p in self.snapshot.processes], [1, 20, 21, 22])
+
+    def test_ps_aux(self):
+        lines = self.snapshot.ps_aux().splitlines()
+        self.assertEquals(len(lines), 5)
+        self.assertTrue(lines[0].startswith("USER       PID %CPU"))
+        self.assertTrue(lines[2].endswith("/usr/sbin/sshd -D"))
+        self.assertTrue(lines[3].endswith("[getty]"))
+
+    def test_lsof_does_not_follow_links(self):
+        hung = os.path.join(self.proc, "hung")
+        base = os.path.join(self.proc, "21")
+        os.mkdir(os.path.join(base, "fd"))
+        os.mkdir(os.path.join(base, "fdinfo"))
+        os.symlink(self.proc, os.path.join(base, "cwd"))
+        for fd, target, flags in (("0", "/dev/null", "0100000"),
+                                  ("1", "socket:[4242]", "02"),
+                                  ("2", os.path.join(hung, "log"), "01")):
+            os.symlink(target, os.path.join(base, "fd", fd))
+            open(os.path.join(base, "fdinfo", fd), "w").write(
+                    "pos:\t0\nflags:\t%s\n" % flags)
+        checked = []
+        def is_hung(path):
+            checked.append(path)
+            return path.startswith(hung)
+
+        snapshot = Snapshot(self.proc, is_hung=is_hung)
+        lines = [line.split() for line in snapshot.lsof().splitlines()
+                 if line.split()[1] == "21"]
+        self.assertEquals([line[3:5] for line in lines],
+                          [["cwd", "DIR"], ["0r", "CHR"], ["1u", "sock"], ["2w", "unknown"]])
+        self.assertEquals(lines[2][-2:], ["4242", "socket:[4242]"])
+        self.assertTrue(os.path.join(hung, "log") in checked)
+
+    def test_pstree(self):
+        self.assertEquals(self.snapshot.pstree(),
+                          "init-+-2*[getty]\n"
+                          "     `-sshd---2*[{sshd}]\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
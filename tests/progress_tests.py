@@ -0,0 +1,117 @@
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from sos.progress import Progress, ProgressServer, MeteredArchive
+
+
+class MockArchive(object):
+
+    def __init__(self):
+        self.m = {}
+
+    def add_string(self, content, dest):
+        self.m[dest] = content
+
+    def add_file(self, src, dest=None, fileobj=None):
+        self.m[dest or src] = src
+
+    def name(self):
+        return "mock.archive"
+
+
+class ProgressTest(unittest.TestCase):
+
+    def setUp(self):
+        self.progress = Progress()
+        self.progress.set_phase("collecting", ["kernel", "rpm"], {"kernel": 2, "rpm": 0})
+
+    def test_states(self):
+        self.assertEquals(self.progress.status()["plugins"],
+                {"done": ["rpm"], "running": [], "queued": ["kernel"]})
+        self.progress.start("kernel")
+        self.assertEquals(self.progress.status()["plugins"]["running"], ["kernel"])
+        self.progress.finish("kernel", 1.5)
+        self.assertEquals(self.progress.status()["plugins"]["queued"], ["kernel"])
+        self.progress.track("kernel", lambda: None)
+        status = self.progress.status()
+        self.assertEquals(status["plugins"]["done"], ["kernel", "rpm"])
+        self.assertTrue(status["plugin_elapsed"]["kernel"] >= 1.5)
+
+    def test_commands(self):
+        self.progress.set_commands(2)
+        self.progress.start("kernel")
+        self.progress.finish("kernel", 0, command=True)
+        self.assertEquals(self.progress.status()["commands"], {"done": 1, "total": 2})
+
+    def test_metered_archive(self):
+        archive = MeteredArchive(MockArchive(), self.progress)
+        archive.add_string("12345", "a")
+        archive.add_file(__file__.replace(".pyc", ".py"), "b")
+        self.assertEquals(self.progress.status()["bytes"],
+                          5 + os.path.getsize(__file__.replace(".pyc", ".py")))
+        self.assertEquals(archive.name(), "mock.archive")
+
+
+class ProgressOutputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_status_file(self):
+        filename = os.path.join(self.tmp_dir, "status.json")
+        progress = Progress(filename)
+        progress.set_phase("setup", ["kernel"])
+        self.assertEquals(json.load(open(filename))["phase"], "setup")
+
+    def test_socket(self):
+        path = os.path.join(self.tmp_dir, "sos.sock")
+        progress = Progress()
+        progress.set_phase("reporting")
+        server = ProgressServer(progress, path)
+        server.start()
+        try:
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(path)
+            data = ""
+            while not data.endswith("\n"):
+                chunk = client.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+            client.close()
+        finally:
+            server.stop()
+        self.assertEquals(json.loads(data)["phase"], "reporting")
+        self.assertFalse(os.path.exists(path))
+
+    def test_socket_replaces_stale_socket(self):
+        path = os.path.join(self.tmp_dir, "sos.sock")
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        server = ProgressServer(Progress(), path)
+        server.start()
+        server.stop()
+        self.assertFalse(os.path.exists(path))
+
+    def test_socket_keeps_other_files(self):
+        path = os.path.join(self.tmp_dir, "precious")
+        open(path, "w").write("data")
+        server = ProgressServer(Progress(), path)
+        self.assertRaises(OSError, server.start)
+        self.assertEquals(open(path).read(), "data")
+
+
+if __name__ == "__main__":
+    unittest.main()
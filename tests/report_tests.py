@@ -9,7 +9,11 @@ except ImportError:
     import simplejson as json
 
 from sos.reporting import Report, Section, Command, CopiedFile, CreatedFile, Alert
-from sos.reporting import PlainTextReport
+from sos.reporting import PlainTextReport, ReportWriter
+from sos.sosreport import Manifest, RuntimeHistory, Checkpoint, CheckpointedArchive
+import tempfile
+import shutil
+from StringIO import StringIO
 
 class ReportTest(unittest.TestCase):
 
@@ -114,5 +118,256 @@ class TestPlainReport(unittest.TestCase):
         self.assertEquals("plugin\n" + self.div + "\n-  alerts:\n  ! this is an alert",
                 str(PlainTextReport(self.report)))
 
+class TestReportWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.text = StringIO()
+        self.json = StringIO()
+        self.writer = ReportWriter(self.text, self.json)
+
+    def test_empty(self):
+        self.writer.close()
+        self.assertEquals("", self.text.getvalue())
+        self.assertEquals({}, json.loads(self.json.getvalue()))
+
+    def test_matches_plain_report(self):
+        report = Report()
+        first = Section(name="first")
+        first.add(Command(name="ls", return_code=0, href="ls"))
+        second = Section(name="second")
+        second.add(Alert("this is an alert"), CopiedFile(name="/etc/hosts", href="etc/hosts"))
+        report.add(first, second)
+
+        self.writer.write_section(first)
+        self.writer.write_section(second)
+        self.writer.close()
+
+        self.assertEquals(str(PlainTextReport(report)), self.text.getvalue())
+        self.assertEquals(json.loads(str(report)), json.loads(self.json.getvalue()))
+
+    def test_plain_report_is_not_shared(self):
+        report = Report()
+        report.add(Section(name="first"))
+        str(PlainTextReport(report))
+        self.assertEquals("", str(PlainTextReport(Report())))
+
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fp = StringIO()
+        self.manifest = Manifest(lambda: self.fp)
+
+    def records(self):
+        return [json.loads(line) for line in self.fp.getvalue().splitlines()]
+
+    def test_command(self):
+        self.manifest.add_command(cmdline="ls", exitcode=0, f_stdout="ls_out",
+                                  runtime=0.5, cpu=0.25, maxrss=1024, size=10)
+        self.assertEquals(self.records(), [{"type": "command", "cmdline": "ls",
+            "exitcode": 0, "stdout": "ls_out", "runtime": 0.5, "cpu": 0.25,
+            "maxrss": 1024, "size": 10, "truncated": False}])
+
+    def test_file(self):
+        stats = os.stat(__file__)
+        self.manifest.add_file("/etc/hosts", stats, dest="etc/hosts",
+                               digest="abc", algorithm="md5")
+        record = self.records()[0]
+        self.assertEquals(record["name"], "/etc/hosts")
+        self.assertEquals(record["size"], stats.st_size)
+        self.assertEquals(record["md5"], "abc")
+
+
+class RuntimeHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, "sos", "runtimes.json")
+        self.history = RuntimeHistory(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_unknown_command(self):
+        self.assertEquals(self.history.predict("rpm", "rpm -Va"), None)
+        self.assertEquals(self.history.timeout("rpm", "rpm -Va", 3600), 3600)
+
+    def test_moving_average(self):
+        self.history.record("rpm", "rpm -Va", 100)
+        self.history.record("rpm", "rpm -Va", 200)
+        self.assertEquals(self.history.predict("rpm", "rpm -Va"), 150)
+
+    def test_adaptive_timeout(self):
+        self.history.record("kernel", "lsmod", 1)
+        self.assertEquals(self.history.timeout("kernel", "lsmod", 300), 60)
+        self.history.record("rpm", "rpm -Va", 100)
+        self.assertEquals(self.history.timeout("rpm", "rpm -Va", 3600), 500)
+        self.assertEquals(self.history.timeout("rpm", "rpm -Va", 300), 300)
+
+    def test_estimate(self):
+        for command, runtime in (("a", 5), ("b", 4), ("c", 3), ("d", 3)):
+            self.history.record("p", command, runtime)
+        jobs = [("p", "a"), ("p", "b"), ("p", "c"), ("p", "d"), ("p", "new")]
+        self.assertEquals(self.history.estimate(jobs, 1), 16)
+        self.assertEquals(self.history.estimate(jobs, 2), 8)
+
+    def test_save_and_load(self):
+        self.history.record("kernel", "lsmod", 2)
+        self.history.save()
+        history = RuntimeHistory(self.filename)
+        self.assertEquals(history.predict("kernel", "lsmod"), 2)
+
+    def test_idle_commands_dropped(self):
+        self.history.record("kernel", "lsmod", 2)
+        self.history.save()
+        for run in range(RuntimeHistory.max_idle_runs - 1):
+            history = RuntimeHistory(self.filename)
+            history.record("kernel", "uname -a", 1)
+            history.save()
+        history = RuntimeHistory(self.filename)
+        self.assertEquals(history.predict("kernel", "lsmod"), 2)
+        history.save()
+        history = RuntimeHistory(self.filename)
+        self.assertEquals(history.predict("kernel", "lsmod"), None)
+        self.assertEquals(history.predict("kernel", "uname -a"), 1)
+
+    def test_max_entries(self):
+        self.history.max_entries = 2
+        self.history.record("p", "old", 1)
+        self.history.run += 1
+        self.history.record("p", "a", 1)
+        self.history.record("p", "b", 1)
+        self.history.prune()
+        self.assertEquals(sorted(self.history.runtimes), ["p\ta", "p\tb"])
+
+    def test_old_format(self):
+        os.makedirs(os.path.dirname(self.filename))
+        json.dump({"kernel\tlsmod": {"mean": 2, "max": 2, "count": 1}},
+                  open(self.filename, "w"))
+        history = RuntimeHistory(self.filename)
+        self.assertEquals(history.predict("kernel", "lsmod"), 2)
+        self.assertEquals(history.run, 1)
+
+    def test_corrupt_file(self):
+        os.makedirs(os.path.dirname(self.filename))
+        open(self.filename, "w").write("{not json")
+        self.assertEquals(RuntimeHistory(self.filename).runtimes, {})
+
+
+class GrowingArchive(object):
+
+    def __init__(self):
+        self.size = 0
+
+    def add_string(self, content, dest):
+        self.size += len(content)
+
+    def checkpoint(self):
+        return self.size
+
+    def name(self):
+        return "growing"
+
+    def close(self):
+        pass
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.checkpoint = Checkpoint(os.path.join(self.tmp_dir, "sosreport-host-1"))
+        self.archive = CheckpointedArchive(GrowingArchive(), self.checkpoint)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, plugname, exe, size):
+        self.checkpoint.start(plugname, exe)
+        self.archive.add_string("x" * size, "member")
+        self.checkpoint.stop()
+
+    def test_no_checkpoint(self):
+        self.assertEquals(Checkpoint.latest(self.tmp_dir), None)
+
+    def test_members(self):
+        self.write("kernel", None, 512)
+        self.write("kernel", None, 512)
+        self.write("kernel", "lsmod", 1024)
+        # nothing is collecting, the write is not recorded
+        self.archive.add_string("x", "version.txt")
+        self.assertEquals(self.checkpoint.members,
+                          [[1024, "kernel", None], [2048, "kernel", "lsmod"]])
+
+    def test_latest(self):
+        self.write("kernel", None, 1024)
+        self.checkpoint.done("kernel")
+        self.write("kernel", "lsmod", 1024)
+        self.checkpoint.done("kernel", "lsmod")
+        checkpoint = Checkpoint.latest(self.tmp_dir)
+        self.assertEquals(checkpoint.archive_name, self.checkpoint.archive_name)
+        self.assertEquals(checkpoint.offset, 2048)
+        self.assertTrue(checkpoint.has_files("kernel"))
+        self.assertTrue(checkpoint.has_command("kernel", "lsmod"))
+        self.assertFalse(checkpoint.has_command("kernel", "uname -a"))
+        self.assertFalse(checkpoint.has_files("general"))
+
+    def test_cut_before_unfinished_command(self):
+        # uname wrote its output after lsmod, but never finished
+        self.write("kernel", "lsmod", 1024)
+        self.write("kernel", "uname -a", 1024)
+        self.checkpoint.done("kernel", "lsmod")
+        checkpoint = Checkpoint.latest(self.tmp_dir)
+        self.assertEquals(checkpoint.offset, 1024)
+        self.assertTrue(checkpoint.has_command("kernel", "lsmod"))
+        self.assertFalse(checkpoint.has_command("kernel", "uname -a"))
+        self.assertEquals(checkpoint.members, [[1024, "kernel", "lsmod"]])
+
+    def test_finished_command_past_the_cut_runs_again(self):
+        self.write("kernel", "lsmod", 1024)
+        self.write("kernel", "uname -a", 1024)
+        self.write("kernel", "lsmod", 1024)
+        self.checkpoint.done("kernel", "lsmod")
+        checkpoint = Checkpoint.latest(self.tmp_dir)
+        self.assertEquals(checkpoint.offset, 0)
+        self.assertFalse(checkpoint.has_command("kernel", "lsmod"))
+
+    def test_write_after_close(self):
+        # a command that finishes once the collection has been sealed
+        self.checkpoint.start("kernel", "lsmod")
+        self.archive.close()
+        self.assertRaises(IOError, self.archive.add_string, "x", "member")
+        self.checkpoint.done("kernel", "lsmod")
+        self.checkpoint.stop()
+        self.assertFalse(self.checkpoint.has_command("kernel", "lsmod"))
+        self.assertEquals(self.checkpoint.members, [])
+
+    def test_manifest_journal(self):
+        manifest = Manifest(lambda: StringIO())
+        manifest.journal = self.checkpoint.record
+        self.checkpoint.start("kernel", "lsmod")
+        manifest.add_command(cmdline="lsmod", exitcode=0)
+        self.checkpoint.done("kernel", "lsmod")
+        self.checkpoint.start("kernel", "uname -a")
+        manifest.add_command(cmdline="uname -a", exitcode=0)
+        self.checkpoint.stop()
+        checkpoint = Checkpoint.latest(self.tmp_dir)
+        self.assertEquals([record["cmdline"] for record in checkpoint.records], ["lsmod"])
+
+        resumed = Manifest(lambda: StringIO())
+        resumed.journal = checkpoint.record
+        resumed.replay(checkpoint.records)
+        self.assertEquals(json.loads(resumed.fp.getvalue())["cmdline"], "lsmod")
+        # replayed records are not journaled twice
+        self.assertEquals(len(Checkpoint.latest(self.tmp_dir).records), 1)
+
+    def test_remove(self):
+        self.checkpoint.save()
+        self.checkpoint.start("kernel")
+        self.checkpoint.record({"type": "file"})
+        self.checkpoint.remove()
+        self.assertEquals(Checkpoint.latest(self.tmp_dir), None)
+        self.assertEquals(os.listdir(self.tmp_dir), [])
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,196 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from StringIO import StringIO
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from sos.plugins.rpm import rpm, shard, shard_size, package_files, verified_path
+from sos.plugins.rpm import unchanged_since
+from sos.utilities import Archive
+
+
+class MockArchive(Archive):
+
+    supports_links = True
+
+    def __init__(self):
+        self.m = {}
+        self.links = {}
+
+    def add_string(self, content, dest):
+        self.m[dest] = content
+
+    def add_link(self, dest, link_name):
+        self.links[link_name] = dest
+
+    def open_file(self, name):
+        if name not in self.m:
+            raise IOError("no member %s" % name)
+        return StringIO(self.m[name])
+
+
+class MockManifest(object):
+
+    def add_command(self, **kwargs):
+        pass
+
+
+class MockLog(object):
+
+    def __init__(self):
+        self.messages = []
+
+    def debug(self, message):
+        self.messages.append(message)
+
+    warning = debug
+
+
+class Options(object):
+
+    output_limit = 0
+    profiler = False
+
+
+class ShardTests(unittest.TestCase):
+
+    def test_shard(self):
+        self.assertEquals(shard(range(7), 3), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEquals(shard([], 3), [])
+
+    def test_shard_size(self):
+        # several shards per worker, at most most packages each
+        self.assertEquals(shard_size(1000, 4), 50)
+        self.assertEquals(shard_size(1000, 4, most=20), 20)
+        self.assertEquals(shard_size(100, 4), 7)
+        self.assertEquals(shard_size(3, 8), 1)
+        self.assertEquals(shard_size(0, 8), 1)
+
+    def test_package_files(self):
+        owners, files = package_files("a\t/etc/a\nb\t/etc/shared\n"
+                                      "a\t/etc/shared\nno tab here\n")
+        self.assertEquals(owners, {"/etc/a": set(["a"]),
+                                   "/etc/shared": set(["a", "b"])})
+        self.assertEquals(files, {"a": ["/etc/a", "/etc/shared"],
+                                  "b": ["/etc/shared"]})
+
+    def test_verified_path(self):
+        self.assertEquals(verified_path("S.5....T.  c /etc/a.conf"), "/etc/a.conf")
+        self.assertEquals(verified_path("missing     /usr/bin/b"), "/usr/bin/b")
+        self.assertEquals(verified_path("package c is not installed"), None)
+        self.assertEquals(verified_path(""), None)
+
+
+class CacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.plugin = rpm({})
+        self.plugin.verify_cache = os.path.join(self.tmp_dir, "sos", "rpm-verify.json")
+        self.path = os.path.join(self.tmp_dir, "a.conf")
+        open(self.path, "w").write("a")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_unchanged_since(self):
+        self.assertTrue(unchanged_since([self.path], time.time() + 10))
+        self.assertFalse(unchanged_since([self.path], 0))
+        self.assertFalse(unchanged_since([self.path + ".gone"], time.time() + 10))
+
+    def test_round_trip(self):
+        self.plugin.save_cache(time.time() + 10,
+                {"a": {"version": "1.0", "lines": ["S.5 /a.conf"]}})
+        valid = self.plugin.load_cache(["a"], {"a": [self.path]}, {"a": "1.0"})
+        self.assertEquals(valid["a"]["lines"], ["S.5 /a.conf"])
+
+    def test_invalidated(self):
+        self.plugin.save_cache(0, {"a": {"version": "1.0", "lines": []}})
+        # a file of the package changed since the verify
+        self.assertEquals(self.plugin.load_cache(["a"], {"a": [self.path]},
+                                                 {"a": "1.0"}), {})
+        self.plugin.save_cache(time.time() + 10, {"a": {"version": "1.0", "lines": []}})
+        # the package was updated
+        self.assertEquals(self.plugin.load_cache(["a"], {"a": [self.path]},
+                                                 {"a": "2.0"}), {})
+
+    def test_no_cache(self):
+        self.assertEquals(self.plugin.load_cache(["a"], {}, {}), {})
+
+
+class VerifyReportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.plugin = rpm({'cmddir': 'sos_commands'})
+        self.plugin.archive = MockArchive()
+        self.plugin.verify_cache = os.path.join(self.tmp_dir, "rpm-verify.json")
+        self.plugin.verify_start = 100
+        self.plugin.names = ["a", "b", "c", "d"]
+        self.plugin.versions = {"a": "1", "b": "1", "c": "1", "d": "1"}
+        self.plugin.cached = {"c": {"version": "1", "lines": [u"missing /c"]}}
+        self.plugin.owners = {"/a": set(["a"]), "/b": set(["b"]), "/d": set(["d"])}
+        self.plugin.use_cache = False
+        self.plugin.shards = [["a", "b"], ["d"]]
+        self.plugin.shard_outputs = {0: "S.5 /a\nS.5 /b", 1: "missing /d"}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_order(self):
+        # shard outputs come back in any order, they are keyed by index
+        self.plugin.shard_outputs = {1: "missing /d", 0: "S.5 /a\nS.5 /b"}
+        self.assertEquals(self.plugin.verify_report(),
+                          "S.5 /a\nS.5 /b\nmissing /c\nmissing /d\n")
+
+    def test_resumed_shard_read_back(self):
+        del self.plugin.shard_outputs[1]
+        self.plugin.archive.m["sos_commands/rpm/rpm-Va.001"] = "missing /d"
+        self.assertTrue(self.plugin.verify_report().endswith("missing /d\n"))
+
+    def test_cache_updated(self):
+        self.plugin.use_cache = True
+        self.plugin.verify_report()
+        cache = json.load(open(self.plugin.verify_cache))
+        self.assertEquals(cache["time"], 100)
+        self.assertEquals(cache["packages"]["a"]["lines"], ["S.5 /a"])
+        self.assertEquals(cache["packages"]["c"]["lines"], ["missing /c"])
+        self.assertEquals(cache["packages"]["d"]["lines"], ["missing /d"])
+
+    def test_postproc(self):
+        self.plugin.postproc()
+        self.assertTrue("missing /c" in self.plugin.archive.m["sos_commands/rpm/rpm-Va"])
+        self.assertEquals(self.plugin.archive.links["rpm-Va"], "sos_commands/rpm/rpm-Va")
+
+    def test_collect_command(self):
+        self.plugin.cInfo.update({'manifest': MockManifest(), 'cmdlineopts': Options()})
+        self.plugin.shard_outputs = {}
+        self.plugin.shard_index = {"echo S.5 /b": 0}
+        self.plugin.collectCommand(("echo S.5 /b", "rpm-Va.000", None, 30, None))
+        self.assertEquals(self.plugin.shard_outputs, {0: "S.5 /b"})
+        self.assertEquals(self.plugin.archive.m["sos_commands/rpm/rpm-Va.000"], "S.5 /b")
+
+    def test_collect_command_all_cached(self):
+        # every package was served from the cache, no shard was queued
+        self.plugin.cInfo.update({'manifest': MockManifest(), 'cmdlineopts': Options()})
+        self.plugin.shards = []
+        self.plugin.shard_index = {}
+        self.plugin.soslog = MockLog()
+        self.plugin.collectCommand(("echo installed", "rpm-qa", None, 30, None))
+        self.assertEquals(self.plugin.archive.m["sos_commands/rpm/rpm-qa"], "installed")
+        self.assertEquals(self.plugin.soslog.messages, [])
+
+    def test_shard_runtimes_not_recorded(self):
+        self.plugin.shard_index = {"echo S.5 /b": 0}
+        self.assertFalse(self.plugin._record_runtime("echo S.5 /b"))
+        self.assertTrue(self.plugin._record_runtime("/bin/rpm -qa"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from sos.plugins.sar import sar
+from sos.utilities import Archive
+
+
+class MockArchive(Archive):
+
+    supports_links = True
+
+    def __init__(self):
+        self.m = {}
+        self.links = {}
+
+    def add_string(self, content, dest):
+        self.m[dest] = content
+
+    def add_link(self, dest, link_name):
+        self.links[link_name] = dest
+
+
+class MockManifest(object):
+
+    def __init__(self):
+        self.commands = []
+
+    def add_command(self, **kwargs):
+        self.commands.append(kwargs)
+
+
+class SarTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.plugin = sar({'cmddir': 'sos_commands',
+                           'manifest': MockManifest()})
+        self.plugin.archive = MockArchive()
+        self.plugin.path = os.path.join(self.tmp_dir, "sa")
+        self.plugin.cache_dir = os.path.join(self.tmp_dir, "cache")
+        os.mkdir(self.plugin.path)
+        for name in ("sa01", "sa02", "sar02", "sa03"):
+            open(os.path.join(self.plugin.path, name), "w").write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_sa_files(self):
+        found = self.plugin.sa_files(os.listdir(self.plugin.path))
+        self.assertEquals([(fname, sar_filename) for fname, sar_filename, st in found],
+                          [("sa01", "sar01"), ("sa03", "sar03")])
+
+    def test_sa_files_days(self):
+        old = time.time() - 3 * 86400
+        os.utime(os.path.join(self.plugin.path, "sa01"), (old, old))
+        found = self.plugin.sa_files(os.listdir(self.plugin.path), days=2)
+        self.assertEquals([fname for fname, sar_filename, st in found], ["sa03"])
+        found = self.plugin.sa_files(os.listdir(self.plugin.path), days=0)
+        self.assertEquals(len(found), 2)
+
+    def test_cache(self):
+        st = os.stat(os.path.join(self.plugin.path, "sa01"))
+        self.assertEquals(self.plugin.read_cache("sa01", st), None)
+        self.plugin.write_cache("sa01", st, "converted")
+        self.assertEquals(self.plugin.read_cache("sa01", st), "converted")
+
+    def test_cache_replaced_when_sa_file_changes(self):
+        path = os.path.join(self.plugin.path, "sa01")
+        st = os.stat(path)
+        self.plugin.write_cache("sa01", st, "converted")
+        self.plugin.write_cache("sa010", st, "other day")
+        open(path, "a").write("more")
+        changed = os.stat(path)
+        self.assertEquals(self.plugin.read_cache("sa01", changed), None)
+        self.plugin.write_cache("sa01", changed, "again")
+        self.assertEquals(sorted(os.listdir(self.plugin.cache_dir)),
+                          sorted([os.path.basename(self.plugin.cache_file("sa01", changed)),
+                                  os.path.basename(self.plugin.cache_file("sa010", st))]))
+
+    def test_add_output(self):
+        outfn = self.plugin.add_output("sa01", "sar01", "converted")
+        self.assertEquals(outfn, "sar/sar01")
+        self.assertEquals(self.plugin.archive.m["sos_commands/sar/sar01"], "converted")
+        self.assertEquals(self.plugin.archive.links["sar01"], "sos_commands/sar/sar01")
+        self.assertEquals(self.plugin.executedCommands[0]['file'], "sar/sar01")
+
+
+if __name__ == "__main__":
+    unittest.main()
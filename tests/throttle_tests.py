@@ -0,0 +1,159 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from StringIO import StringIO
+
+from sos.throttle import parse_size, ionice_arguments, load_average, pressure
+from sos.throttle import TokenBucket, Throttle
+from sos.utilities import ThrottledFile, TarFileArchive
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_parse_size(self):
+        self.assertEquals(parse_size("512"), 512)
+        self.assertEquals(parse_size("10k"), 10240)
+        self.assertEquals(parse_size("1.5M"), 1572864)
+        self.assertEquals(parse_size("2GB"), 2 << 30)
+        self.assertEquals(parse_size(""), 0)
+        self.assertRaises(ValueError, parse_size, "fast")
+
+    def test_ionice_arguments(self):
+        self.assertEquals(ionice_arguments("idle"), ["-c", "3"])
+        self.assertEquals(ionice_arguments("best-effort:7"), ["-c", "2", "-n", "7"])
+        self.assertEquals(ionice_arguments("2"), ["-c", "2"])
+        self.assertEquals(ionice_arguments(None), [])
+        self.assertRaises(ValueError, ionice_arguments, "lazy")
+        self.assertRaises(ValueError, ionice_arguments, "idle:9")
+
+
+class LoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_load_average(self):
+        path = os.path.join(self.tmp_dir, "loadavg")
+        open(path, "w").write("3.50 2.00 1.00 2/300 4000\n")
+        self.assertEquals(load_average(path), 3.5)
+        self.assertEquals(load_average(os.path.join(self.tmp_dir, "none")), None)
+
+    def test_pressure(self):
+        open(os.path.join(self.tmp_dir, "io"), "w").write(
+            "some avg10=12.50 avg60=3.00 avg300=1.00 total=100\n"
+            "full avg10=5.00 avg60=1.00 avg300=0.50 total=50\n")
+        self.assertEquals(pressure("io", self.tmp_dir), 12.5)
+        self.assertEquals(pressure("cpu", self.tmp_dir), None)
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_unlimited(self):
+        self.assertEquals(TokenBucket(0).consume(1 << 30), 0)
+
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(1000)
+        self.assertEquals(bucket.consume(1000), 0)
+        start = time.time()
+        wait = bucket.consume(200)
+        self.assertTrue(0.1 < wait <= 0.2)
+        self.assertTrue(time.time() - start >= 0.1)
+
+
+class MockBucket(object):
+
+    def __init__(self):
+        self.consumed = []
+
+    def consume(self, count):
+        self.consumed.append(count)
+        return 0
+
+
+class ThrottleTest(unittest.TestCase):
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, Throttle, compress_cpu=150)
+        self.assertRaises(ValueError, Throttle, ionice="lazy")
+
+    def test_prefix(self):
+        self.assertEquals(Throttle().prefix, [])
+        prefix = Throttle(nice=10).prefix
+        self.assertEquals(os.path.basename(prefix[0]), "nice")
+        self.assertEquals(prefix[1:], ["-n", "10"])
+
+    def test_compress_workers(self):
+        throttle = Throttle()
+        throttle.cpus = 8
+        self.assertEquals(throttle.compress_workers(), 8)
+        throttle.nice = 10
+        self.assertEquals(throttle.compress_workers(), 4)
+        throttle.nice = 19
+        self.assertEquals(throttle.compress_workers(), 1)
+        throttle.nice = 0
+        throttle.compress_cpu = 50
+        self.assertEquals(throttle.compress_workers(), 1)
+
+    def test_not_overloaded_without_limits(self):
+        self.assertFalse(Throttle().overloaded())
+
+    def test_one_at_a_time_when_overloaded(self):
+        throttle = Throttle()
+        throttle.interval = 0.05
+        throttle.overloaded = lambda: True
+        throttle.acquire()
+        self.assertEquals(throttle.running, 1)
+        throttle.release()
+        throttle.acquire()
+        self.assertEquals(throttle.running, 1)
+
+
+
+class ThrottledFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bucket = MockBucket()
+
+    def test_read_in_chunks(self):
+        fp = ThrottledFile(StringIO("x" * 100), self.bucket)
+        fp.chunk_size = 40
+        self.assertEquals(fp.read(), "x" * 100)
+        self.assertEquals(self.bucket.consumed, [40, 40, 20])
+
+    def test_read_size(self):
+        fp = ThrottledFile(StringIO("x" * 100), self.bucket)
+        fp.chunk_size = 40
+        self.assertEquals(fp.read(50), "x" * 50)
+        self.assertEquals(fp.read(80), "x" * 50)
+        self.assertEquals(fp.read(10), "")
+        self.assertEquals(self.bucket.consumed, [40, 10, 40, 10])
+
+    def test_write_in_chunks(self):
+        out = StringIO()
+        fp = ThrottledFile(out, self.bucket)
+        fp.chunk_size = 40
+        fp.write("x" * 100)
+        self.assertEquals(out.getvalue(), "x" * 100)
+        self.assertEquals(self.bucket.consumed, [40, 40, 20])
+
+    def test_archive_writes(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            archive = TarFileArchive(os.path.join(tmp_dir, "test"))
+            archive.limit_writes(self.bucket)
+            archive.add_string("x" * 100000, "big")
+            archive.close()
+            self.assertEquals(sum(self.bucket.consumed),
+                              os.path.getsize(archive.name()))
+            self.assertTrue(max(self.bucket.consumed) <= ThrottledFile.chunk_size)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
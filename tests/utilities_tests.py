@@ -1,8 +1,10 @@
 import os.path
+import tempfile
+import shutil
 import unittest
 from StringIO import StringIO
 
-from sos.utilities import grep, DirTree, checksum, get_hash_name, is_executable, sosGetCommandOutput, find, tail, shell_out
+from sos.utilities import grep, DirTree, checksum, multi_checksum, checksum_files, parallel_map, dag_map, get_hash_name, is_executable, sosGetCommandOutput, run_command, command_argv, TRUNCATED_MARKER, find, tail, shell_out, Obfuscator, pseudo_file_paths, read_pseudo_file, read_pseudo_files, aggregate_pseudo_files, split_pseudo_aggregate
 import sos
 
 TEST_DIR = os.path.dirname(__file__)
@@ -60,6 +62,75 @@ class ChecksumTest(unittest.TestCase):
        name = get_hash_name()
        self.assertTrue(name in ('md5', 'sha256'))
 
+    def test_hash_name_is_cached(self):
+        self.assertEquals(get_hash_name(), get_hash_name())
+
+    def test_multi_checksum(self):
+        digests = multi_checksum(StringIO('this is a test'), ('md5', 'sha256'))
+        self.assertEquals(digests['sha256'],
+                '2e99758548972a8e8822ad47fa1017ff72f06f3ff6a016851f45c398732bc50c')
+        self.assertEquals(digests['md5'], '54b0c58c7ce9f2a8b551351102ee0938')
+
+    def test_small_chunks(self):
+        self.assertEquals(checksum(StringIO('this is a test'), chunk_size=3,
+                algorithm="sha256"),
+                '2e99758548972a8e8822ad47fa1017ff72f06f3ff6a016851f45c398732bc50c')
+
+    def test_checksum_files_keeps_order(self):
+        files = [os.path.join(TEST_DIR, name) for name in
+                 ('tail_test.txt', 'ziptest', 'test_exe.py', 'tail_test.txt')]
+        results = checksum_files(files, algorithm="md5", workers=3)
+        self.assertEquals([name for name, digest in results], files)
+        self.assertEquals(results[0][1], results[3][1])
+        self.assertEquals(results[1][1], checksum(files[1], algorithm="md5"))
+
+    def test_checksum_files_unreadable(self):
+        missing = os.path.join(TEST_DIR, 'missing')
+        results = checksum_files([missing, os.path.join(TEST_DIR, 'ziptest')],
+                                 algorithm="md5")
+        self.assertEquals(results[0], (missing, None))
+        self.assertNotEqual(results[1][1], None)
+
+
+class ParallelMapTest(unittest.TestCase):
+
+    def test_keeps_order(self):
+        self.assertEquals(parallel_map(lambda x: x * 2, range(50), workers=8),
+                [x * 2 for x in range(50)])
+
+    def test_raises(self):
+        def fail(x):
+            raise ValueError(x)
+        self.assertRaises(ValueError, parallel_map, fail, range(5))
+
+
+class DagMapTest(unittest.TestCase):
+
+    def test_dependencies_finish_first(self):
+        finished = []
+        def run(x):
+            finished.append(x)
+            return x * 2
+        depends = {"a": ["c"], "b": ["a", "c"], "d": ["missing"]}
+        results = dag_map(run, ["a", "b", "c", "d"], depends, workers=4)
+        self.assertEquals(results, ["aa", "bb", "cc", "dd"])
+        self.assertTrue(finished.index("c") < finished.index("a") < finished.index("b"))
+
+    def test_serial_order(self):
+        finished = []
+        dag_map(finished.append, ["a", "b", "c"], {"a": ["c"]}, workers=1)
+        self.assertEquals(finished, ["b", "c", "a"])
+
+    def test_cycle_runs_everything_once(self):
+        finished = []
+        dag_map(finished.append, ["a", "b"], {"a": ["b"], "b": ["a"]}, workers=1)
+        self.assertEquals(finished, ["a", "b"])
+
+    def test_raises(self):
+        def fail(x):
+            raise ValueError(x)
+        self.assertRaises(ValueError, dag_map, fail, range(5), {1: [0]})
+
 
 class ExecutableTest(unittest.TestCase):
 
@@ -91,6 +162,94 @@ class ExecutableTest(unittest.TestCase):
         self.assertEquals("executed", shell_out(path))
 
 
+class RunCommandTest(unittest.TestCase):
+
+    def test_argv(self):
+        self.assertEquals(command_argv("/bin/ls -l 'a b'"), ["/bin/ls", "-l", "a b"])
+        self.assertEquals(command_argv("/sbin/lsmod | grep -q nat"), None)
+        self.assertEquals(command_argv("ls /dev/md*"), None)
+        self.assertEquals(command_argv("LANG=C ls"), None)
+
+    def test_direct(self):
+        result = run_command("echo 'a  b'")
+        self.assertEquals(result.status, 0)
+        self.assertEquals(result.output, "a  b")
+        self.assertFalse(result.timed_out)
+        self.assertTrue(result.cpu is not None and result.maxrss > 0)
+
+    def test_shell(self):
+        result = run_command("echo abc | tr a-c x-z; exit 3")
+        self.assertEquals(result.status, 3)
+        self.assertEquals(result.output, "xyz")
+
+    def test_timeout_kills_group(self):
+        result = run_command("sleep 30 | sleep 30", timeout=1)
+        self.assertTrue(result.timed_out)
+        self.assertEquals(result.status, 124)
+        self.assertTrue(result.wall < 10)
+
+    def test_prefix(self):
+        result = run_command("echo abc", prefix=["nice", "-n", "5"])
+        self.assertEquals(result.output, "abc")
+        result = run_command("nice | tr -d 0-4", prefix=["nice", "-n", "5"])
+        self.assertEquals(result.output, "5")
+
+    def test_not_found(self):
+        result = run_command("/nonexistent/command")
+        self.assertEquals(result.status, 127)
+
+    def test_sizelimit_stops_command(self):
+        result = run_command("yes", sizelimit=1000)
+        self.assertTrue(result.truncated)
+        self.assertTrue(result.size > 1000)
+        self.assertTrue(result.output.startswith("y\ny\n"))
+        self.assertTrue(result.output.endswith(TRUNCATED_MARKER % 1000))
+        self.assertEquals(len(result.output), 1000 + len(TRUNCATED_MARKER % 1000))
+
+    def test_under_sizelimit(self):
+        result = run_command("echo abc", sizelimit=1000)
+        self.assertFalse(result.truncated)
+        self.assertEquals((result.output, result.size), ("abc", 4))
+
+
+class PseudoFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_reads_zero_sized_files(self):
+        self.assertEquals(os.stat("/proc/self/status").st_size, 0)
+        self.assertTrue("Pid:" in read_pseudo_file("/proc/self/status"))
+
+    def test_paths(self):
+        os.mkdir(os.path.join(self.tmp_dir, "sub"))
+        for name in ("a", "sub/b", "sub/writeonly"):
+            open(os.path.join(self.tmp_dir, name), "w").close()
+        os.chmod(os.path.join(self.tmp_dir, "sub/writeonly"), 0200)
+        os.symlink(os.path.join(self.tmp_dir, "a"), os.path.join(self.tmp_dir, "link"))
+        paths = [path for path, stats in pseudo_file_paths(self.tmp_dir)]
+        self.assertEquals(sorted(paths), [os.path.join(self.tmp_dir, "a"),
+                                          os.path.join(self.tmp_dir, "sub/b")])
+
+    def test_blocking_read_times_out(self):
+        fifo = os.path.join(self.tmp_dir, "fifo")
+        os.mkfifo(fifo)
+        results = read_pseudo_files([fifo, "/proc/self/status", "/nonexistent"],
+                                    timeout=0.2)
+        # let the abandoned reader finish
+        os.close(os.open(fifo, os.O_WRONLY))
+        self.assertEquals(results[0], None)
+        self.assertTrue("Pid:" in results[1])
+        self.assertEquals(results[2], None)
+
+    def test_aggregate(self):
+        files = [("/proc/a", "one\n\n"), ("/proc/b", ""), ("/sys/c d", "three")]
+        self.assertEquals(split_pseudo_aggregate(aggregate_pseudo_files(files)), files)
+        self.assertEquals(split_pseudo_aggregate(aggregate_pseudo_files([])), [])
+
 class FindTest(unittest.TestCase):
 
     def test_find_leaf(self):
@@ -104,3 +263,57 @@ class FindTest(unittest.TestCase):
     def test_not_in_pattern(self):
         leaves = find("leaf", TEST_DIR, path_pattern="tests/path")
         self.assertFalse(any(name.endswith("leaf") for name in leaves))
+
+
+class ObfuscatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ob = Obfuscator(["web1.example.com"])
+
+    def test_hostnames(self):
+        out = self.ob.obfuscate("web1 web1.example.com WEB1 web10")
+        self.assertFalse("web1 " in out)
+        self.assertFalse("example.com" in out)
+        self.assertTrue(out.endswith(" web10"))
+        first, second, third, fourth = out.split()
+        self.assertEquals(first, third)
+        self.assertNotEqual(first, second)
+
+    def test_addresses_are_stable(self):
+        out = self.ob.obfuscate("inet 192.168.1.10/24 brd 192.168.1.255\n"
+                                "ether 52:54:00:12:34:56 fe80::5054:ff:fe12:3456\n"
+                                "via 192.168.1.10")
+        self.assertFalse("192.168" in out)
+        self.assertFalse("52:54:00" in out)
+        self.assertFalse("fe80" in out)
+        lines = out.splitlines()
+        self.assertEquals(lines[0].split()[1].split("/")[0], lines[2].split()[1])
+
+    def test_addresses_after_colon(self):
+        out = self.ob.obfuscate("inet addr:10.1.2.3  Bcast:10.1.2.255")
+        self.assertFalse("10.1.2" in out)
+        self.assertTrue(out.startswith("inet addr:198."))
+        self.assertTrue("  Bcast:198." in out)
+
+    def test_ipv4_mapped_ipv6(self):
+        plain = self.ob.obfuscate("10.1.2.3")
+        self.assertEquals(self.ob.obfuscate("::ffff:10.1.2.3"), "::ffff:" + plain)
+        self.assertEquals(self.ob.obfuscate("::FFFF:10.1.2.3"), "::FFFF:" + plain)
+
+    def test_netstat(self):
+        out = self.ob.obfuscate("tcp6       0      0 ::ffff:10.1.2.3:8080    "
+                                "::ffff:10.9.9.9:5555    ESTABLISHED\n"
+                                "tcp6       0      0 :::22                   :::*")
+        self.assertFalse("10.1.2.3" in out)
+        self.assertFalse("10.9.9.9" in out)
+        self.assertTrue(":8080 " in out)
+        self.assertTrue(":5555 " in out)
+        self.assertTrue(out.endswith(":::22                   :::*"))
+
+    def test_ignored_values(self):
+        text = "127.0.0.1 ::1 00:00:00:00:00:00 2.6.32.358 12:30:45 std::string"
+        self.assertEquals(text, self.ob.obfuscate(text))
+
+    def test_mapping(self):
+        out = self.ob.obfuscate("10.1.2.3")
+        self.assertEquals(("ipv4", out), self.ob.mapping["10.1.2.3"])
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from sos.watchdog import Watchdog, stuck_processes, unresponsive_mounts
+
+STAT = "%d (%s) %s 1 1 1 0 -1 4194560 0 0 0 0 10 5 0 0 20 0 1 0 100 1000000 50"
+
+
+class StuckProcessesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.proc = tempfile.mkdtemp()
+        for pid, comm, state in [(1, "init", "S"), (30, "df", "D")]:
+            os.makedirs(os.path.join(self.proc, str(pid)))
+            open(os.path.join(self.proc, str(pid), "stat"), "w").write(
+                    STAT % (pid, comm, state))
+
+    def tearDown(self):
+        shutil.rmtree(self.proc)
+
+    def test_stuck(self):
+        self.assertEquals(stuck_processes(self.proc, settle=0), [(30, "df")])
+
+    def test_missing_proc(self):
+        self.assertEquals(stuck_processes(os.path.join(self.proc, "none")), [])
+
+
+class WatchdogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.watchdog = Watchdog()
+        self.watchdog.hung = ["/mnt/filer"]
+
+    def test_responding_mount(self):
+        self.assertEquals(unresponsive_mounts([tempfile.gettempdir()], 5), [])
+
+    def test_is_hung(self):
+        self.assertTrue(self.watchdog.is_hung("/mnt/filer"))
+        self.assertTrue(self.watchdog.is_hung("/mnt/filer/home/user"))
+        self.assertFalse(self.watchdog.is_hung("/mnt/filer2"))
+        self.assertFalse(self.watchdog.is_hung("/etc/fstab"))
+
+    def test_touches(self):
+        self.assertTrue(self.watchdog.touches("/bin/ls -l '/mnt/filer/data'"))
+        self.assertFalse(self.watchdog.touches("/bin/ls -l /mnt"))
+
+    def test_walks_mounts(self):
+        self.assertTrue(self.watchdog.walks_mounts("/bin/df -al"))
+        self.assertFalse(self.watchdog.walks_mounts("/bin/mount -l"))
+
+    def test_guard(self):
+        self.assertEquals(self.watchdog.guard("/bin/ls /mnt/filer/data", 300), None)
+        self.assertEquals(self.watchdog.guard("/bin/df -al", 300),
+                          self.watchdog.walker_timeout)
+        self.assertEquals(self.watchdog.guard("/bin/mount -l", 300), 300)
+        self.watchdog.hung = []
+        self.assertEquals(self.watchdog.guard("/bin/ls /mnt/filer/data", 300), 300)
+
+    def test_check_without_timeout(self):
+        # the mounts are not probed but processes are still looked at
+        watchdog = Watchdog(timeout=0)
+        self.assertFalse(watchdog.checked)
+        watchdog.check([("filer:/vol", "/mnt/filer", "nfs", "rw")])
+        self.assertTrue(watchdog.checked)
+        self.assertEquals(watchdog.hung, [])
+
+
+if __name__ == "__main__":
+    unittest.main()